@@ -0,0 +1,310 @@
+"""
+Windowed forced alignment for long recordings.
+Instead of computing emissions for the whole waveform and aligning the whole
+transcript in one pass, the transcript is split at the segment boundaries
+Whisper returns and every segment (or group of segments) is aligned against
+its own time window. Memory is bounded by the window batch, not by the file
+length.
+"""
+import logging
+import math
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator, Sequence
+
+import torch
+from ctc_forced_aligner import (
+    generate_emissions,
+    get_alignments,
+    get_spans,
+    postprocess_results,
+    preprocess_text,
+)
+
+from audio_buffer import AudioBuffer
+
+SAMPLING_RATE = 16000
+# Longest window aligned in one piece, matches generate_emissions' window_length
+WINDOW_SECONDS = 30
+# Audio generate_emissions adds around each frame, matches its context_length
+CONTEXT_SECONDS = 2
+# Audio added around each window to absorb errors in Whisper's timestamps
+WINDOW_PADDING_SECONDS = 0.5
+# Extra audio around a window whose text didn't fit its span
+FALLBACK_PADDING_SECONDS = 5.0
+# Threads running the Viterbi alignment of finished windows
+ALIGNMENT_WORKERS = 4
+
+
+@dataclass
+class TranscriptSegment:
+    """A transcribed span of audio, times in seconds."""
+
+    start: float
+    end: float
+    text: str
+
+    @classmethod
+    def from_whisper(cls, segments) -> list["TranscriptSegment"]:
+        """Keep the timing and text of faster-whisper segments."""
+        return list(cls.iter_whisper(segments))
+
+    @classmethod
+    def iter_whisper(cls, segments) -> Iterator["TranscriptSegment"]:
+        """Convert faster-whisper segments one by one as they are decoded."""
+        for segment in segments:
+            yield cls(segment.start, segment.end, segment.text)
+
+
+@dataclass
+class AlignmentWindow:
+    """Transcript text and the span of audio it is aligned against, in seconds."""
+
+    start: float
+    end: float
+    text: str
+
+
+def build_windows(
+    segments: Sequence[TranscriptSegment],
+    duration: float,
+    max_window_seconds: float = WINDOW_SECONDS,
+    padding_seconds: float = WINDOW_PADDING_SECONDS,
+) -> list[AlignmentWindow]:
+    """
+    Group consecutive transcript segments into alignment windows.
+
+    Args:
+        segments: Transcript segments in chronological order
+        duration: Length of the audio in seconds
+        max_window_seconds: Segments are grouped while the padded window
+            stays within this length; a longer segment gets its own window.
+            0 gives every segment its own window.
+        padding_seconds: Audio added before and after each window
+    """
+    windows = []
+    group: list[TranscriptSegment] = []
+    for segment in segments:
+        if group and (
+            segment.end - group[0].start + 2 * padding_seconds > max_window_seconds
+        ):
+            windows.append(_window(group, duration, padding_seconds))
+            group = []
+        group.append(segment)
+    if group:
+        windows.append(_window(group, duration, padding_seconds))
+    return windows
+
+
+def _window(
+    group: list[TranscriptSegment], duration: float, padding_seconds: float
+) -> AlignmentWindow:
+    return AlignmentWindow(
+        start=max(group[0].start - padding_seconds, 0.0),
+        end=min(group[-1].end + padding_seconds, duration),
+        text="".join(segment.text for segment in group),
+    )
+
+
+def window_emissions(
+    alignment_model,
+    waveforms: list[torch.Tensor],
+    batch_size: int = 4,
+) -> tuple[list[torch.Tensor], int]:
+    """
+    Emissions of several short waveforms from batched model calls.
+
+    The waveforms are packed into generate_emissions' fixed WINDOW_SECONDS
+    frames, separated by CONTEXT_SECONDS of silence. A waveform that doesn't
+    fit in the rest of a frame starts the next one, so no waveform straddles
+    two frames and short segments don't each pay for a whole frame. The
+    silence keeps a waveform out of the frame context and the convolutional
+    receptive field of its neighbours, so their audio doesn't move its word
+    boundaries.
+
+    Returns:
+        Emissions per waveform and the stride in ms per emission frame
+    """
+    window = WINDOW_SECONDS * SAMPLING_RATE
+    gap = CONTEXT_SECONDS * SAMPLING_RATE
+    pieces, offsets = [], []
+    position = 0
+    for waveform in waveforms:
+        # generate_emissions pads the start of the audio itself
+        lead = gap if position else 0
+        free = -position % window
+        if lead + len(waveform) > free and free:
+            pieces.append(waveform.new_zeros(free))
+            position += free
+        if lead:
+            pieces.append(waveform.new_zeros(lead))
+            position += lead
+        offsets.append(position)
+        pieces.append(waveform)
+        position += len(waveform)
+    if position % window:
+        pieces.append(waveforms[-1].new_zeros(-position % window))
+        position += -position % window
+
+    emissions, stride = generate_emissions(
+        alignment_model, torch.cat(pieces), batch_size=batch_size
+    )
+
+    frames_per_sample = emissions.size(0) / position
+    results = [
+        emissions[
+            round(offset * frames_per_sample) : round(offset * frames_per_sample)
+            + math.ceil(len(waveform) * frames_per_sample)
+        ]
+        for waveform, offset in zip(waveforms, offsets)
+    ]
+    return results, stride
+
+
+def align_window(
+    window: AlignmentWindow,
+    emissions: torch.Tensor,
+    stride: int,
+    alignment_tokenizer,
+    language: str,
+) -> list[dict]:
+    """Align a window's text against its emissions, times relative to the audio."""
+    tokens_starred, text_starred = preprocess_text(
+        window.text, romanize=True, language=language
+    )
+    segments, scores, blank_token = get_alignments(
+        emissions, tokens_starred, alignment_tokenizer
+    )
+    spans = get_spans(tokens_starred, segments, blank_token)
+    words = postprocess_results(text_starred, spans, stride, scores)
+    for word in words:
+        word["start"] += window.start
+        word["end"] += window.start
+    return words
+
+
+def iter_windowed_alignment(
+    alignment_model,
+    alignment_tokenizer,
+    audio: AudioBuffer,
+    windows: list[AlignmentWindow],
+    language: str,
+    batch_size: int = 4,
+    workers: int = ALIGNMENT_WORKERS,
+) -> Iterator[dict]:
+    """
+    Align each window's text against its own span of audio.
+
+    Emissions are computed `batch_size` windows at a time, and the
+    alignment of each window runs on a thread pool while the model works
+    on the next batch. Words are yielded in order as windows finish, so
+    only a couple of batches of audio and emissions are held at once.
+    A window whose text can't be aligned in its span is retried once with
+    FALLBACK_PADDING_SECONDS of extra audio on both sides, and an empty
+    span, e.g. of a segment timed past the end of the audio, is moved into
+    the audio first.
+
+    Args:
+        alignment_model: Model from ctc_forced_aligner.load_alignment_model
+        alignment_tokenizer: Its tokenizer
+        audio: Decoded audio
+        windows: Windows from build_windows
+        language: ISO 639-3 code of the transcript
+        batch_size: Windows per model call
+        workers: Alignment threads
+
+    Yields:
+        Word dicts as returned by postprocess_results, with times in seconds
+        relative to the start of the audio
+    """
+    batch_size = max(batch_size, 1)
+    windows = [
+        _nonempty_span(window, audio.duration)
+        for window in windows
+        if window.text.strip()
+    ]
+    windows = [window for window in windows if window is not None]
+
+    def emissions_for(batch: list[AlignmentWindow]):
+        samples = audio.tensor()
+        waveforms = [
+            samples[
+                int(window.start * audio.sample_rate) : int(
+                    window.end * audio.sample_rate
+                )
+            ].to(alignment_model.device, alignment_model.dtype)
+            for window in batch
+        ]
+        return window_emissions(alignment_model, waveforms, batch_size)
+
+    def retry_wider(window: AlignmentWindow) -> list[dict]:
+        wider = AlignmentWindow(
+            start=max(window.start - FALLBACK_PADDING_SECONDS, 0.0),
+            end=min(window.end + FALLBACK_PADDING_SECONDS, audio.duration),
+            text=window.text,
+        )
+        (emissions,), stride = emissions_for([wider])
+        return align_window(wider, emissions, stride, alignment_tokenizer, language)
+
+    in_flight: deque[tuple[AlignmentWindow, Future]] = deque()
+    with ThreadPoolExecutor(
+        max_workers=max(workers, 1), thread_name_prefix="align"
+    ) as pool:
+        for i in range(0, len(windows), batch_size):
+            batch = windows[i : i + batch_size]
+            emissions, stride = emissions_for(batch)
+            for window, window_emissions_ in zip(batch, emissions):
+                in_flight.append(
+                    (
+                        window,
+                        pool.submit(
+                            align_window,
+                            window,
+                            window_emissions_,
+                            stride,
+                            alignment_tokenizer,
+                            language,
+                        ),
+                    )
+                )
+            del emissions
+
+            # keep at most one batch aligning behind the model
+            while len(in_flight) > batch_size:
+                yield from _collect(*in_flight.popleft(), retry_wider)
+
+        while in_flight:
+            yield from _collect(*in_flight.popleft(), retry_wider)
+
+
+def _nonempty_span(window: AlignmentWindow, duration: float) -> AlignmentWindow | None:
+    """
+    The window, or for an empty span the last FALLBACK_PADDING_SECONDS of
+    the audio before its end, so its words still get timestamps.
+    """
+    if window.end > window.start:
+        return window
+    end = min(max(window.end, window.start), duration)
+    start = max(end - FALLBACK_PADDING_SECONDS, 0.0)
+    if end <= start:
+        logging.warning(
+            f"Skipping alignment of {window.text.strip()!r}, the audio is empty"
+        )
+        return None
+    logging.warning(
+        f"Alignment window {window.start:.2f}-{window.end:.2f}s is empty, "
+        f"aligning its text against {start:.2f}-{end:.2f}s instead"
+    )
+    return AlignmentWindow(start=start, end=end, text=window.text)
+
+
+def _collect(window: AlignmentWindow, future: Future, retry_wider) -> list[dict]:
+    try:
+        return future.result()
+    except Exception:
+        logging.warning(
+            f"Alignment of {window.start:.2f}-{window.end:.2f}s failed, "
+            "retrying with a wider window"
+        )
+        return retry_wider(window)
@@ -2,21 +2,51 @@
 FastAPI server for whisper-diarization.
 Provides async job queue for processing audio files.
 """
+import asyncio
+import json
+import logging
 import os
 import shutil
 import threading
 import time
-from dataclasses import dataclass, field
-from datetime import datetime
-from enum import Enum
-from queue import Queue
+from datetime import datetime, timedelta
 from typing import Literal
 from uuid import uuid4
 
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile
-from fastapi.responses import JSONResponse
+import faster_whisper
+import torch
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-from diarize_core import run_diarization
+from artifact_cache import ArtifactCache
+from audio_buffer import probe_duration
+from diarize_core import (
+    ALIGNMENT_MODES,
+    MTYPES,
+    PIPELINE_STAGES,
+    DiarizationJob,
+    pipeline_model_keys,
+    run_diarization,
+)
+from fair_queue import FairQueue, ThroughputEstimate
+from helpers import process_language_arg
+from instrumentation import PipelineMetrics, StageTiming, job_timing_record
+from job_events import JobEventLog, format_sse
+from job_store import Job, JobStatus, create_job_store
+from model_pool import ModelPool, estimate_whisper_size_mb
+from result_cache import ResultCache, result_cache_key
+from scheduler import (
+    DEFAULT_DURATION_SECONDS,
+    JobScheduler,
+    SystemMemoryProbe,
+    estimate_stage_memory,
+)
+from staged_executor import Stage, StagedExecutor
+from streaming import StreamingSession, decode_pcm
+from uploads import MalformedUpload, UploadTooLarge, receive_upload
+from whisper_batching import WhisperBatcher
+from worker_pool import WorkerCrashed, WorkerPool, WorkerSettings
 
 app = FastAPI(
     title="Whisper Diarization API",
@@ -24,164 +54,836 @@ app = FastAPI(
     version="1.0.0",
 )
 
-# Job storage and queue
-jobs: dict[str, "Job"] = {}
-job_queue: Queue[str] = Queue()
-jobs_lock = threading.Lock()
-
 # Config
-UPLOAD_DIR = "/tmp/diarization_uploads"
-JOB_EXPIRY_SECONDS = 3600  # 1 hour
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "/tmp/diarization_uploads")
+JOB_EXPIRY_SECONDS = int(os.environ.get("JOB_EXPIRY_SECONDS", "3600"))  # 1 hour
+CLEANUP_INTERVAL_SECONDS = 60
+MAX_UPLOAD_MB = float(os.environ.get("MAX_UPLOAD_MB", "0"))  # 0 = unlimited
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join(UPLOAD_DIR, "results"))
+RESULT_CACHE_MAX_MB = float(os.environ.get("RESULT_CACHE_MAX_MB", "1024"))  # 0 = disabled
+ARTIFACT_CACHE_DIR = os.environ.get(
+    "ARTIFACT_CACHE_DIR", os.path.join(UPLOAD_DIR, "artifacts")
+)
+ARTIFACT_CACHE_MAX_MB = float(os.environ.get("ARTIFACT_CACHE_MAX_MB", "2048"))  # 0 = disabled
+# "memory" or "sqlite", sqlite keeps jobs across restarts
+JOB_STORE = os.environ.get("JOB_STORE", "memory")
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", os.path.join(UPLOAD_DIR, "jobs.db"))
+MODEL_POOL_MAX_MODELS = int(os.environ.get("MODEL_POOL_MAX_MODELS", "4"))
+MODEL_POOL_MEMORY_BUDGET_MB = float(os.environ.get("MODEL_POOL_MEMORY_BUDGET_MB", "0"))
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", "4"))
+MEMORY_BUDGET_FRACTION = float(os.environ.get("MEMORY_BUDGET_FRACTION", "0.9"))
+CPU_MEMORY_BUDGET_MB = float(os.environ.get("CPU_MEMORY_BUDGET_MB", "0"))
+GPU_MEMORY_BUDGET_MB = float(os.environ.get("GPU_MEMORY_BUDGET_MB", "0"))
+# "concurrent" runs whole jobs side by side, "pipelined" runs every stage
+# on its own workers so consecutive jobs overlap like an assembly line,
+# "processes" runs whole jobs in child processes that may crash safely
+EXECUTION_MODE = os.environ.get("EXECUTION_MODE", "concurrent")
+STAGE_WORKERS = os.environ.get("STAGE_WORKERS", "")  # e.g. "transcribing=2,aligning=1"
+STAGE_QUEUE_SIZE = int(os.environ.get("STAGE_QUEUE_SIZE", "2"))
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", "1"))
+WORKER_MAX_JOBS = int(os.environ.get("WORKER_MAX_JOBS", "100"))  # 0 = never recycle
+WORKER_MAX_RSS_MB = float(os.environ.get("WORKER_MAX_RSS_MB", "0"))  # 0 = unlimited
+# Times a job is queued again after its worker process crashed
+WORKER_CRASH_RETRIES = int(os.environ.get("WORKER_CRASH_RETRIES", "1"))
+# Seconds a cancelled job may take to stop before its worker process is terminated
+CANCEL_GRACE_SECONDS = float(os.environ.get("CANCEL_GRACE_SECONDS", "30"))
+# Whisper chunks of concurrent jobs decoded together (0 disables)
+WHISPER_CROSS_JOB_BATCH = int(os.environ.get("WHISPER_CROSS_JOB_BATCH", "16"))
+WHISPER_BATCH_WAIT_MS = float(os.environ.get("WHISPER_BATCH_WAIT_MS", "50"))
+# Default Whisper model of live streams, small models keep up in real time
+STREAM_WHISPER_MODEL = os.environ.get("STREAM_WHISPER_MODEL", "small.en")
+# Round robin weights of client keys, e.g. "batch-importer=1,web=4" (default 1)
+CLIENT_WEIGHTS = os.environ.get("CLIENT_WEIGHTS", "")
+# Serve each client's shortest queued recording first
+SHORTEST_JOB_FIRST = os.environ.get("SHORTEST_JOB_FIRST", "false").lower() == "true"
+# Default for the parallel_diarization job option
+PARALLEL_DIARIZATION = os.environ.get("PARALLEL_DIARIZATION", "false").lower() == "true"
+# JSON lines file the timing record of every finished job is appended to (empty disables)
+TIMINGS_LOG = os.environ.get("TIMINGS_LOG", "")
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 
-class JobStatus(str, Enum):
-    QUEUED = "queued"
-    PROCESSING = "processing"
-    COMPLETED = "completed"
-    FAILED = "failed"
+def parse_counts(spec: str) -> dict[str, int]:
+    """Parse "name=count,..." into a dict."""
+    counts = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, count = item.partition("=")
+        counts[name.strip()] = int(count)
+    return counts
+
 
+# Job storage and queue
+job_store = create_job_store(JOB_STORE, JOB_STORE_PATH)
+job_queue = FairQueue(parse_counts(CLIENT_WEIGHTS), shortest_first=SHORTEST_JOB_FIRST)
+last_cleanup = time.monotonic()
+upload_stats = {"uploads": 0, "bytes": 0, "rejected": 0}
+
+# Finished results by audio hash and options
+result_cache = (
+    ResultCache(RESULT_CACHE_DIR, int(RESULT_CACHE_MAX_MB * 2**20))
+    if RESULT_CACHE_MAX_MB
+    else None
+)
+
+# Stage outputs by audio hash and stage parameters, for partial reruns
+artifact_cache = (
+    ArtifactCache(
+        ARTIFACT_CACHE_DIR,
+        int(ARTIFACT_CACHE_MAX_MB * 2**20),
+        # worker processes write to the same directory
+        shared=EXECUTION_MODE == "processes",
+    )
+    if ARTIFACT_CACHE_MAX_MB
+    else None
+)
 
-@dataclass
-class Job:
-    id: str
-    status: JobStatus
-    audio_path: str
-    options: dict
-    created_at: datetime = field(default_factory=datetime.now)
-    progress: str | None = None
-    result: dict | None = None
-    error: str | None = None
+# Partial results of queued and running jobs, dropped when the job finishes
+event_logs_lock = threading.Lock()
+event_logs: dict[str, JobEventLog] = {}
 
+# Identical jobs that are queued or running at the same time share one
+# computation, the first one runs and the others follow its outcome
+inflight_lock = threading.Lock()
+inflight: dict[str, str] = {}  # cache key -> leading job id
+followers: dict[str, list[str]] = {}  # leading job id -> following job ids
 
-def get_queue_position(job_id: str) -> int:
-    """Get position in queue (0 = next to process)."""
-    with jobs_lock:
-        queued_jobs = [
-            jid for jid, j in jobs.items()
-            if j.status == JobStatus.QUEUED
+# Models stay loaded between jobs (0 disables a limit)
+model_pool = ModelPool(
+    max_models=MODEL_POOL_MAX_MODELS or None,
+    memory_budget_mb=MODEL_POOL_MEMORY_BUDGET_MB or None,
+)
+
+# Merges the Whisper forward passes of jobs sharing a pooled model
+whisper_batcher = (
+    WhisperBatcher(WHISPER_CROSS_JOB_BATCH, WHISPER_BATCH_WAIT_MS / 1000)
+    if WHISPER_CROSS_JOB_BATCH
+    else None
+)
+
+# Admits several jobs at once while their estimated memory fits
+# (budgets of 0 default to MEMORY_BUDGET_FRACTION of the total memory)
+scheduler = JobScheduler(
+    max_concurrent=MAX_CONCURRENT_JOBS,
+    budgets_mb={
+        device: budget
+        for device, budget in (
+            ("cpu", CPU_MEMORY_BUDGET_MB),
+            ("cuda", GPU_MEMORY_BUDGET_MB),
+        )
+        if budget
+    },
+    budget_fraction=MEMORY_BUDGET_FRACTION,
+)
+
+
+# Assembly-line executor, each stage keeps its own model resident
+pipeline_executor: StagedExecutor | None = None
+if EXECUTION_MODE == "pipelined":
+    stage_workers = parse_counts(STAGE_WORKERS)
+    pipeline_executor = StagedExecutor(
+        [
+            Stage(
+                name=name,
+                fn=run_stage,
+                workers=stage_workers.get(name, 1),
+                queue_size=STAGE_QUEUE_SIZE,
+                model_pool=ModelPool(max_models=1),
+            )
+            for name, run_stage in PIPELINE_STAGES
         ]
-        if job_id in queued_jobs:
-            return queued_jobs.index(job_id)
-        return -1
+    )
+
+
+# Child processes running whole jobs, each with its own warm models
+worker_pool: WorkerPool | None = None
+if EXECUTION_MODE == "processes":
+    worker_pool = WorkerPool(
+        WORKER_PROCESSES,
+        WorkerSettings(
+            model_pool_max_models=MODEL_POOL_MAX_MODELS or None,
+            model_pool_memory_budget_mb=MODEL_POOL_MEMORY_BUDGET_MB or None,
+            artifact_cache_dir=ARTIFACT_CACHE_DIR if artifact_cache else None,
+            artifact_cache_max_bytes=int(ARTIFACT_CACHE_MAX_MB * 2**20),
+        ),
+        max_jobs=WORKER_MAX_JOBS,
+        max_rss_mb=WORKER_MAX_RSS_MB,
+    )
+crash_counts: dict[str, int] = {}  # job id -> worker crashes while running it
+
+# Cancel events of running computations, set when their last job is deleted
+cancel_events: dict[str, threading.Event] = {}
+
+
+# Measured job throughput, for estimated start times of queued jobs
+throughput = ThroughputEstimate(
+    workers=(
+        WORKER_PROCESSES
+        if worker_pool is not None
+        else 1 if pipeline_executor is not None else MAX_CONCURRENT_JOBS
+    ),
+    default_duration_s=DEFAULT_DURATION_SECONDS,
+)
+# Start estimates of all queued jobs, recomputed when the queue or the
+# measured real-time factor changes, or after ESTIMATE_CACHE_SECONDS
+ESTIMATE_CACHE_SECONDS = 5.0
+start_estimates: dict = {"key": None, "at": 0.0, "starts": None}
+start_estimates_lock = threading.Lock()
+
+# Stage timings of running jobs and the metrics aggregated over all jobs
+metrics = PipelineMetrics()
+job_timings: dict[str, list[StageTiming]] = {}
+timings_log_lock = threading.Lock()
+memory_probe = SystemMemoryProbe()
+
+
+def queue_info(job_id: str) -> dict:
+    """Queue position and estimated seconds until a queued job starts."""
+    order = job_queue.dispatch_order()
+    position = order.positions.get(job_id)
+    if position is None:
+        return {"position": -1, "estimated_start_seconds": None}
+
+    key = (order.version, throughput.rtf)
+    with start_estimates_lock:
+        if (
+            start_estimates["key"] != key
+            or time.monotonic() - start_estimates["at"] > ESTIMATE_CACHE_SECONDS
+        ):
+            start_estimates.update(
+                key=key,
+                at=time.monotonic(),
+                starts=throughput.start_times(order.durations),
+            )
+        starts = start_estimates["starts"]
+    return {
+        "position": position,
+        "estimated_start_seconds": starts[position] if starts is not None else None,
+    }
+
+
+def enqueue(job: Job):
+    job_queue.put(
+        job.id, client=job.client_id, priority=job.priority, duration_s=job.duration_s
+    )
 
 
 def cleanup_old_jobs():
-    """Remove jobs older than JOB_EXPIRY_SECONDS."""
-    now = datetime.now()
-    with jobs_lock:
-        expired = [
-            jid for jid, j in jobs.items()
-            if (now - j.created_at).total_seconds() > JOB_EXPIRY_SECONDS
-            and j.status in (JobStatus.COMPLETED, JobStatus.FAILED)
-        ]
-        for jid in expired:
-            job = jobs.pop(jid)
-            if os.path.exists(job.audio_path):
-                os.remove(job.audio_path)
+    """Remove finished jobs older than JOB_EXPIRY_SECONDS."""
+    expired = job_store.pop_expired(
+        datetime.now() - timedelta(seconds=JOB_EXPIRY_SECONDS)
+    )
+    for job in expired:
+        if os.path.exists(job.audio_path):
+            os.remove(job.audio_path)
+
+
+def estimate_job_memory(job: Job) -> dict[str, dict[str, float]]:
+    """Per-stage memory estimate of a job, skipping models already resident."""
+    model_name = job.options["model_name"]
+    resident_stages = {
+        stage
+        for stage, key in pipeline_model_keys(model_name, DEVICE).items()
+        if model_pool.is_resident(*key)
+    }
+    return estimate_stage_memory(
+        job.options,
+        DEVICE,
+        duration_s=job.duration_s,
+        whisper_model_mb=estimate_whisper_size_mb(model_name, MTYPES[DEVICE]),
+        resident_stages=resident_stages,
+    )
+
+
+def open_event_log(job_id: str, shared_with: str | None = None):
+    """Start collecting partial results, a following job shares its leader's."""
+    with event_logs_lock:
+        log = event_logs.get(shared_with) if shared_with else None
+        event_logs[job_id] = log or JobEventLog()
+
+
+def publish_event(job_id: str, event: str, data: dict):
+    with event_logs_lock:
+        log = event_logs.get(job_id)
+    if log is not None:
+        log.publish(event, data)
+
+
+def close_event_logs(job_ids: list[str], event: str, data: dict):
+    """Publish the final event of jobs and stop collecting their results."""
+    with event_logs_lock:
+        logs = {id(log): log for jid in job_ids if (log := event_logs.pop(jid, None))}
+        # a log shared with a job that keeps running stays open
+        for log in event_logs.values():
+            logs.pop(id(log), None)
+    for log in logs.values():
+        log.publish(event, data)
+        log.close()
+
+
+def make_event_callback(job_id: str):
+    def event_callback(event: str, data: dict):
+        publish_event(job_id, event, data)
+
+    return event_callback
+
+
+def job_cache_key(job: Job) -> str | None:
+    if job.audio_sha256 is None:
+        return None
+    return result_cache_key(job.audio_sha256, job.options)
+
+
+def claim_computation(job: Job) -> str | None:
+    """
+    Make the job lead the computation of its result, or follow the job
+    already computing it. Returns the id of the leading job it follows.
+    """
+    key = job_cache_key(job)
+    if key is None:
+        return None
+    with inflight_lock:
+        leader = inflight.get(key)
+        if leader is not None and leader != job.id:
+            followers[leader].append(job.id)
+            return leader
+        inflight[key] = job.id
+        followers.setdefault(job.id, [])
+        return None
+
+
+def release_computation(job: Job) -> str | None:
+    """
+    Hand the computation of a deleted job over to its first follower.
+    Returns the id of the follower queued in its place.
+    """
+    key = job_cache_key(job)
+    with inflight_lock:
+        job_followers = followers.pop(job.id, None)
+        if job_followers is None:
+            for others in followers.values():
+                if job.id in others:
+                    others.remove(job.id)
+                    break
+            return None
+        if key is not None and inflight.get(key) == job.id:
+            del inflight[key]
+        if not job_followers:
+            return None
+        new_leader, *rest = job_followers
+        followers[new_leader] = rest
+        if key is not None:
+            inflight[key] = new_leader
+    leader = job_store.get(new_leader, include_result=False)
+    if leader is not None:
+        enqueue(leader)
+    return new_leader
+
+
+def detach_running_job(job: Job) -> str | None:
+    """
+    Take a deleted processing job off the computation it leads or follows.
+    Returns the id of the computation's leading job once no remaining job
+    waits for its result, so it can be cancelled.
+    """
+    with inflight_lock:
+        if job.id in followers or job.id in cancel_events:
+            leader_id = job.id
+        else:
+            leader_id = next(
+                (leader for leader, others in followers.items() if job.id in others),
+                None,
+            )
+            if leader_id is None:
+                return None
+            followers[leader_id].remove(job.id)
+        if followers.get(leader_id) or (
+            job_store.get(leader_id, include_result=False) is not None
+        ):
+            # the computation keeps running for the jobs still waiting on it
+            return None
+        key = job_cache_key(job)
+        if key is not None and inflight.get(key) == leader_id:
+            del inflight[key]
+        return leader_id
+
+
+def cancel_job(job_id: str):
+    """Stop a running computation at its next cancellation check."""
+    event = cancel_events.get(job_id)
+    if event is None:
+        return
+    event.set()
+    if worker_pool is not None:
+        worker_pool.cancel(job_id, grace_s=CANCEL_GRACE_SECONDS)
+
+
+def make_timing_callback(job_id: str):
+    def timing_callback(timing: StageTiming):
+        job_timings.setdefault(job_id, []).append(timing)
+        metrics.observe_stage(timing)
+
+    return timing_callback
+
+
+def record_timings(job: Job, job_ids: list[str], status: str) -> dict:
+    """Store the timing record of a finished computation with its jobs."""
+    record = job_timing_record(job_timings.pop(job.id, []), job.duration_s)
+    metrics.observe_job(status, record)
+    for jid in job_ids:
+        job_store.update(jid, timings=record)
+    if TIMINGS_LOG:
+        line = json.dumps({"job_id": job.id, "status": status, **record})
+        try:
+            with timings_log_lock, open(TIMINGS_LOG, "a") as f:
+                f.write(line + "\n")
+        except OSError:
+            logging.exception("Could not write the timings of job %s", job.id)
+    return record
+
+
+def get_followers(job_id: str) -> list[str]:
+    with inflight_lock:
+        return list(followers.get(job_id, ()))
+
+
+def update_with_followers(job_id: str, **changes):
+    """Apply a change to a job and every job following it."""
+    for jid in [job_id, *get_followers(job_id)]:
+        job_store.update(jid, **changes)
+
+
+def start_job(job_id: str) -> Job | None:
+    """Mark a queued job as processing, None if it was deleted meanwhile."""
+    job = job_store.get(job_id, include_result=False)
+    # registered first, so a delete that sees the job processing can cancel it
+    cancel_events[job_id] = threading.Event()
+    if job is None or not job_store.update(
+        job_id, expected=[JobStatus.QUEUED], status=JobStatus.PROCESSING
+    ):
+        cancel_events.pop(job_id, None)
+        return None
+    for jid in get_followers(job_id):
+        job_store.update(jid, status=JobStatus.PROCESSING)
+    throughput.started(job_id, job.duration_s)
+    return job
+
+
+def finish_job(job: Job, result: dict | None, error: Exception | None):
+    """
+    Store the outcome of a job and its followers and clean up their uploads.
+    The job may have been deleted while it ran, its followers still get the result.
+    """
+    global last_cleanup
+
+    job_id = job.id
+    key = job_cache_key(job)
+    if error is None and result_cache is not None and key is not None:
+        try:
+            result_cache.put(key, result)
+        except Exception:
+            logging.exception("Could not cache the result of job %s", job_id)
+
+    with inflight_lock:
+        if key is not None and inflight.get(key) == job_id:
+            del inflight[key]
+        job_followers = followers.pop(job_id, [])
+
+    crash_counts.pop(job_id, None)
+    cancel_event = cancel_events.pop(job_id, None)
+    if error is None:
+        status = "completed"
+    elif cancel_event is not None and cancel_event.is_set():
+        # stopped by a delete, however the worker reported it
+        status = "cancelled"
+    else:
+        status = "failed"
+    throughput.finished(job_id, status)
+    record_timings(job, [job_id, *job_followers], status)
+    for jid in [job_id, *job_followers]:
+        if error is None:
+            job_store.update(jid, result=result, status=JobStatus.COMPLETED)
+        else:
+            job_store.update(jid, error=str(error), status=JobStatus.FAILED)
+    if error is None:
+        close_event_logs([job_id, *job_followers], "completed", {"result": result})
+    else:
+        close_event_logs([job_id, *job_followers], "failed", {"error": str(error)})
+
+    # Clean up audio files
+    for jid in job_followers:
+        follower = job_store.get(jid, include_result=False)
+        if follower is not None and os.path.exists(follower.audio_path):
+            os.remove(follower.audio_path)
+    if os.path.exists(job.audio_path):
+        os.remove(job.audio_path)
+
+    # Periodically cleanup old jobs
+    if time.monotonic() - last_cleanup > CLEANUP_INTERVAL_SECONDS:
+        last_cleanup = time.monotonic()
+        cleanup_old_jobs()
+
+
+def make_progress_callback(job_id: str):
+    def progress_callback(stage: str):
+        scheduler.advance(job_id, stage)
+        update_with_followers(job_id, progress=stage)
+        publish_event(job_id, "progress", {"stage": stage})
+
+    return progress_callback
+
+
+def process_job(job_id: str):
+    """Run an admitted job and release its memory reservation when done."""
+    job = start_job(job_id)
+    if job is None:
+        # deleted while waiting for memory
+        scheduler.release(job_id)
+        return
+
+    result, error = None, None
+    try:
+        result = run_diarization(
+            audio_path=job.audio_path,
+            progress_callback=make_progress_callback(job_id),
+            event_callback=make_event_callback(job_id),
+            model_pool=model_pool,
+            artifact_cache=artifact_cache,
+            audio_sha256=job.audio_sha256,
+            whisper_batcher=whisper_batcher,
+            cancel_event=cancel_events.get(job_id),
+            timing_callback=make_timing_callback(job_id),
+            **job.options,
+        )
+    except Exception as e:
+        error = e
+    finally:
+        scheduler.release(job_id)
+
+    finish_job(job, result, error)
+
+
+def submit_pipelined(job_id: str):
+    """Hand a job to the assembly line, blocking while its first stage is full."""
+    job = start_job(job_id)
+    if job is None:
+        return
+
+    try:
+        state = DiarizationJob(
+            audio_path=job.audio_path,
+            progress_callback=make_progress_callback(job_id),
+            event_callback=make_event_callback(job_id),
+            artifact_cache=artifact_cache,
+            audio_sha256=job.audio_sha256,
+            whisper_batcher=whisper_batcher,
+            cancel_event=cancel_events.get(job_id),
+            timing_callback=make_timing_callback(job_id),
+            **job.options,
+        )
+    except Exception as e:
+        finish_job(job, None, e)
+        return
+
+    def on_done(state: DiarizationJob, error: Exception | None):
+        try:
+            state.release()
+            if error is None:
+                state.report_progress("completed")
+        finally:
+            finish_job(job, state.result, error)
+
+    pipeline_executor.submit(state, on_done)
+
+
+def requeue_crashed_job(job: Job) -> bool:
+    """
+    Queue a job again after its worker process died, unless it keeps crashing.
+    When the job was deleted while its followers kept the computation
+    alive, the first follower is queued in its place.
+    """
+    job_id = job.id
+    crashes = crash_counts.get(job_id, 0) + 1
+    if crashes > WORKER_CRASH_RETRIES:
+        return False
+    crash_counts.pop(job_id, None)
+    cancel_events.pop(job_id, None)
+    job_timings.pop(job_id, None)
+    throughput.finished(job_id, "failed")
+    for jid in [job_id, *get_followers(job_id)]:
+        job_store.update(
+            jid, expected=[JobStatus.PROCESSING], status=JobStatus.QUEUED, progress=None
+        )
+    publish_event(job_id, "requeued", {"crashes": crashes})
+    if job_store.get(job_id, include_result=False) is not None:
+        crash_counts[job_id] = crashes
+        enqueue(job)
+        return True
+
+    new_leader = release_computation(job)
+    # the deleted job's log stayed open for the followers, they keep it
+    with event_logs_lock:
+        event_logs.pop(job_id, None)
+    if new_leader is not None:
+        crash_counts[new_leader] = crashes
+    return True
+
+
+def submit_to_process(job_id: str):
+    """Hand a job to a worker process, blocking while all of them are busy."""
+    job = start_job(job_id)
+    if job is None:
+        return
+
+    def on_done(result: dict | None, error: BaseException | None):
+        if (
+            isinstance(error, WorkerCrashed)
+            and not cancel_events[job_id].is_set()
+            and requeue_crashed_job(job)
+        ):
+            logging.warning("Job %s queued again after its worker crashed", job_id)
+            return
+        finish_job(job, result, error)
+
+    worker_pool.submit(
+        job_id,
+        {"audio_path": job.audio_path, "audio_sha256": job.audio_sha256, **job.options},
+        progress_callback=make_progress_callback(job_id),
+        event_callback=make_event_callback(job_id),
+        done_callback=on_done,
+        timing_callback=make_timing_callback(job_id),
+    )
 
 
 def worker():
-    """Background worker that processes jobs sequentially."""
+    """Background dispatcher that starts queued jobs as memory allows."""
     while True:
         job_id = job_queue.get()
 
-        with jobs_lock:
-            if job_id not in jobs:
-                continue
-            job = jobs[job_id]
-            job.status = JobStatus.PROCESSING
+        job = job_store.get(job_id, include_result=False)
+        if job is None or job.status != JobStatus.QUEUED:
+            continue
 
-        try:
-            def progress_callback(stage: str):
-                with jobs_lock:
-                    if job_id in jobs:
-                        jobs[job_id].progress = stage
-
-            result = run_diarization(
-                audio_path=job.audio_path,
-                progress_callback=progress_callback,
-                **job.options,
-            )
+        if pipeline_executor is not None:
+            # stage queues bound the jobs in flight
+            submit_pipelined(job_id)
+            continue
+        if worker_pool is not None:
+            # the number of worker processes bounds the jobs in flight
+            submit_to_process(job_id)
+            continue
 
-            with jobs_lock:
-                if job_id in jobs:
-                    jobs[job_id].result = result
-                    jobs[job_id].status = JobStatus.COMPLETED
+        # Jobs start in the queue's dispatch order (priority class, then client
+        # turns), the next job to dispatch waits for memory
+        scheduler.admit(job_id, estimate_job_memory(job))
+        threading.Thread(target=process_job, args=(job_id,), daemon=True).start()
 
-        except Exception as e:
-            with jobs_lock:
-                if job_id in jobs:
-                    jobs[job_id].error = str(e)
-                    jobs[job_id].status = JobStatus.FAILED
 
-        finally:
-            # Clean up audio file
-            if os.path.exists(job.audio_path):
-                os.remove(job.audio_path)
+def max_upload_bytes() -> int | None:
+    return int(MAX_UPLOAD_MB * 2**20) if MAX_UPLOAD_MB else None
 
-        # Periodically cleanup old jobs
-        cleanup_old_jobs()
+
+class RejectLargeUploads:
+    """
+    Refuse uploads that declare a size over the cap before their body is
+    read. Pure ASGI, so streamed responses like job events aren't buffered
+    by a BaseHTTPMiddleware wrapper.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        limit = max_upload_bytes()
+        if (
+            limit is not None
+            and scope["type"] == "http"
+            and scope["method"] == "POST"
+            and scope["path"] == "/jobs"
+        ):
+            content_length = dict(scope["headers"]).get(b"content-length", b"")
+            if content_length.isdigit() and int(content_length) > limit:
+                upload_stats["rejected"] += 1
+                response = JSONResponse(
+                    status_code=413,
+                    content={"detail": f"Upload exceeds {MAX_UPLOAD_MB:g} MB"},
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(RejectLargeUploads)
+
+FORM_BOOLEANS = {
+    "true": True,
+    "1": True,
+    "on": True,
+    "yes": True,
+    "false": False,
+    "0": False,
+    "off": False,
+    "no": False,
+}
+
+
+def job_form_options(fields: dict[str, str]) -> tuple[dict, str]:
+    """
+    Job options and priority from the form fields of POST /jobs.
+    Raises ValueError for invalid values.
+    """
+
+    def boolean(name: str, default: bool) -> bool:
+        value = fields.get(name, "").strip().lower()
+        if not value:
+            return default
+        if value not in FORM_BOOLEANS:
+            raise ValueError(f"{name} must be true or false")
+        return FORM_BOOLEANS[value]
+
+    def choice(name: str, choices: tuple[str, ...], default: str) -> str:
+        value = fields.get(name) or default
+        if value not in choices:
+            raise ValueError(f"{name} must be one of {', '.join(choices)}")
+        return value
+
+    batch_size = fields.get("batch_size", "").strip()
+    try:
+        batch_size = int(batch_size) if batch_size else None
+    except ValueError:
+        raise ValueError("batch_size must be an integer") from None
+    options = {
+        "model_name": fields.get("whisper_model") or "medium.en",
+        "language": fields.get("language") or None,
+        "stemming": boolean("stemming", True),
+        "suppress_numerals": boolean("suppress_numerals", False),
+        "batch_size": batch_size,
+        "parallel_diarization": boolean("parallel_diarization", PARALLEL_DIARIZATION),
+        "alignment_mode": choice("alignment_mode", ALIGNMENT_MODES, "auto"),
+    }
+    return options, choice("priority", ("high", "normal", "low"), "normal")
 
 
 # Start worker thread on startup
 @app.on_event("startup")
 def startup_event():
+    # Re-enqueue jobs left over from before a restart
+    for job_id in job_store.recover():
+        job = job_store.get(job_id, include_result=False)
+        if job is None:
+            # deleted since recover() listed it
+            continue
+        if not os.path.exists(job.audio_path):
+            job_store.update(
+                job_id, status=JobStatus.FAILED, error="Audio file lost on restart"
+            )
+            continue
+        leader_id = claim_computation(job)
+        open_event_log(job_id, shared_with=leader_id)
+        if leader_id is None:
+            enqueue(job)
+
+    if pipeline_executor is not None:
+        pipeline_executor.start()
+    if worker_pool is not None:
+        worker_pool.start()
     worker_thread = threading.Thread(target=worker, daemon=True)
     worker_thread.start()
 
 
+@app.on_event("shutdown")
+def shutdown_event():
+    if worker_pool is not None:
+        worker_pool.close()
+
+
 @app.post("/jobs", status_code=201)
-async def submit_job(
-    file: UploadFile = File(...),
-    whisper_model: str = Form("medium.en"),
-    language: str | None = Form(None),
-    stemming: bool = Form(True),
-    suppress_numerals: bool = Form(False),
-    batch_size: int = Form(8),
-):
+async def submit_job(request: Request):
     """
     Submit an audio file for diarization.
     Returns a job_id to poll for status.
+    Jobs are queued per client, identified by the X-Client-ID header or the
+    client address.
+    The multipart body is parsed as it arrives and the file written straight
+    to UPLOAD_DIR, see API.md for the form fields.
     """
     # Generate unique job ID (acts as secret - hard to guess)
     job_id = str(uuid4())
 
-    # Save uploaded file
-    file_ext = os.path.splitext(file.filename or "audio")[1] or ".wav"
+    # Save uploaded file, named once its extension is known
+    upload_path = os.path.join(UPLOAD_DIR, f"{job_id}.upload")
+    try:
+        upload = await receive_upload(
+            request.stream(),
+            request.headers.get("content-type", ""),
+            upload_path,
+            max_bytes=max_upload_bytes(),
+        )
+    except UploadTooLarge:
+        upload_stats["rejected"] += 1
+        raise HTTPException(
+            status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_MB:g} MB"
+        )
+    except MalformedUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        options, priority = job_form_options(upload.fields)
+    except ValueError as e:
+        os.remove(upload_path)
+        raise HTTPException(status_code=422, detail=str(e))
+    file_ext = os.path.splitext(upload.filename or "audio")[1] or ".wav"
     audio_path = os.path.join(UPLOAD_DIR, f"{job_id}{file_ext}")
-
-    with open(audio_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    os.replace(upload_path, audio_path)
+    audio_size, audio_sha256 = upload.size, upload.sha256
+    upload_stats["uploads"] += 1
+    upload_stats["bytes"] += audio_size
 
     # Create job
     job = Job(
         id=job_id,
         status=JobStatus.QUEUED,
         audio_path=audio_path,
-        options={
-            "model_name": whisper_model,
-            "language": language if language else None,
-            "stemming": stemming,
-            "suppress_numerals": suppress_numerals,
-            "batch_size": batch_size,
-        },
+        audio_sha256=audio_sha256,
+        priority=priority,
+        client_id=request.headers.get("x-client-id")
+        or (request.client.host if request.client else ""),
+        options=options,
     )
 
-    with jobs_lock:
-        jobs[job_id] = job
+    # Serve resubmitted recordings from the result cache
+    if result_cache is not None:
+        cached = await run_in_threadpool(result_cache.get, job_cache_key(job))
+        if cached is not None:
+            job.status = JobStatus.COMPLETED
+            job.result = cached
+            job_store.add(job)
+            os.remove(audio_path)
+            return {"job_id": job_id, "status": job.status.value}
 
-    # Add to queue
-    job_queue.put(job_id)
+    job.duration_s = await run_in_threadpool(probe_duration, audio_path)
+    job_store.add(job)
 
-    position = get_queue_position(job_id)
+    leader_id = claim_computation(job)
+    open_event_log(job_id, shared_with=leader_id)
+    if leader_id is None:
+        # Add to queue
+        enqueue(job)
+    else:
+        # Share the computation of an identical job
+        leader = job_store.get(leader_id, include_result=False)
+        if leader is not None and leader.status == JobStatus.PROCESSING:
+            job_store.update(
+                job_id,
+                expected=[JobStatus.QUEUED],
+                status=JobStatus.PROCESSING,
+                progress=leader.progress,
+            )
+        job = job_store.get(job_id, include_result=False) or job
 
-    return {
-        "job_id": job_id,
-        "status": job.status.value,
-        "position": position,
-    }
+    response = {"job_id": job_id, "status": job.status.value}
+    if job.status == JobStatus.QUEUED:
+        response.update(queue_info(job_id))
+    return response
 
 
 @app.get("/jobs/{job_id}")
@@ -189,25 +891,25 @@ async def get_job_status(job_id: str):
     """
     Get the status of a diarization job.
     """
-    with jobs_lock:
-        if job_id not in jobs:
-            raise HTTPException(status_code=404, detail="Job not found")
-
-        job = jobs[job_id]
+    job = job_store.get(job_id, include_result=False)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
 
-        response = {
-            "job_id": job.id,
-            "status": job.status.value,
-        }
+    response = {
+        "job_id": job.id,
+        "status": job.status.value,
+    }
 
-        if job.status == JobStatus.QUEUED:
-            response["position"] = get_queue_position(job_id)
-        elif job.status == JobStatus.PROCESSING:
-            response["progress"] = job.progress
-        elif job.status == JobStatus.FAILED:
-            response["error"] = job.error
+    if job.status == JobStatus.QUEUED:
+        response.update(queue_info(job_id))
+    elif job.status == JobStatus.PROCESSING:
+        response["progress"] = job.progress
+    elif job.status == JobStatus.FAILED:
+        response["error"] = job.error
+    if job.timings is not None:
+        response["timings"] = job.timings
 
-        return response
+    return response
 
 
 @app.get("/jobs/{job_id}/result")
@@ -215,59 +917,238 @@ async def get_job_result(job_id: str):
     """
     Get the result of a completed diarization job.
     """
-    with jobs_lock:
-        if job_id not in jobs:
-            raise HTTPException(status_code=404, detail="Job not found")
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if job.status == JobStatus.QUEUED:
+        raise HTTPException(status_code=202, detail="Job is still queued")
+    elif job.status == JobStatus.PROCESSING:
+        raise HTTPException(status_code=202, detail="Job is still processing")
+    elif job.status == JobStatus.FAILED:
+        raise HTTPException(status_code=500, detail=f"Job failed: {job.error}")
+
+    return job.result
+
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """
+    Stream partial results of a job as Server-Sent Events.
+    Reconnecting clients resume after the Last-Event-ID they received.
+    """
+    job = job_store.get(job_id, include_result=False)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
 
-        job = jobs[job_id]
+    with event_logs_lock:
+        log = event_logs.get(job_id)
+    last_event_id = request.headers.get("last-event-id", "")
+    start = int(last_event_id) + 1 if last_event_id.isdigit() else 0
 
-        if job.status == JobStatus.QUEUED:
-            raise HTTPException(status_code=202, detail="Job is still queued")
-        elif job.status == JobStatus.PROCESSING:
-            raise HTTPException(status_code=202, detail="Job is still processing")
+    async def stream():
+        if log is not None:
+            async for index, event, data in log.follow(start):
+                yield format_sse(index, event, data)
+            return
+        # finished before the client connected
+        job = job_store.get(job_id)
+        if job is None:
+            yield format_sse(start, "deleted", {})
+        elif job.status == JobStatus.COMPLETED:
+            yield format_sse(start, "completed", {"result": job.result})
         elif job.status == JobStatus.FAILED:
-            raise HTTPException(status_code=500, detail=f"Job failed: {job.error}")
+            yield format_sse(start, "failed", {"error": job.error})
 
-        return job.result
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.delete("/jobs/{job_id}")
 async def delete_job(job_id: str):
     """
     Delete a job and its results.
-    Can be used to cancel a queued job or cleanup a completed job.
+    Cancels a queued or processing job, or cleans up a finished one.
+    """
+    job = job_store.delete(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if job.status == JobStatus.PROCESSING:
+        leader_id = detach_running_job(job)
+        if leader_id is not None:
+            cancel_job(leader_id)
+        if job_id in cancel_events:
+            # a computation kept running for its followers still publishes
+            # under this job's id, finish_job closes the log they share
+            if leader_id is not None:
+                close_event_logs([job_id], "deleted", {})
+            # the running computation removes the upload when it stops
+            return {"message": "Job cancelled" if leader_id else "Job deleted"}
+    else:
+        job_queue.remove(job_id)
+        release_computation(job)
+    close_event_logs([job_id], "deleted", {})
+
+    # Clean up audio file if exists
+    if os.path.exists(job.audio_path):
+        os.remove(job.audio_path)
+
+    return {"message": "Job deleted"}
+
+
+def load_stream_models(model_name: str, speaker_labels: bool):
+    """Whisper and diarizer of a live stream, shared with jobs through the pool."""
+    keys = pipeline_model_keys(model_name, DEVICE)
+    whisper_model = model_pool.get(
+        *keys["transcribing"],
+        lambda: faster_whisper.WhisperModel(
+            model_name, device=DEVICE, compute_type=MTYPES[DEVICE]
+        ),
+        estimate_whisper_size_mb(model_name, MTYPES[DEVICE]),
+    )
+    if not speaker_labels:
+        return whisper_model, None
+
+    from diarization import MSDDDiarizer
+
+    diarizer = model_pool.get(*keys["diarizing"], lambda: MSDDDiarizer(device=DEVICE))
+    return whisper_model, diarizer
+
+
+@app.websocket("/stream")
+async def stream_audio(
+    websocket: WebSocket,
+    whisper_model: str = STREAM_WHISPER_MODEL,
+    language: str | None = None,
+    encoding: Literal["pcm_s16le", "pcm_f32le"] = "pcm_s16le",
+    speaker_labels: bool = True,
+):
+    """
+    Transcribe and diarize a live 16 kHz mono PCM stream.
+    Binary frames carry audio, a {"type": "stop"} text frame ends the stream.
     """
-    with jobs_lock:
-        if job_id not in jobs:
-            raise HTTPException(status_code=404, detail="Job not found")
+    await websocket.accept()
+    try:
+        language = process_language_arg(language, whisper_model)
+        models = await run_in_threadpool(
+            load_stream_models, whisper_model, speaker_labels
+        )
+    except Exception as e:
+        await websocket.close(code=1011, reason=str(e)[:120])
+        return
+    session = StreamingSession(*models, language=language)
 
-        job = jobs[job_id]
+    async def receive() -> bool:
+        """Feed audio until the client stops (True) or disconnects (False)."""
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return False
+            if message.get("bytes"):
+                session.feed(decode_pcm(message["bytes"], encoding))
+            elif message.get("text"):
+                if json.loads(message["text"]).get("type") == "stop":
+                    return True
 
-        # Can only delete queued, completed, or failed jobs
-        if job.status == JobStatus.PROCESSING:
-            raise HTTPException(
-                status_code=409,
-                detail="Cannot delete job while processing"
+    async def send_results(final: bool = False):
+        committed, tentative = await run_in_threadpool(session.step, final)
+        latency = round(session.latencies[-1], 3) if session.latencies else None
+        for segment in committed:
+            await websocket.send_json(
+                {"type": "segment", **segment.to_dict(), "latency": latency}
             )
+        await websocket.send_json(
+            {
+                "type": "partial",
+                "segments": [segment.to_dict() for segment in tentative],
+                "latency": latency,
+            }
+        )
 
-        # Clean up audio file if exists
-        if os.path.exists(job.audio_path):
-            os.remove(job.audio_path)
+    receiver = asyncio.create_task(receive())
+    try:
+        while not receiver.done():
+            if session.ready():
+                await send_results()
+            else:
+                await asyncio.wait({receiver}, timeout=0.05)
+        if receiver.result():
+            await send_results(final=True)
+            await websocket.send_json(
+                {"type": "done", "latency": session.latency_stats()}
+            )
+            await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except ValueError as e:
+        # malformed audio or control frame
+        await websocket.close(code=1003, reason=str(e)[:120])
+    finally:
+        receiver.cancel()
 
-        del jobs[job_id]
 
-        return {"message": "Job deleted"}
+def artifact_cache_stats() -> dict:
+    """Artifact cache state, with the counters of the worker processes added."""
+    stats = artifact_cache.stats()
+    if worker_pool is not None:
+        for name, value in worker_pool.artifact_cache_counters().items():
+            stats[name] += value
+    return stats
 
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    with jobs_lock:
-        queued = sum(1 for j in jobs.values() if j.status == JobStatus.QUEUED)
-        processing = sum(1 for j in jobs.values() if j.status == JobStatus.PROCESSING)
+    counts = job_store.count_by_status()
 
     return {
         "status": "healthy",
-        "queued_jobs": queued,
-        "processing_jobs": processing,
+        "queued_jobs": counts[JobStatus.QUEUED],
+        "processing_jobs": counts[JobStatus.PROCESSING],
+        "job_store": JOB_STORE,
+        "queue": job_queue.stats(),
+        "real_time_factor": round(throughput.rtf, 3) if throughput.rtf else None,
+        "uploads": dict(upload_stats),
+        "result_cache": result_cache.stats() if result_cache else None,
+        "artifact_cache": artifact_cache_stats() if artifact_cache else None,
+        "whisper_batching": whisper_batcher.stats() if whisper_batcher else None,
+        "execution_mode": EXECUTION_MODE,
+        "scheduler": scheduler.stats(),
+        "model_pool": model_pool.stats(),
+        "pipeline": pipeline_executor.stats() if pipeline_executor else None,
+        "worker_pool": worker_pool.stats() if worker_pool else None,
     }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Stage timings, memory peaks and job counts in the Prometheus text format."""
+    counts = job_store.count_by_status()
+    rss_mb = memory_probe.rss_mb()
+    gauges = {
+        "queued_jobs": ("Jobs waiting in the queue", counts[JobStatus.QUEUED]),
+        "processing_jobs": ("Jobs being processed", counts[JobStatus.PROCESSING]),
+        "resident_memory_bytes": (
+            "Resident memory of the API process",
+            rss_mb * 2**20 if rss_mb is not None else None,
+        ),
+        "real_time_factor": (
+            "Smoothed processing seconds per second of audio",
+            throughput.rtf,
+        ),
+    }
+    counters = {
+        "uploads_total": ("Accepted uploads", upload_stats["uploads"]),
+        "upload_bytes_total": ("Bytes of accepted uploads", upload_stats["bytes"]),
+        "uploads_rejected_total": (
+            "Uploads refused for exceeding MAX_UPLOAD_MB",
+            upload_stats["rejected"],
+        ),
+    }
+    return PlainTextResponse(
+        metrics.render(gauges, counters), media_type="text/plain; version=0.0.4"
+    )
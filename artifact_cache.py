@@ -0,0 +1,268 @@
+"""
+On-disk cache of intermediate pipeline outputs.
+Every stage output is keyed by the audio content and the parameters of the
+stages that produced it, so a rerun with different options only repeats
+the stages whose inputs changed.
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows, processes can't share a cache directory
+    fcntl = None
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    """Hash a file in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact_key(*parts: Any) -> str:
+    """Key of an artifact from the keys and parameters it was derived from."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+class ArtifactCache:
+    """
+    Stores stage outputs as files and evicts the least recently used ones
+    once the directory grows past `max_bytes`.
+
+    NumPy arrays are written as .npy files, everything else is pickled.
+    Recency survives restarts through the file modification times, which
+    are bumped on every hit.
+
+    With `shared`, several processes use the directory at once: lookups
+    that miss the index check the disk, and writes update the number of
+    files and bytes recorded in the directory under a lock file. Only a
+    write that takes the directory past `max_bytes` rescans it to find the
+    least recently used files of every process. Hits, misses and
+    evictions are counted per process, the owner of the cache adds up
+    those of the other processes.
+
+    Args:
+        directory: Directory of the cached files
+        max_bytes: Size limit of the directory
+        shared: Other processes use the directory as well
+    """
+
+    _LOCK_FILE = ".lock"
+    _USAGE_FILE = ".usage.json"
+
+    def __init__(self, directory: str, max_bytes: int, shared: bool = False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, int] = OrderedDict()  # file name -> size, LRU first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._directory_locked = False
+
+        os.makedirs(directory, exist_ok=True)
+        with self._lock, self._directory_lock():
+            self._scan()
+            self._evict()
+            if shared:
+                self._write_usage(len(self._entries), self._total_bytes)
+
+    @contextmanager
+    def _directory_lock(self) -> Iterator[None]:
+        """
+        Exclusive access to the directory among processes sharing it.
+        Reentrant, only taken while holding the instance lock.
+        """
+        if not self.shared or fcntl is None or self._directory_locked:
+            yield
+            return
+        with open(os.path.join(self.directory, self._LOCK_FILE), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            self._directory_locked = True
+            try:
+                yield
+            finally:
+                self._directory_locked = False
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _scan(self):
+        """Rebuild the index from the directory, least recently used first."""
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith((".npy", ".pkl")):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue  # evicted by another process meanwhile
+            files.append((stat.st_mtime, name, stat.st_size))
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(files))
+        self._total_bytes = sum(self._entries.values())
+
+    def _read_usage(self) -> tuple[int, int] | None:
+        """Files and bytes in the shared directory, None if not recorded."""
+        try:
+            with open(os.path.join(self.directory, self._USAGE_FILE)) as f:
+                usage = json.load(f)
+            return usage["files"], usage["bytes"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def _write_usage(self, files: int, total_bytes: int):
+        path = os.path.join(self.directory, self._USAGE_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"files": files, "bytes": total_bytes}, f)
+        os.replace(tmp_path, path)
+
+    def _find(self, artifact: str, key: str) -> str | None:
+        for suffix in (".npy", ".pkl"):
+            name = f"{artifact}-{key}{suffix}"
+            if name in self._entries:
+                return name
+        if self.shared:
+            # written by another process since the last scan
+            for suffix in (".npy", ".pkl"):
+                name = f"{artifact}-{key}{suffix}"
+                try:
+                    size = os.path.getsize(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                self._entries[name] = size
+                self._total_bytes += size
+                return name
+        return None
+
+    def _remove(self, name: str):
+        self._total_bytes -= self._entries.pop(name)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        evicted = 0
+        while self._total_bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            evicted += 1
+        self.evictions += evicted
+
+    def get(self, artifact: str, key: str) -> Any | None:
+        """Load an artifact, None if it isn't cached."""
+        with self._lock:
+            name = self._find(artifact, key)
+            if name is None:
+                self.misses += 1
+                return None
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(".npy"):
+                    value = np.load(path)
+                else:
+                    with open(path, "rb") as f:
+                        value = pickle.load(f)
+                os.utime(path)
+            except FileNotFoundError:
+                # evicted by another process
+                self._remove(name)
+                self.misses += 1
+                return None
+            except Exception:
+                logging.warning("Dropping unreadable cached artifact %s", name)
+                self._remove(name)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+            return value
+
+    def put(self, artifact: str, key: str, value: Any):
+        """Store an artifact, replacing a previous version."""
+        is_array = isinstance(value, np.ndarray)
+        name = f"{artifact}-{key}{'.npy' if is_array else '.pkl'}"
+        path = os.path.join(self.directory, name)
+        # write to a temp file first so readers never see a partial artifact
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            if is_array:
+                np.save(f, value, allow_pickle=False)
+            else:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        size = os.path.getsize(tmp_path)
+
+        with self._lock, self._directory_lock():
+            if size > self.max_bytes:
+                os.remove(tmp_path)
+                return
+            if self.shared:
+                self._put_shared(name, tmp_path, size)
+                return
+            if name in self._entries:
+                self._total_bytes -= self._entries.pop(name)
+            os.replace(tmp_path, path)
+            self._entries[name] = size
+            self._total_bytes += size
+            self._evict()
+
+    def _put_shared(self, name: str, tmp_path: str, size: int):
+        """Move a written artifact into a shared directory, holding its lock."""
+        path = os.path.join(self.directory, name)
+        usage = self._read_usage()
+        if usage is None:
+            self._scan()
+            usage = len(self._entries), self._total_bytes
+        files, total_bytes = usage
+        try:
+            total_bytes -= os.path.getsize(path)
+        except FileNotFoundError:
+            files += 1
+        os.replace(tmp_path, path)
+        total_bytes += size
+        if name in self._entries:
+            self._total_bytes -= self._entries.pop(name)
+        self._entries[name] = size
+        self._total_bytes += size
+        if total_bytes > self.max_bytes:
+            # the size limit covers the files of every process
+            self._scan()
+            self._evict()
+            files, total_bytes = len(self._entries), self._total_bytes
+        self._write_usage(files, total_bytes)
+
+    def counters(self) -> dict[str, int]:
+        """Hits, misses and evictions of this process."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def stats(self) -> dict:
+        """Cache state for health reporting, with the counters of this process."""
+        with self._lock:
+            # replaced atomically, so readable without the directory lock
+            usage = self._read_usage() if self.shared else None
+            if usage is None:
+                usage = len(self._entries), self._total_bytes
+            files, total_bytes = usage
+            return {
+                "entries": files,
+                "size_mb": round(total_bytes / 2**20, 1),
+                "max_size_mb": round(self.max_bytes / 2**20, 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,164 @@
+"""
+Decoded audio shared between pipeline stages.
+The waveform is decoded once and every stage gets a view of the same
+float32 samples instead of its own copy.
+"""
+import os
+import tempfile
+import threading
+from typing import Union
+
+import av
+import faster_whisper
+import numpy as np
+import torch
+
+SAMPLING_RATE = 16000
+
+
+class AudioBuffer:
+    """
+    Read-only float32 mono waveform.
+
+    `numpy()` and `tensor()` return zero-copy views of the samples. Other
+    dtypes and devices are converted lazily and cached until `release()`.
+    Long recordings can be backed by a memory-mapped file, so the samples
+    live in the page cache instead of the worker's resident memory.
+
+    Args:
+        samples: 1D float32 waveform, taken over without copying
+        sample_rate: Sample rate of `samples`
+        mmap_path: Backing file when `samples` is a np.memmap, removed on release
+    """
+
+    def __init__(
+        self,
+        samples: np.ndarray,
+        sample_rate: int = SAMPLING_RATE,
+        mmap_path: str | None = None,
+    ):
+        if samples.dtype != np.float32:
+            samples = samples.astype(np.float32)
+        self._samples = samples
+        self.sample_rate = sample_rate
+        self._mmap_path = mmap_path
+        self._conversions: dict[tuple[torch.dtype, str], torch.Tensor] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(
+        cls,
+        path: str,
+        sample_rate: int = SAMPLING_RATE,
+        mmap_min_seconds: float | None = None,
+        mmap_dir: str | None = None,
+    ) -> "AudioBuffer":
+        """
+        Decode an audio file once.
+
+        Args:
+            path: Audio file in any format ffmpeg understands
+            sample_rate: Target sample rate
+            mmap_min_seconds: Recordings at least this long are moved to a
+                memory-mapped file (None to always keep them in memory)
+            mmap_dir: Directory for the memory-mapped file
+        """
+        samples = faster_whisper.decode_audio(path, sampling_rate=sample_rate)
+        if mmap_min_seconds is None or len(samples) < mmap_min_seconds * sample_rate:
+            return cls(samples, sample_rate)
+        return cls.memory_mapped(samples, sample_rate, mmap_dir)
+
+    @classmethod
+    def from_tensor(
+        cls, samples: torch.Tensor, sample_rate: int = SAMPLING_RATE
+    ) -> "AudioBuffer":
+        """Wrap a 1D tensor, sharing its memory when it's float32 on the CPU."""
+        return cls(samples.detach().to("cpu", torch.float32).numpy(), sample_rate)
+
+    @classmethod
+    def memory_mapped(
+        cls,
+        samples: np.ndarray,
+        sample_rate: int = SAMPLING_RATE,
+        mmap_dir: str | None = None,
+    ) -> "AudioBuffer":
+        """Copy samples into a memory-mapped temp file and back the buffer with it."""
+        fd, mmap_path = tempfile.mkstemp(suffix=".f32", dir=mmap_dir)
+        os.close(fd)
+        mapped = np.memmap(mmap_path, dtype=np.float32, mode="w+", shape=samples.shape)
+        mapped[:] = samples
+        mapped.flush()
+        return cls(mapped, sample_rate, mmap_path=mmap_path)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    @property
+    def duration(self) -> float:
+        """Length in seconds."""
+        return len(self._samples) / self.sample_rate
+
+    @property
+    def nbytes(self) -> int:
+        return self._samples.nbytes
+
+    def numpy(self) -> np.ndarray:
+        """Read-only view of the samples."""
+        view = self._samples.view(np.ndarray)
+        view.flags.writeable = False
+        return view
+
+    def tensor(
+        self,
+        dtype: torch.dtype = torch.float32,
+        device: Union[str, torch.device] = "cpu",
+    ) -> torch.Tensor:
+        """
+        Samples as a 1D tensor. Float32 on the CPU shares memory with the
+        buffer and must not be written to; other dtypes and devices are
+        converted on first use and cached.
+        """
+        device = str(torch.device(device))
+        if dtype == torch.float32 and device == "cpu":
+            return torch.from_numpy(self._samples.view(np.ndarray))
+
+        key = (dtype, device)
+        with self._lock:
+            if key not in self._conversions:
+                self._conversions[key] = torch.from_numpy(
+                    self._samples.view(np.ndarray)
+                ).to(device=device, dtype=dtype)
+            return self._conversions[key]
+
+    def release_conversion(
+        self,
+        dtype: torch.dtype,
+        device: Union[str, torch.device] = "cpu",
+    ):
+        """Drop a cached conversion once the stage that needed it is done."""
+        with self._lock:
+            self._conversions.pop((dtype, str(torch.device(device))), None)
+
+    def release(self):
+        """Drop cached conversions and the backing file."""
+        with self._lock:
+            self._conversions.clear()
+        if self._mmap_path is not None:
+            self._samples = np.empty(0, dtype=np.float32)
+            if os.path.exists(self._mmap_path):
+                os.remove(self._mmap_path)
+            self._mmap_path = None
+
+
+def probe_duration(path: str) -> float | None:
+    """Duration of an audio file from its container, without decoding it."""
+    try:
+        with av.open(path) as container:
+            if container.duration is not None:
+                return container.duration / av.time_base
+            stream = container.streams.audio[0]
+            if stream.duration is not None and stream.time_base is not None:
+                return float(stream.duration * stream.time_base)
+    except (av.error.FFmpegError, IndexError, OSError):
+        pass
+    return None
@@ -0,0 +1,101 @@
+"""
+Batch sizes for the batched pipeline stages.
+Whisper and the alignment model have different memory profiles, so each
+stage gets its own batch size from the memory that is free when it starts
+and the length of the audio. A stage that still runs out of memory is
+retried with half the batch.
+"""
+import logging
+import math
+from typing import Callable, TypeVar
+
+import torch
+
+from scheduler import STAGE_FOOTPRINTS, MemoryProbe, SystemMemoryProbe
+
+T = TypeVar("T")
+
+# Used when free memory can't be measured
+DEFAULT_BATCH_SIZE = 8
+# Larger batches don't speed up CPU inference
+MAX_BATCH_SIZES = {"cuda": 32, "cpu": 8}
+# Free memory left untouched by the planned batch
+HEADROOM_MB = 1024
+# Longest chunk Whisper and generate_emissions process in one batch item
+CHUNK_SECONDS = 30
+
+_probe: MemoryProbe | None = None
+
+
+def _default_probe() -> MemoryProbe:
+    global _probe
+    if _probe is None:
+        _probe = SystemMemoryProbe()
+    return _probe
+
+
+def plan_batch_size(
+    stage: str,
+    device: str,
+    duration_s: float,
+    probe: MemoryProbe | None = None,
+    headroom_mb: float = HEADROOM_MB,
+) -> int:
+    """
+    Largest batch of a stage that fits in the free memory of the device.
+    The stage's model is expected to be loaded already.
+
+    Args:
+        stage: "transcribing" or "aligning"
+        device: Device the stage runs on
+        duration_s: Length of the audio
+        probe: Memory probe, SystemMemoryProbe if None
+        headroom_mb: Free memory to leave untouched
+    """
+    footprint = STAGE_FOOTPRINTS[stage]
+    max_batch = MAX_BATCH_SIZES.get(device, DEFAULT_BATCH_SIZE)
+    # more batch items than 30 s chunks only pads the batch
+    max_batch = min(max_batch, max(math.ceil(duration_s / CHUNK_SECONDS), 1))
+
+    available = (probe or _default_probe()).available_mb(device)
+    if available is None or not footprint.per_batch_mb:
+        return min(DEFAULT_BATCH_SIZE, max_batch)
+
+    budget = (
+        available
+        - headroom_mb
+        - footprint.working_mb
+        - footprint.per_minute_mb * duration_s / 60
+    )
+    return max(1, min(int(budget // footprint.per_batch_mb), max_batch))
+
+
+def is_out_of_memory(error: BaseException) -> bool:
+    """True for torch and CTranslate2 out of memory errors."""
+    if isinstance(error, torch.cuda.OutOfMemoryError):
+        return True
+    return isinstance(error, RuntimeError) and "out of memory" in str(error).lower()
+
+
+def run_with_backoff(
+    fn: Callable[[int], T], batch_size: int, description: str = "stage"
+) -> T:
+    """
+    Run `fn(batch_size)`, halving the batch after every out of memory error
+    until it succeeds or runs out of memory with a batch of 1.
+    """
+    while True:
+        try:
+            return fn(batch_size)
+        except Exception as e:
+            if batch_size <= 1 or not is_out_of_memory(e):
+                raise
+
+        # outside the except block, so the failed attempt's tensors are
+        # freed along with the traceback
+        batch_size //= 2
+        logging.warning(
+            "%s ran out of memory, retrying with batch size %d", description, batch_size
+        )
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
@@ -0,0 +1,124 @@
+"""
+Accuracy check of the segment and windowed alignment modes against full.
+
+Transcribes the fixture once, aligns the transcript with every
+alignment_mode and compares the word boundaries of "segments" (what "auto"
+uses) and "windowed" with those of aligning the whole transcript at once.
+Words are paired by their text, and the check fails when too few words pair
+up or the boundaries moved by more than the tolerance.
+
+Usage:
+    python benchmarks/alignment_accuracy.py
+    python benchmarks/alignment_accuracy.py --model medium.en --device cuda
+"""
+import argparse
+import difflib
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_AUDIO = os.path.join(ROOT, "tests", "assets", "test.opus")
+MODES = ("segments", "windowed")
+
+
+def boundary_deltas(words: list[dict], reference: list[dict]) -> tuple[np.ndarray, int]:
+    """
+    Absolute start and end differences in ms of the words paired with the
+    reference's words by their text, and the number of pairs.
+    """
+    matcher = difflib.SequenceMatcher(
+        a=[w["text"] for w in words], b=[w["text"] for w in reference], autojunk=False
+    )
+    deltas = []
+    for block in matcher.get_matching_blocks():
+        for i in range(block.size):
+            word, ref = words[block.a + i], reference[block.b + i]
+            deltas.append(abs(word["start"] - ref["start"]) * 1000)
+            deltas.append(abs(word["end"] - ref["end"]) * 1000)
+    return np.array(deltas), len(deltas) // 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--audio", default=DEFAULT_AUDIO, help="Audio file to align")
+    parser.add_argument("--model", default="tiny.en", help="Whisper model name")
+    parser.add_argument("--language", default="en", help="Language code")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument(
+        "--max-p90-ms",
+        type=float,
+        default=100.0,
+        help="Largest allowed 90th percentile of the boundary differences",
+    )
+    parser.add_argument(
+        "--min-paired",
+        type=float,
+        default=0.99,
+        help="Smallest share of the full alignment's words that must pair up",
+    )
+    args = parser.parse_args()
+
+    from diarize_core import DiarizationJob, align, separate_vocals, transcribe
+    from model_pool import ModelPool
+
+    # the pool keeps the alignment model loaded between the modes
+    job = DiarizationJob(
+        audio_path=args.audio,
+        model_name=args.model,
+        language=args.language,
+        stemming=False,
+        device=args.device,
+        batch_size=args.batch_size,
+        model_pool=ModelPool(),
+    )
+    separate_vocals(job)
+    transcribe(job)
+
+    words, seconds = {}, {}
+    for mode in ("full", *MODES):
+        job.alignment_mode = mode
+        job.word_timestamps = None
+        started = time.perf_counter()
+        align(job)
+        seconds[mode] = time.perf_counter() - started
+        words[mode] = job.word_timestamps
+    job.release()
+
+    reference = words["full"]
+    print(
+        f"{'mode':>9} {'words':>6} {'paired':>7} {'p50 ms':>7} {'p90 ms':>7} "
+        f"{'max ms':>7} {'time (s)':>9}"
+    )
+    print(f"{'full':>9} {len(reference):>6} {'':>31} {seconds['full']:>9.2f}")
+    failures = []
+    for mode in MODES:
+        deltas, paired = boundary_deltas(words[mode], reference)
+        share = paired / len(reference) if reference else 1.0
+        p50, p90, worst = (
+            np.percentile(deltas, [50, 90, 100]) if len(deltas) else (0.0, 0.0, 0.0)
+        )
+        print(
+            f"{mode:>9} {len(words[mode]):>6} {share:>7.1%} {p50:>7.0f} {p90:>7.0f} "
+            f"{worst:>7.0f} {seconds[mode]:>9.2f}"
+        )
+        if share < args.min_paired:
+            failures.append(f"{mode} pairs only {share:.1%} of the words")
+        if p90 > args.max_p90_ms:
+            failures.append(f"{mode} moves boundaries by {p90:.0f} ms at p90")
+
+    if failures:
+        print("Alignment differs from full:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"Every mode is within {args.max_p90_ms:g} ms of full at p90")
+
+
+if __name__ == "__main__":
+    main()
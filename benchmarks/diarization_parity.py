@@ -0,0 +1,125 @@
+"""
+Parity check of MSDDDiarizer's in-memory path against NeMo's file-based one.
+
+diarize_in_memory runs NeMo's VAD, embedding, clustering and MSDD steps on
+the models' submodules, diarize_with_files goes through NeMo's own
+NeuralDiarizer.diarize with a manifest and RTTM files. Both run on the
+fixture, and the check fails when their turns disagree on more than the
+tolerated share of speech, after matching up the speaker labels. Run it
+after upgrading NeMo.
+
+Usage:
+    python benchmarks/diarization_parity.py
+    python benchmarks/diarization_parity.py --device cuda --audio meeting.wav
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from audio_buffer import SAMPLING_RATE  # noqa: E402
+
+DEFAULT_AUDIO = os.path.join(ROOT, "tests", "assets", "test.opus")
+
+
+def overlap_ms(a: tuple[int, int, int], b: tuple[int, int, int]) -> int:
+    return max(0, min(a[1], b[1]) - max(a[0], b[0]))
+
+
+def agreement(
+    turns: list[tuple[int, int, int]], reference: list[tuple[int, int, int]]
+) -> tuple[float, dict[int, int]]:
+    """
+    Share of the reference's speech the turns give the same speaker, under
+    the one to one speaker mapping that maximises it, and the mapping.
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    speakers = sorted({s for _, _, s in turns})
+    reference_speakers = sorted({s for _, _, s in reference})
+    total = sum(end - start for start, end, _ in reference)
+    if not total:
+        return float(not turns), {}
+    shared = np.zeros((len(speakers), len(reference_speakers)))
+    for turn in turns:
+        for reference_turn in reference:
+            shared[speakers.index(turn[2]), reference_speakers.index(reference_turn[2])] += (
+                overlap_ms(turn, reference_turn)
+            )
+    rows, cols = linear_sum_assignment(shared, maximize=True)
+    mapping = {speakers[r]: reference_speakers[c] for r, c in zip(rows, cols)}
+    return float(shared[rows, cols].sum()) / total, mapping
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--audio", default=DEFAULT_AUDIO, help="Audio file to diarize")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument(
+        "--min-agreement",
+        type=float,
+        default=0.99,
+        help="Smallest share of speech both must give the same speaker",
+    )
+    parser.add_argument(
+        "--max-boundary-ms",
+        type=int,
+        default=100,
+        help="Largest allowed shift of a turn boundary when turn counts match",
+    )
+    args = parser.parse_args()
+
+    import faster_whisper
+    import torch
+
+    from diarization import MSDDDiarizer
+
+    audio = torch.from_numpy(
+        faster_whisper.decode_audio(args.audio, sampling_rate=SAMPLING_RATE)
+    ).unsqueeze(0)
+    diarizer = MSDDDiarizer(device=args.device)
+
+    started = time.perf_counter()
+    in_memory = diarizer.diarize_in_memory(audio)
+    in_memory_s = time.perf_counter() - started
+    started = time.perf_counter()
+    with_files = diarizer.diarize_with_files(audio)
+    with_files_s = time.perf_counter() - started
+    print(f"diarize_in_memory  {len(in_memory):>4} turns {in_memory_s:>8.2f} s")
+    print(f"diarize_with_files {len(with_files):>4} turns {with_files_s:>8.2f} s")
+
+    if in_memory == with_files:
+        print("Turns are identical")
+        return
+
+    failures = []
+    share, mapping = agreement(in_memory, with_files)
+    print(f"Same speaker on {share:.2%} of the speech, speakers mapped {mapping}")
+    if share < args.min_agreement:
+        failures.append(f"agreement {share:.2%} is below {args.min_agreement:.2%}")
+    if len(in_memory) != len(with_files):
+        failures.append(f"{len(in_memory)} turns instead of {len(with_files)}")
+    else:
+        shift = max(
+            max(abs(a[0] - b[0]), abs(a[1] - b[1]))
+            for a, b in zip(in_memory, with_files)
+        )
+        print(f"Turn boundaries differ by {shift} ms at most")
+        if shift > args.max_boundary_ms:
+            failures.append(f"boundaries shift by {shift} ms")
+
+    if failures:
+        print("diarize_in_memory differs from diarize_with_files:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("diarize_in_memory matches diarize_with_files within the tolerances")
+
+
+if __name__ == "__main__":
+    main()
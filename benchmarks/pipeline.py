@@ -0,0 +1,263 @@
+"""
+End-to-end benchmark of run_diarization on CPU with small models.
+
+Runs the whole pipeline on the test fixture and on copies of it tiled to
+longer durations, and reports the real-time factor, latency percentiles of
+every stage and NeMo diarization step, and peak memory. Results are written
+as JSON with sorted keys so runs of two commits can be diffed, and with
+--baseline the run fails when a stage got slower than the tolerance allows.
+
+Usage:
+    python benchmarks/pipeline.py --output bench.json
+    python benchmarks/pipeline.py --durations 60 300 --repeats 5
+    python benchmarks/pipeline.py --baseline bench.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from audio_buffer import SAMPLING_RATE  # noqa: E402
+from instrumentation import StageTiming  # noqa: E402
+
+DEFAULT_AUDIO = os.path.join(ROOT, "tests", "assets", "test.opus")
+PERCENTILES = (50, 90, 99)
+# Slowdowns below this many seconds are noise, not regressions
+MIN_REGRESSION_SECONDS = 0.05
+
+
+def write_wav(path: str, audio: np.ndarray):
+    """Write a 16 kHz mono float waveform as 16-bit PCM."""
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLING_RATE)
+        f.writeframes(pcm.tobytes())
+
+
+def prepare_inputs(
+    audio_path: str, durations: list[float], directory: str
+) -> dict[str, tuple[str, float]]:
+    """The fixture itself plus copies tiled to each duration, name -> (path, seconds)."""
+    import faster_whisper
+
+    audio = faster_whisper.decode_audio(audio_path, sampling_rate=SAMPLING_RATE)
+    inputs = {"fixture": (audio_path, len(audio) / SAMPLING_RATE)}
+    for duration in durations:
+        samples = int(duration * SAMPLING_RATE)
+        tiled = np.tile(audio, -(-samples // len(audio)))[:samples]
+        path = os.path.join(directory, f"tiled_{duration:g}s.wav")
+        write_wav(path, tiled)
+        inputs[f"tiled_{duration:g}s"] = (path, samples / SAMPLING_RATE)
+    return inputs
+
+
+def stage_name(timing: StageTiming) -> str:
+    return f"{timing.parent}/{timing.stage}" if timing.parent else timing.stage
+
+
+def percentiles(values: list[float]) -> dict:
+    summary = {f"p{p}": round(float(np.percentile(values, p)), 4) for p in PERCENTILES}
+    summary["mean"] = round(float(np.mean(values)), 4)
+    return summary
+
+
+def peak(values: list[float | None]) -> float | None:
+    values = [v for v in values if v is not None]
+    return round(max(values), 1) if values else None
+
+
+def benchmark_input(path: str, duration: float, args, model_pool) -> dict:
+    """Run the pipeline on one file, the warmup runs load the models."""
+    from diarize_core import run_diarization
+
+    runs = []
+    for i in range(args.warmup + args.repeats):
+        timings: list[StageTiming] = []
+        started = time.perf_counter()
+        run_diarization(
+            audio_path=path,
+            model_name=args.model,
+            language=args.language,
+            stemming=args.stemming,
+            device="cpu",
+            batch_size=args.batch_size,
+            model_pool=model_pool,
+            timing_callback=timings.append,
+        )
+        wall = time.perf_counter() - started
+        if i >= args.warmup:
+            runs.append((wall, timings))
+        print(f"  run {i + 1}: {wall:.2f} s{' (warmup)' if i < args.warmup else ''}")
+
+    stages: dict[str, list[StageTiming]] = {}
+    for _, timings in runs:
+        for timing in timings:
+            stages.setdefault(stage_name(timing), []).append(timing)
+    walls = [wall for wall, _ in runs]
+    return {
+        "audio_duration_s": round(duration, 2),
+        "runs": len(runs),
+        "wall_s": percentiles(walls),
+        "real_time_factor": percentiles([wall / duration for wall in walls]),
+        "peak_rss_mb": peak([t.peak_rss_mb for ts in stages.values() for t in ts]),
+        "stages": {
+            name: {
+                "wall_s": percentiles([t.wall_s for t in timings]),
+                "cpu_s": percentiles([t.cpu_s for t in timings]),
+                "peak_rss_mb": peak([t.peak_rss_mb for t in timings]),
+            }
+            for name, timings in stages.items()
+        },
+    }
+
+
+def environment(args) -> dict:
+    import torch
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "threads": torch.get_num_threads(),
+        "model": args.model,
+        "stemming": args.stemming,
+        "batch_size": args.batch_size,
+        "seed": args.seed,
+    }
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Stages and real-time factors whose median grew by more than `tolerance`."""
+    regressions = []
+    for name, current in results["inputs"].items():
+        previous = baseline.get("inputs", {}).get(name)
+        if previous is None:
+            continue
+        pairs = [
+            ("real_time_factor", previous["real_time_factor"], current["real_time_factor"], 0)
+        ]
+        for stage, timings in current["stages"].items():
+            if stage in previous["stages"]:
+                pairs.append(
+                    (
+                        stage,
+                        previous["stages"][stage]["wall_s"],
+                        timings["wall_s"],
+                        MIN_REGRESSION_SECONDS,
+                    )
+                )
+        for metric, old, new, min_delta in pairs:
+            old, new = old["p50"], new["p50"]
+            if new > old * (1 + tolerance) and new - old > min_delta:
+                regressions.append(f"{name} {metric}: {old:.4f} -> {new:.4f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--audio", default=DEFAULT_AUDIO, help="Fixture audio file")
+    parser.add_argument(
+        "--durations",
+        type=float,
+        nargs="*",
+        default=[60, 180],
+        help="Seconds of the tiled copies of the fixture",
+    )
+    parser.add_argument("--model", default="tiny.en", help="Whisper model name")
+    parser.add_argument("--language", default="en", help="Language code")
+    parser.add_argument(
+        "--stemming", action="store_true", help="Separate vocals with Demucs first"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=8, help="Fixed batch size, for stable timings"
+    )
+    parser.add_argument("--repeats", type=int, default=3, help="Measured runs per input")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured runs first")
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the results to this file")
+    parser.add_argument(
+        "--baseline", default=None, help="Results of an earlier run to compare with"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed growth of median stage latency over the baseline",
+    )
+    args = parser.parse_args()
+
+    import torch
+
+    from model_pool import ModelPool
+
+    torch.manual_seed(args.seed)
+    np.random.seed(args.seed)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    # one pool for all runs, so only the warmup runs load models
+    model_pool = ModelPool()
+    with tempfile.TemporaryDirectory() as directory:
+        inputs = prepare_inputs(args.audio, args.durations, directory)
+        results = {"environment": environment(args), "inputs": {}}
+        for name, (path, duration) in inputs.items():
+            print(f"{name}:")
+            results["inputs"][name] = benchmark_input(path, duration, args, model_pool)
+
+    for name, result in results["inputs"].items():
+        print(
+            f"{name:>16} {result['audio_duration_s']:>8.1f} s audio, "
+            f"RTF p50 {result['real_time_factor']['p50']:.3f}, "
+            f"peak RSS {result['peak_rss_mb']} MB"
+        )
+        for stage, timings in result["stages"].items():
+            wall = timings["wall_s"]
+            print(
+                f"{'':>18}{stage:<24} p50 {wall['p50']:>8.3f} s  "
+                f"p90 {wall['p90']:>8.3f} s  p99 {wall['p99']:>8.3f} s"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No stage slower than {args.tolerance:.0%} over the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Scaling benchmark of the post-processing helpers every job runs.
+
+Generates synthetic word timestamps and speaker turns of 1k to 1M words and
+measures the time and peak allocations of get_words_speaker_mapping,
+get_realigned_ws_mapping_with_punctuation, get_sentences_speaker_mapping and
+write_srt, each on the output of the previous one. Exits with an error when
+a helper scales worse than near-linearly between two sizes, which catches
+quadratic regressions.
+
+Usage:
+    python benchmarks/postprocessing.py  # the 1M word run takes several minutes
+    python benchmarks/postprocessing.py --words 1000 10000 100000 --repeats 5
+    python benchmarks/postprocessing.py --max-exponent 1.3 --output post.json
+"""
+import argparse
+import gc
+import io
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import synthetic_stream  # noqa: E402
+from helpers import (  # noqa: E402
+    get_realigned_ws_mapping_with_punctuation,
+    get_sentences_speaker_mapping,
+    get_words_speaker_mapping,
+    write_srt,
+)
+
+# Smaller transcripts are dominated by fixed costs and timer noise
+MIN_SCALING_WORDS = 10_000
+
+
+def stages(words, turns):
+    """(name, fn, args) of each helper, fed with the previous helper's output."""
+    wsm = get_words_speaker_mapping(words, turns)
+    realigned = get_realigned_ws_mapping_with_punctuation(wsm)
+    ssm = get_sentences_speaker_mapping(realigned, turns)
+    return [
+        ("get_words_speaker_mapping", get_words_speaker_mapping, (words, turns)),
+        (
+            "get_realigned_ws_mapping_with_punctuation",
+            get_realigned_ws_mapping_with_punctuation,
+            (wsm,),
+        ),
+        ("get_sentences_speaker_mapping", get_sentences_speaker_mapping, (realigned, turns)),
+        ("write_srt", lambda ssm: write_srt(ssm, io.StringIO()), (ssm,)),
+    ]
+
+
+def measure(fn, args, repeats: int) -> dict:
+    """Best wall time of `repeats` runs, then peak allocations of one traced run."""
+    best = math.inf
+    # like timeit, collections triggered by the inputs' objects aren't timed
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            started = time.perf_counter()
+            fn(*args)
+            best = min(best, time.perf_counter() - started)
+    finally:
+        gc.enable()
+
+    # traced separately, tracemalloc slows allocations down several times
+    tracemalloc.start()
+    try:
+        fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak}
+
+
+def scaling_exponents(sizes: list[int], values: list[float]) -> list[float]:
+    """Exponent k of value ~ size^k between consecutive sizes."""
+    return [
+        math.log(v2 / v1) / math.log(n2 / n1)
+        for (n1, v1), (n2, v2) in zip(zip(sizes, values), zip(sizes[1:], values[1:]))
+        if v1 > 0 and v2 > 0
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--words", type=int, nargs="+", default=[1000, 10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per size")
+    parser.add_argument(
+        "--max-exponent",
+        type=float,
+        default=1.25,
+        help="Largest allowed k of time ~ words^k between sizes",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    sizes = sorted(args.words)
+    results: dict[str, dict[int, dict]] = {}
+    print(f"{'helper':<42} {'words':>9} {'time (s)':>10} {'us/word':>8} {'peak MB':>9}")
+    for num_words in sizes:
+        words, turns = synthetic_stream(num_words, args.seed)
+        for name, fn, fn_args in stages(words, turns):
+            result = measure(fn, fn_args, args.repeats)
+            results.setdefault(name, {})[num_words] = result
+            print(
+                f"{name:<42} {num_words:>9} {result['seconds']:>10.4f} "
+                f"{result['seconds'] / num_words * 1e6:>8.2f} "
+                f"{result['peak_bytes'] / 2**20:>9.1f}"
+            )
+
+    failures = []
+    for name, by_size in results.items():
+        scaled = [n for n in sizes if n >= MIN_SCALING_WORDS] or sizes
+        for metric in ("seconds", "peak_bytes"):
+            exponents = scaling_exponents(scaled, [by_size[n][metric] for n in scaled])
+            worst = max(exponents, default=None)
+            if worst is not None and worst > args.max_exponent:
+                failures.append(f"{name} {metric} grows as words^{worst:.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            results_by_name = {
+                name: {str(n): result for n, result in by_size.items()}
+                for name, by_size in results.items()
+            }
+            json.dump(results_by_name, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if failures:
+        print("Worse than linear scaling:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"All helpers scale within words^{args.max_exponent}")
+
+
+if __name__ == "__main__":
+    main()
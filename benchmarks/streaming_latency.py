@@ -0,0 +1,147 @@
+"""
+Replays an audio file as a live stream and reports the streaming latency.
+
+The file is fed in real time (or faster with --speed) either to an
+in-process StreamingSession or to the /stream WebSocket of a running API.
+Committed segments are printed as they arrive, followed by latency
+percentiles measured from sending the newest audio of a pass to receiving
+its results.
+
+Usage:
+    python benchmarks/streaming_latency.py
+    python benchmarks/streaming_latency.py --model tiny.en --device cpu
+    python benchmarks/streaming_latency.py --url ws://localhost:8001/stream
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streaming import SAMPLING_RATE, StreamingSession  # noqa: E402
+
+DEFAULT_AUDIO = os.path.join(ROOT, "tests", "assets", "test.opus")
+CHUNK_SECONDS = 0.1
+
+
+def print_segment(segment: dict):
+    speaker = segment.get("speaker")
+    label = f"Speaker {speaker}" if speaker is not None else "-"
+    print(f"[{segment['start']:7.2f} - {segment['end']:7.2f}] {label}: {segment['text']}")
+
+
+def run_in_process(audio: np.ndarray, args) -> dict:
+    import faster_whisper
+
+    device = args.device or ("cuda" if _cuda_available() else "cpu")
+    whisper_model = faster_whisper.WhisperModel(
+        args.model, device=device, compute_type="float16" if device == "cuda" else "int8"
+    )
+    diarizer = None
+    if not args.no_speakers:
+        from diarization import MSDDDiarizer
+
+        diarizer = MSDDDiarizer(device=device)
+    session = StreamingSession(whisper_model, diarizer, language=args.language)
+
+    chunk = int(CHUNK_SECONDS * SAMPLING_RATE)
+    finished = threading.Event()
+
+    def feeder():
+        started = time.monotonic()
+        for offset in range(0, len(audio), chunk):
+            session.feed(audio[offset : offset + chunk])
+            # pace the stream like a live source
+            due = started + (offset + chunk) / SAMPLING_RATE / args.speed
+            time.sleep(max(due - time.monotonic(), 0))
+        finished.set()
+
+    threading.Thread(target=feeder, daemon=True).start()
+    while not finished.is_set():
+        if not session.ready():
+            time.sleep(0.02)
+            continue
+        committed, _ = session.step()
+        for segment in committed:
+            print_segment(segment.to_dict())
+    committed, _ = session.step(final=True)
+    for segment in committed:
+        print_segment(segment.to_dict())
+    return session.latency_stats()
+
+
+async def run_websocket(audio: np.ndarray, args) -> dict:
+    import websockets
+
+    url = f"{args.url}?whisper_model={args.model}&encoding=pcm_f32le"
+    if args.language:
+        url += f"&language={args.language}"
+    if args.no_speakers:
+        url += "&speaker_labels=false"
+
+    async with websockets.connect(url, max_size=None) as ws:
+
+        async def sender():
+            chunk = int(CHUNK_SECONDS * SAMPLING_RATE)
+            started = time.monotonic()
+            for offset in range(0, len(audio), chunk):
+                await ws.send(audio[offset : offset + chunk].astype("<f4").tobytes())
+                due = started + (offset + chunk) / SAMPLING_RATE / args.speed
+                await asyncio.sleep(max(due - time.monotonic(), 0))
+            await ws.send(json.dumps({"type": "stop"}))
+
+        send_task = asyncio.create_task(sender())
+        async for message in ws:
+            event = json.loads(message)
+            if event["type"] == "segment":
+                print_segment(event)
+            elif event["type"] == "done":
+                await send_task
+                return event["latency"]
+    return {}
+
+
+def _cuda_available() -> bool:
+    import torch
+
+    return torch.cuda.is_available()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--audio", default=DEFAULT_AUDIO, help="Audio file to replay")
+    parser.add_argument("--model", default="small.en", help="Whisper model name")
+    parser.add_argument("--language", default=None, help="Language code")
+    parser.add_argument("--device", default=None, help="cuda or cpu")
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="Playback speed, 1 is real time"
+    )
+    parser.add_argument(
+        "--no-speakers", action="store_true", help="Only transcribe, skip speaker labels"
+    )
+    parser.add_argument(
+        "--url", default=None, help="Stream to this /stream WebSocket instead"
+    )
+    args = parser.parse_args()
+
+    import faster_whisper
+
+    audio = faster_whisper.decode_audio(args.audio, sampling_rate=SAMPLING_RATE)
+    print(f"Streaming {len(audio) / SAMPLING_RATE:.1f} s of {args.audio}")
+
+    if args.url:
+        latency = asyncio.run(run_websocket(audio, args))
+    else:
+        latency = run_in_process(audio, args)
+    print(f"Latency (s): {latency}")
+
+
+if __name__ == "__main__":
+    main()
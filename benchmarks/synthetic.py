@@ -0,0 +1,55 @@
+"""
+Synthetic transcripts shared by the post-processing benchmarks.
+"""
+import random
+
+WORDS = ("so", "well", "right", "okay", "yes", "the", "data", "we", "model", "think")
+
+
+def synthetic_stream(num_words: int, seed: int = 0):
+    """
+    Word timestamps as they come out of alignment, and speaker turns that
+    don't line up with sentence ends, so realignment has work to do.
+    """
+    rng = random.Random(seed)
+    words, turns = [], []
+    t, turn_start, speaker = 0.0, 0.0, 0
+    for _ in range(num_words):
+        start = t + rng.uniform(0.0, 0.2)
+        end = start + rng.uniform(0.1, 0.6)
+        t = end
+        text = rng.choice(WORDS)
+        if rng.random() < 0.08:
+            text += rng.choice(".?!")
+        words.append({"text": text, "start": start, "end": end})
+        # turns end mid sentence, a little after the words they cover
+        if rng.random() < 0.02 and t - turn_start > 1.0:
+            turn_end = t + rng.uniform(-0.3, 0.3)
+            turns.append((int(turn_start * 1000), int(turn_end * 1000), speaker))
+            turn_start = turn_end
+            speaker = (speaker + rng.randint(1, 2)) % 3
+    turns.append((int(turn_start * 1000), int(t * 1000), speaker))
+    return words, turns
+
+
+def synthetic_transcript(num_words: int, seed: int = 0):
+    """Word speaker mapping and speaker turns of a made-up conversation."""
+    rng = random.Random(seed)
+    wsm, spk_ts = [], []
+    t, speaker = 0, 0
+    turn_start = 0
+    for i in range(num_words):
+        start = t + rng.randint(0, 200)
+        end = start + rng.randint(100, 600)
+        t = end
+        word = rng.choice(["so", "well", "right", "okay", "yes", "the", "data"])
+        if rng.random() < 0.1:
+            word += "."
+        wsm.append(
+            {"word": word, "start_time": start, "end_time": end, "speaker": speaker}
+        )
+        if rng.random() < 0.02 or i == num_words - 1:
+            spk_ts.append((turn_start, end, speaker))
+            turn_start = end
+            speaker = (speaker + 1) % 3
+    return wsm, spk_ts
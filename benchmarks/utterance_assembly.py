@@ -0,0 +1,80 @@
+"""
+Benchmark of assigning words to utterances in generate_output.
+
+Compares the old scan of every word for every sentence with the word ranges
+tracked by get_sentences_speaker_mapping, on synthetic transcripts, and checks
+that both give the same utterances.
+
+Usage:
+    python benchmarks/utterance_assembly.py --words 1000 10000 50000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import synthetic_transcript  # noqa: E402
+from helpers import get_sentences_speaker_mapping  # noqa: E402
+
+
+def words_of(wsm):
+    return [
+        {"word": w["word"], "start": w["start_time"] / 1000.0, "end": w["end_time"] / 1000.0}
+        for w in wsm
+    ]
+
+
+def scan_assembly(words, ssm):
+    """Previous implementation, every word checked for every sentence."""
+    return [
+        [
+            w
+            for w in words
+            if w["start"] >= sentence_dict["start_time"] / 1000.0
+            and w["end"] <= sentence_dict["end_time"] / 1000.0 + 0.1
+        ]
+        for sentence_dict in ssm
+    ]
+
+
+def range_assembly(words, ssm):
+    return [
+        words[sentence_dict["word_start_idx"] : sentence_dict["word_end_idx"]]
+        for sentence_dict in ssm
+    ]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--words", type=int, nargs="+", default=[1000, 10000, 50000]
+    )
+    args = parser.parse_args()
+
+    print(f"{'words':>8} {'utterances':>10} {'scan (s)':>10} {'range (s)':>10} {'speedup':>8}")
+    for num_words in args.words:
+        wsm, spk_ts = synthetic_transcript(num_words)
+        ssm = get_sentences_speaker_mapping(wsm, spk_ts)
+        words = words_of(wsm)
+
+        scanned, scan_time = timed(scan_assembly, words, ssm)
+        ranged, range_time = timed(range_assembly, words, ssm)
+        if scanned != ranged:
+            sys.exit(f"Utterance words differ for {num_words} words")
+
+        print(
+            f"{num_words:>8} {len(ssm):>10} {scan_time:>10.4f} {range_time:>10.4f} "
+            f"{scan_time / max(range_time, 1e-9):>7.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark of assigning speakers to words in get_words_speaker_mapping.
+
+Compares the previous walk over the speaker turns word by word with the
+binary search over running maxima, on synthetic transcripts and on random
+edge cases (overlapping turns, out of order words, words past the last
+turn), and checks that both give the same mapping for every anchor.
+
+Usage:
+    python benchmarks/word_speaker_mapping.py --words 10000 100000 1000000
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from benchmarks.synthetic import synthetic_stream  # noqa: E402
+from helpers import (  # noqa: E402
+    assign_word_speakers,
+    get_word_ts_anchor,
+    get_words_speaker_mapping,
+)
+
+ANCHORS = ("start", "mid", "end")
+
+
+def walk_mapping(wrd_ts, spk_ts, word_anchor_option="start"):
+    """Previous implementation, one turn at a time."""
+    s, e, sp = spk_ts[0]
+    wrd_pos, turn_idx = 0, 0
+    wrd_spk_mapping = []
+    for wrd_dict in wrd_ts:
+        ws, we, wrd = (
+            int(wrd_dict["start"] * 1000),
+            int(wrd_dict["end"] * 1000),
+            wrd_dict["text"],
+        )
+        wrd_pos = get_word_ts_anchor(ws, we, word_anchor_option)
+        while wrd_pos > float(e):
+            turn_idx += 1
+            turn_idx = min(turn_idx, len(spk_ts) - 1)
+            s, e, sp = spk_ts[turn_idx]
+            if turn_idx == len(spk_ts) - 1:
+                e = get_word_ts_anchor(ws, we, option="end")
+        wrd_spk_mapping.append(
+            {"word": wrd, "start_time": ws, "end_time": we, "speaker": sp}
+        )
+    return wrd_spk_mapping
+
+
+def random_case(rng: random.Random):
+    """Small transcript with overlapping turns and jittered word order."""
+    words = []
+    for _ in range(rng.randint(0, 40)):
+        start = rng.uniform(0, 30)
+        if words and rng.random() < 0.8:
+            start = words[-1]["end"] + rng.uniform(-0.5, 1.0)
+        start = max(start, 0.0)
+        words.append({"text": "w", "start": start, "end": start + rng.uniform(0, 1)})
+    turns = []
+    for _ in range(rng.randint(1, 8)):
+        start = rng.randint(0, 30_000)
+        turns.append((start, start + rng.randint(0, 10_000), rng.randint(0, 3)))
+    turns.sort(key=lambda x: x[0])
+    return words, turns
+
+
+def timed(fn, *args):
+    # collections of the million word dicts would dominate both timings
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        result = fn(*args)
+        return result, time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--words", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--cases", type=int, default=20_000, help="Random edge cases")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for case in range(args.cases):
+        words, turns = random_case(rng)
+        for anchor in ANCHORS:
+            if walk_mapping(words, turns, anchor) != get_words_speaker_mapping(
+                words, turns, anchor
+            ):
+                sys.exit(f"Mappings differ for case {case} with the {anchor} anchor")
+    print(f"{args.cases} random cases match for every anchor")
+
+    # "arrays" is assign_word_speakers alone, for callers that hold arrays
+    print(
+        f"{'words':>8} {'anchor':>6} {'walk (s)':>10} {'search (s)':>10} "
+        f"{'speedup':>8} {'arrays (s)':>10}"
+    )
+    for num_words in args.words:
+        words, turns = synthetic_stream(num_words)
+        starts = np.array([int(w["start"] * 1000) for w in words])
+        ends = np.array([int(w["end"] * 1000) for w in words])
+        turn_ends = np.array([e for _, e, _ in turns])
+        for anchor in ANCHORS:
+            walked, walk_time = timed(walk_mapping, words, turns, anchor)
+            searched, search_time = timed(get_words_speaker_mapping, words, turns, anchor)
+            if walked != searched:
+                sys.exit(f"Mappings differ for {num_words} words with the {anchor} anchor")
+            _, array_time = timed(assign_word_speakers, starts, ends, turn_ends, anchor)
+            print(
+                f"{num_words:>8} {anchor:>6} {walk_time:>10.4f} {search_time:>10.4f} "
+                f"{walk_time / max(search_time, 1e-9):>7.1f}x {array_time:>10.4f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
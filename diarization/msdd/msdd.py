@@ -1,23 +1,422 @@
+import contextlib
 import json
 import os
 import tempfile
+import threading
 
-from typing import Union
+from itertools import combinations
+from typing import Callable, ContextManager, Union
 
+import nemo
 import torch
 import torchaudio
 
 from nemo.collections.asr.models.msdd_models import NeuralDiarizer
-from nemo.collections.asr.parts.utils.speaker_utils import rttm_to_labels
+from nemo.collections.asr.parts.utils.longform_clustering import (
+    LongFormSpeakerClustering,
+)
+from nemo.collections.asr.parts.utils.speaker_utils import (
+    generate_speaker_timestamps,
+    get_scale_mapping_argmat,
+    get_sub_range_list,
+    get_subsegments_scriptable,
+    merge_float_intervals,
+    rttm_to_labels,
+)
+from nemo.collections.asr.parts.utils.vad_utils import (
+    generate_overlap_vad_seq_per_tensor,
+    generate_vad_segment_table_per_tensor,
+    prepare_gen_segment_table,
+)
 from omegaconf import OmegaConf
 
+SAMPLING_RATE = 16000
+# VAD runs on chunks of this many seconds, like ClusteringDiarizer's auto split
+VAD_SPLIT_SECONDS = 50
+# Subsegments shorter than this are dropped before embedding extraction
+MIN_SUBSEGMENT_SECONDS = 0.05
+
 
 class MSDDDiarizer:
-    def __init__(self, device: Union[str, torch.device]):
+    """
+    NeMo's MSDD diarizer.
+
+    Args:
+        device: Device the models are loaded on
+        batch_size: Batch size of the file-based pipeline
+        in_memory: Diarize without files by running NeMo's steps on its
+            submodules. Off until benchmarks/diarization_parity.py has shown
+            the same turns as NeMo's file-based pipeline on real recordings.
+    """
+
+    def __init__(
+        self,
+        device: Union[str, torch.device],
+        batch_size: int = 24,
+        in_memory: bool = False,
+    ):
         self.model: NeuralDiarizer = NeuralDiarizer(cfg=create_config()).to(device)
+        self.batch_size = batch_size
+        self.in_memory = in_memory
+        # diarize_with_files() rewrites the model configs, calls must not interleave
+        self._lock = threading.Lock()
+
+        cfg = self.model._cfg.diarizer
+        clus_diar_model = self.model.clustering_embedding.clus_diar_model
+        self._vad_model = _submodule(clus_diar_model, "_vad_model").eval()
+        self._speaker_model = _submodule(clus_diar_model, "_speaker_model").eval()
+        self._msdd_model = _submodule(self.model, "msdd_model").eval()
+
+        self._vad_params = OmegaConf.to_container(cfg.vad.parameters)
+        embedding_params = cfg.speaker_embeddings.parameters
+        self._scales = list(
+            zip(
+                embedding_params.window_length_in_sec,
+                embedding_params.shift_length_in_sec,
+            )
+        )
+        self._multiscale_weights = list(embedding_params.multiscale_weights)
+        self._clustering_params = cfg.clustering.parameters
+        self._sigmoid_threshold = cfg.msdd_model.parameters.sigmoid_threshold[0]
+
+    def diarize(
+        self,
+        audio: torch.Tensor,
+        measure_step: Callable[[str], ContextManager] | None = None,
+    ) -> list[tuple[int, int, int]]:
+        """
+        Diarize a waveform, in memory or through NeMo's files depending on
+        `in_memory`.
+
+        Args:
+            audio: 16 kHz waveform, (samples,) or (1, samples)
+            measure_step: Optional context manager factory wrapped around
+                each of the "vad", "embeddings", "clustering" and "msdd"
+                steps of the in-memory path, e.g. to time them
+
+        Returns:
+            Sorted list of (start_ms, end_ms, speaker) turns
+        """
+        if self.in_memory:
+            return self.diarize_in_memory(audio, measure_step)
+        return self.diarize_with_files(audio.reshape(1, -1).float())
+
+    def diarize_in_memory(
+        self,
+        audio: torch.Tensor,
+        measure_step: Callable[[str], ContextManager] | None = None,
+    ) -> list[tuple[int, int, int]]:
+        """
+        Diarize a waveform without writing it, a manifest or RTTM files to
+        disk. Runs the same VAD, multiscale TitaNet embedding, clustering
+        and MSDD steps as NeuralDiarizer.diarize() on the loaded submodules.
+        """
+        audio = audio.reshape(-1).float()
+        step = measure_step or (lambda name: contextlib.nullcontext())
+
+        with step("vad"):
+            speech = self._detect_speech(audio)
+        if not speech:
+            return []
+
+        embeddings, timestamps = [], []
+        with step("embeddings"):
+            for window, shift in self._scales:
+                scale_timestamps = self._subsegments(speech, window, shift)
+                embeddings.append(self._extract_embeddings(audio, scale_timestamps))
+                timestamps.append(torch.tensor(scale_timestamps))
+        if len(timestamps[-1]) == 0:
+            return []
+
+        embs_and_timestamps = {
+            "embeddings": torch.cat(embeddings),
+            "timestamps": torch.cat(timestamps),
+            "multiscale_segment_counts": torch.tensor([len(e) for e in embeddings]),
+            "multiscale_weights": torch.tensor(self._multiscale_weights)
+            .unsqueeze(0)
+            .float(),
+        }
+        with step("clustering"):
+            cluster_labels = self._cluster(embs_and_timestamps)
+        scale_mapping = get_scale_mapping_argmat(embs_and_timestamps)
+
+        # base scale segments with their cluster label, like the .label file
+        # read back by ClusterEmbedding
+        clus_labels = [
+            [round(float(start), 2), round(float(end), 2), int(label)]
+            for (start, end), label in zip(timestamps[-1].tolist(), cluster_labels)
+        ]
+        with step("msdd"):
+            preds = self._run_msdd(embeddings, scale_mapping, cluster_labels)
+
+        maj_labels, ovl_labels = generate_speaker_timestamps(
+            clus_labels,
+            preds.unsqueeze(0),
+            threshold=self._sigmoid_threshold,
+            infer_overlap=True,
+            use_clus_as_main=self.model.use_clus_as_main,
+            overlap_infer_spk_limit=self.model.overlap_infer_spk_limit,
+            use_adaptive_thres=self.model.use_adaptive_thres,
+            max_overlap_spks=self.model.max_overlap_spks,
+        )
+
+        labels = []
+        for label in maj_labels + ovl_labels:
+            start, end, speaker = label.split()
+            # same rounding as the RTTM round trip of the file-based path
+            start = round(float(start), 3)
+            end = start + round(float(end) - float(start), 3)
+            labels.append(
+                (int(start * 1000), int(end * 1000), int(speaker.split("_")[1]))
+            )
+
+        return sorted(labels, key=lambda x: x[0])
+
+    def embed(self, audio: torch.Tensor, timestamps: list[list[float]]) -> torch.Tensor:
+        """
+        TitaNet embeddings of [start, end] windows in seconds of a 16 kHz
+        waveform, one row per window.
+        """
+        return self._extract_embeddings(audio.reshape(-1).float(), timestamps)
+
+    @torch.no_grad()
+    def _detect_speech(self, audio: torch.Tensor) -> list[list[float]]:
+        """Speech segments as [start, end] in seconds."""
+        window = self._vad_params["window_length_in_sec"]
+        shift = self._vad_params["shift_length_in_sec"]
+        slice_length = int(SAMPLING_RATE * window)
+        hop = int(SAMPLING_RATE * shift)
+        frames_per_window = int(window / shift)
+        trunc = frames_per_window // 2
+        trunc_l = frames_per_window - trunc
+        device = self._vad_model.device
+
+        chunks = _vad_chunks(len(audio) / SAMPLING_RATE, VAD_SPLIT_SECONDS, window)
+        frames = []
+        for offset, duration, status in chunks:
+            start = int(offset * SAMPLING_RATE)
+            signal = audio[start : start + int(duration * SAMPLING_RATE)]
+            length = min(slice_length, len(signal))
+            # centre a window on every frame, like the vad_stream collate function
+            padded = torch.cat(
+                [
+                    torch.zeros(length // 2),
+                    signal,
+                    torch.zeros(length - length // 2),
+                ]
+            )
+            windows = padded.unfold(0, length, hop)[: len(signal) // hop]
+            if len(windows) == 0:
+                continue
+
+            with torch.autocast(device.type, enabled=device.type == "cuda"):
+                log_probs = self._vad_model(
+                    input_signal=windows.to(device),
+                    input_signal_length=torch.full(
+                        (len(windows),), length, device=device
+                    ),
+                )
+            pred = torch.softmax(log_probs, dim=-1)[:, 1].float().cpu()
 
-    def diarize(self, audio: torch.Tensor):
-        with tempfile.TemporaryDirectory() as temp_path:
+            if status == "start":
+                pred = pred[:-trunc]
+            elif status == "next":
+                pred = pred[trunc:-trunc_l]
+            elif status == "end":
+                pred = pred[trunc_l:]
+            frames.append(pred)
+
+        if not frames:
+            return []
+
+        # predictions are rounded like the .frame files NeMo writes
+        frame_preds = torch.round(torch.cat(frames), decimals=4)
+        if self._vad_params["smoothing"]:
+            frame_preds = generate_overlap_vad_seq_per_tensor(
+                frame_preds,
+                {
+                    "overlap": float(self._vad_params["overlap"]),
+                    "window_length_in_sec": float(window),
+                    "shift_length_in_sec": float(shift),
+                },
+                self._vad_params["smoothing"],
+            )
+            frame_preds = torch.round(frame_preds, decimals=4)
+
+        _, per_args = prepare_gen_segment_table(
+            frame_preds, {**self._vad_params, "frame_length_in_sec": 0.01}
+        )
+        table = generate_vad_segment_table_per_tensor(frame_preds, per_args)
+        if table.shape == torch.Size([0]):
+            return []
+
+        ranges = []
+        for start, _, duration in table.tolist():
+            start, duration = round(start, 4), round(duration, 4)
+            ranges.append([start, start + duration])
+        speech = get_sub_range_list(
+            target_range=[0.0, len(audio) / SAMPLING_RATE],
+            source_range_list=merge_float_intervals(ranges, decimals=5),
+        )
+        return [[round(start, 5), round(end, 5)] for start, end in speech]
+
+    @staticmethod
+    def _subsegments(
+        speech: list[list[float]], window: float, shift: float
+    ) -> list[list[float]]:
+        """Split the speech segments into [start, end] windows of one scale."""
+        subsegments = []
+        for start, end in speech:
+            for offset, duration in get_subsegments_scriptable(
+                offset=start, window=window, shift=shift, duration=end - start
+            ):
+                if duration > MIN_SUBSEGMENT_SECONDS:
+                    subsegments.append([offset, offset + duration])
+        return subsegments
+
+    @torch.no_grad()
+    def _extract_embeddings(
+        self, audio: torch.Tensor, timestamps: list[list[float]]
+    ) -> torch.Tensor:
+        """TitaNet embeddings of the given [start, end] windows."""
+        device = self._speaker_model.device
+        embeddings = []
+        for i in range(0, len(timestamps), self.batch_size):
+            segments = []
+            for start, end in timestamps[i : i + self.batch_size]:
+                offset = int(start * SAMPLING_RATE)
+                segments.append(
+                    audio[offset : offset + int((end - start) * SAMPLING_RATE)]
+                )
+
+            # short segments are tiled to the longest one in the batch,
+            # like the speaker model's fixed_seq_collate_fn
+            fixed_length = max(len(segment) for segment in segments)
+            batch = torch.stack(
+                [
+                    segment.repeat(fixed_length // len(segment) + 1)[:fixed_length]
+                    if len(segment) < fixed_length
+                    else segment
+                    for segment in segments
+                ]
+            ).to(device)
+            lengths = torch.full((len(segments),), fixed_length, device=device)
+
+            with torch.autocast(device.type, enabled=device.type == "cuda"):
+                _, embs = self._speaker_model.forward(
+                    input_signal=batch, input_signal_length=lengths
+                )
+            embeddings.append(embs.view(-1, embs.shape[-1]).float().cpu())
+
+        if not embeddings:
+            return torch.empty(0, 0)
+        return torch.cat(embeddings)
+
+    def _cluster(self, embs_and_timestamps: dict) -> list[int]:
+        """Cluster labels of the base scale segments."""
+        params = self._clustering_params
+        speaker_clustering = LongFormSpeakerClustering(
+            cuda=self._speaker_model.device.type == "cuda"
+        )
+        cluster_labels = speaker_clustering.forward_infer(
+            embeddings_in_scales=embs_and_timestamps["embeddings"],
+            timestamps_in_scales=embs_and_timestamps["timestamps"],
+            multiscale_segment_counts=embs_and_timestamps["multiscale_segment_counts"],
+            multiscale_weights=embs_and_timestamps["multiscale_weights"],
+            oracle_num_speakers=-1,
+            max_num_speakers=int(params.max_num_speakers),
+            max_rp_threshold=float(params.max_rp_threshold),
+            sparse_search_volume=int(params.sparse_search_volume),
+            chunk_cluster_count=params.get("chunk_cluster_count", None),
+            embeddings_per_chunk=params.get("embeddings_per_chunk", None),
+        )
+        return cluster_labels.cpu().tolist()
+
+    @torch.no_grad()
+    def _run_msdd(
+        self,
+        embeddings: list[torch.Tensor],
+        scale_mapping: dict[int, torch.Tensor],
+        cluster_labels: list[int],
+    ) -> torch.Tensor:
+        """
+        Pairwise MSDD inference with cluster averages computed per window
+        (the split_infer mode of the bundled config).
+
+        Returns:
+            Speaker probabilities, (base scale segments, speakers)
+        """
+        window_length = self.model.diar_window_length
+        infer_batch_size = self._msdd_model.cfg.test_ds.batch_size
+        device = self._msdd_model.device
+
+        # (base segments, scales, emb_dim), each scale repeated onto the base scale
+        ms_emb_seq = torch.stack(
+            [embeddings[scale][scale_mapping[scale]] for scale in range(len(embeddings))]
+        ).permute(1, 0, 2)
+        n_segments, n_scales, emb_dim = ms_emb_seq.shape
+        labels = torch.tensor(cluster_labels)
+
+        speakers = sorted(set(cluster_labels))
+        speaker_pairs = (
+            [(0, 1)] if len(speakers) <= 2 else list(combinations(speakers, 2))
+        )
+        n_windows = -(-n_segments // window_length)
+
+        pair_preds = []
+        for i in range(0, len(speaker_pairs), infer_batch_size):
+            pairs = speaker_pairs[i : i + infer_batch_size]
+            avg_embs, emb_seqs, seq_lengths = [], [], []
+            for pair in pairs:
+                for window in range(n_windows):
+                    start = window * window_length
+                    end = min(start + window_length, n_segments)
+                    emb_seq = ms_emb_seq[start:end]
+                    window_avg = torch.zeros(n_scales, emb_dim, 2)
+                    for spk_idx, speaker in enumerate(pair):
+                        mask = labels[start:end] == speaker
+                        if mask.any():
+                            window_avg[:, :, spk_idx] = emb_seq[mask].mean(dim=0)
+                    if end - start < window_length:
+                        emb_seq = torch.cat(
+                            [
+                                emb_seq,
+                                torch.zeros(
+                                    window_length - (end - start), n_scales, emb_dim
+                                ),
+                            ]
+                        )
+                    avg_embs.append(window_avg)
+                    emb_seqs.append(emb_seq)
+                    seq_lengths.append(end - start)
+
+            with torch.autocast(device.type, enabled=device.type == "cuda"):
+                preds, _ = self._msdd_model.forward_infer(
+                    input_signal=torch.stack(emb_seqs).to(device),
+                    input_signal_length=torch.tensor(seq_lengths, device=device),
+                    emb_vectors=torch.stack(avg_embs).to(device),
+                    targets=None,
+                )
+            preds = preds.float().cpu().reshape(len(pairs), n_windows * window_length, -1)
+            pair_preds.extend(zip(pairs, preds[:, :n_segments]))
+
+        # average the pairwise predictions per speaker, like NeuralDiarizer.get_pred_mat
+        speakers = sorted({speaker for pair, _ in pair_preds for speaker in pair})
+        if len(speakers) <= 2:
+            return pair_preds[0][1]
+        digit_map = {speaker: idx for idx, speaker in enumerate(speakers)}
+        summed = torch.zeros(n_segments, len(speakers))
+        for pair, pred in pair_preds:
+            summed[:, [digit_map[speaker] for speaker in pair]] += pred
+        return summed / (len(speakers) - 1)
+
+    def diarize_with_files(self, audio: torch.Tensor):
+        """
+        Diarize through NeMo's file-based pipeline: writes the audio and a
+        manifest to a temporary directory and parses the predicted RTTM.
+        The reference `diarize_in_memory` is checked against.
+        """
+        with self._lock, tempfile.TemporaryDirectory() as temp_path:
             torchaudio.save(
                 os.path.join(temp_path, "mono_file.wav"),
                 audio,
@@ -44,7 +443,7 @@ class MSDDDiarizer:
                 max_speakers=8,
                 num_speakers=None,
                 tmpdir=temp_path,
-                batch_size=24,
+                batch_size=self.batch_size,
                 num_workers=0,
                 verbose=True,
             )
@@ -73,6 +472,60 @@ class MSDDDiarizer:
         return labels
 
 
+def _submodule(owner, name: str) -> torch.nn.Module:
+    """
+    A submodule of a NeMo model, some of them private. `diarize` runs them
+    directly, so a NeMo release that renames or replaces one fails here
+    instead of diarizing differently.
+    """
+    module = getattr(owner, name, None)
+    if not isinstance(module, torch.nn.Module):
+        raise RuntimeError(
+            f"{type(owner).__name__}.{name} is not a module in NeMo "
+            f"{nemo.__version__}, MSDDDiarizer relies on it. Use a NeMo "
+            "version that has it, and check benchmarks/diarization_parity.py "
+            "still passes after adapting MSDDDiarizer to a new one."
+        )
+    return module
+
+
+def _vad_chunks(
+    duration: float, split_duration: float, window: float
+) -> list[tuple[float, float, str]]:
+    """
+    Split a recording into (offset, duration, status) chunks for VAD, with
+    the same overlap and stream status as NeMo's write_vad_infer_manifest.
+    """
+    chunks = []
+    left = duration
+    offset = 0.0
+    status = "single"
+    while left > 0:
+        if left <= split_duration:
+            if status == "single":
+                chunk_duration = left
+                offset = 0.0
+            else:
+                status = "end"
+                chunk_duration = left + window
+                offset -= window
+            step = left
+            left = 0
+        else:
+            status = "next" if status in ("start", "next") else "start"
+            if status == "start":
+                chunk_duration = split_duration
+                step = split_duration
+            else:
+                chunk_duration = split_duration + window
+                offset -= window
+                step = split_duration + window
+            left -= split_duration
+        chunks.append((offset, chunk_duration, status))
+        offset += step
+    return chunks
+
+
 def create_config():
     config = OmegaConf.load(
         os.path.join(os.path.dirname(__file__), "diar_infer_telephonic.yaml")
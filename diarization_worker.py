@@ -0,0 +1,222 @@
+"""
+Persistent diarization process running next to transcription.
+The NeMo models are loaded once in a spawned child process. Audio is handed
+over through shared memory instead of being pickled through a queue, so
+diarizing a job only costs one copy of the waveform.
+"""
+import logging
+import multiprocessing as mp
+import sys
+import threading
+from concurrent.futures import Future
+from itertools import count
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import torch
+
+# (start_ms, end_ms, speaker)
+SpeakerTurn = tuple[int, int, int]
+
+_workers: dict[str, "DiarizationWorker"] = {}
+_workers_lock = threading.Lock()
+
+
+def _attach(name: str) -> SharedMemory:
+    """
+    Open a block of shared memory the parent created and unlinks, without
+    registering it with the resource tracker. Spawned children share the
+    parent's tracker, and before Python 3.13 attaching registers the block,
+    so unregistering it afterwards would drop the parent's registration and
+    the parent's unlink() would make the tracker log a KeyError.
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _worker_main(device: str, requests: mp.Queue, results: mp.Queue):
+    """Entry point of the child process."""
+    from diarization import MSDDDiarizer
+
+    diarizer = MSDDDiarizer(device=device)
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        request_id, shm_name, num_samples = request
+
+        try:
+            shm = _attach(shm_name)
+        except FileNotFoundError:
+            # withdrawn by DiarizationWorker.cancel while it was queued
+            continue
+        try:
+            audio = np.ndarray((num_samples,), dtype=np.float32, buffer=shm.buf)
+            turns = diarizer.diarize(torch.from_numpy(audio))
+            results.put((request_id, turns, None))
+        except Exception as e:
+            logging.exception("Diarization failed in worker process")
+            results.put((request_id, None, f"{type(e).__name__}: {e}"))
+        finally:
+            # views of the buffer must be gone before it can be closed
+            audio = None
+            shm.close()
+
+
+class DiarizationWorker:
+    """
+    Diarizes audio in a long-lived child process.
+
+    `submit()` returns immediately with a future, so the caller can
+    transcribe while the child diarizes. The child is started on first use
+    and restarted if it dies; requests in flight at that moment fail.
+    `cancel()` withdraws the request of a job that stopped early.
+
+    Args:
+        device: Device the diarization models are loaded on
+    """
+
+    def __init__(self, device: str):
+        self.device = device
+        self._ctx = mp.get_context("spawn")
+        self._process: mp.Process | None = None
+        self._requests: mp.Queue | None = None
+        self._results: mp.Queue | None = None
+        self._pending: dict[int, tuple[Future, SharedMemory]] = {}
+        self._ids = count()
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._process is not None and self._process.is_alive():
+            return
+        if self._process is not None:
+            logging.warning("Diarization worker process died, restarting it")
+            self._fail_pending(RuntimeError("Diarization worker process died"))
+
+        self._requests = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.device, self._requests, self._results),
+            name="diarization-worker",
+            daemon=True,
+        )
+        self._process.start()
+        threading.Thread(
+            target=self._collect_results,
+            args=(self._process, self._results),
+            name="diarization-results",
+            daemon=True,
+        ).start()
+
+    def submit(self, audio: np.ndarray | torch.Tensor) -> "Future[list[SpeakerTurn]]":
+        """
+        Queue a 16 kHz mono waveform for diarization.
+
+        Returns:
+            Future resolving to the sorted speaker turns
+        """
+        samples = np.asarray(audio, dtype=np.float32).reshape(-1)
+        shm = SharedMemory(create=True, size=max(samples.nbytes, 1))
+        np.ndarray(samples.shape, dtype=np.float32, buffer=shm.buf)[:] = samples
+
+        future: Future = Future()
+        with self._lock:
+            self._ensure_started()
+            request_id = next(self._ids)
+            self._pending[request_id] = (future, shm)
+            self._requests.put((request_id, shm.name, len(samples)))
+        return future
+
+    def cancel(self, future: Future) -> bool:
+        """
+        Withdraw a request whose result is no longer wanted and free its
+        shared memory. The child skips the request if it is still queued,
+        one it is already diarizing runs to the end and its result is
+        dropped.
+
+        Returns:
+            Whether the request was still pending
+        """
+        with self._lock:
+            for request_id, (pending, shm) in self._pending.items():
+                if pending is future:
+                    del self._pending[request_id]
+                    break
+            else:
+                return False
+        _free(shm)
+        future.cancel()
+        return True
+
+    def diarize(self, audio: np.ndarray | torch.Tensor) -> list[SpeakerTurn]:
+        """Diarize and wait for the result."""
+        return self.submit(audio).result()
+
+    def _collect_results(self, process: mp.Process, results: mp.Queue):
+        while True:
+            try:
+                request_id, turns, error = results.get(timeout=1.0)
+            except Exception:
+                # queue.Empty, or the queue broke because the child died
+                if not process.is_alive():
+                    with self._lock:
+                        if self._process is process:
+                            self._fail_pending(
+                                RuntimeError("Diarization worker process died")
+                            )
+                    return
+                continue
+
+            with self._lock:
+                future, shm = self._pending.pop(request_id, (None, None))
+            if future is None:
+                continue
+            _free(shm)
+            if error is None:
+                future.set_result(turns)
+            else:
+                future.set_exception(RuntimeError(error))
+
+    def _fail_pending(self, error: Exception):
+        for future, shm in self._pending.values():
+            _free(shm)
+            future.set_exception(error)
+        self._pending.clear()
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def close(self):
+        """Stop the child process after the queued requests."""
+        with self._lock:
+            process, self._process = self._process, None
+            if process is None:
+                return
+            self._requests.put(None)
+        process.join()
+        with self._lock:
+            self._fail_pending(RuntimeError("Diarization worker closed"))
+
+
+def _free(shm: SharedMemory):
+    shm.close()
+    shm.unlink()
+
+
+def get_diarization_worker(device: str) -> DiarizationWorker:
+    """Process-wide worker for the device, shared by all jobs."""
+    with _workers_lock:
+        if device not in _workers:
+            _workers[device] = DiarizationWorker(device)
+        return _workers[device]
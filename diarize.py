@@ -17,7 +17,6 @@ from ctc_forced_aligner import (
 from deepmultilingualpunctuation import PunctuationModel
 
 from helpers import (
-    cleanup,
     find_numeral_symbol_tokens,
     get_realigned_ws_mapping_with_punctuation,
     get_sentences_speaker_mapping,
@@ -29,14 +28,10 @@ from helpers import (
     whisper_langs,
     write_srt,
 )
+from vocal_separation import VocalSeparator
 
 mtypes = {"cpu": "int8", "cuda": "float16"}
 
-pid = os.getpid()
-temp_outputs_dir = f"temp_outputs_{pid}"
-temp_path = os.path.join(os.getcwd(), "temp_outputs")
-os.makedirs(temp_path, exist_ok=True)
-
 # Initialize parser
 parser = argparse.ArgumentParser()
 parser.add_argument(
@@ -101,28 +96,21 @@ parser.add_argument(
 args = parser.parse_args()
 language = process_language_arg(args.language, args.model_name)
 
+audio_waveform = faster_whisper.decode_audio(args.audio)
+
 if args.stemming:
     # Isolate vocals from the rest of the audio
-
-    return_code = os.system(
-        f'python -m demucs.separate -n htdemucs --two-stems=vocals "{args.audio}" -o "{temp_outputs_dir}" --device "{args.device}"'
-    )
-
-    if return_code != 0:
+    try:
+        separator = VocalSeparator(device=args.device)
+        audio_waveform = separator.separate(audio_waveform).numpy()
+        del separator
+    except Exception:
         logging.warning(
             "Source splitting failed, using original audio file. "
-            "Use --no-stem argument to disable it."
-        )
-        vocal_target = args.audio
-    else:
-        vocal_target = os.path.join(
-            temp_outputs_dir,
-            "htdemucs",
-            os.path.splitext(os.path.basename(args.audio))[0],
-            "vocals.wav",
+            "Use --no-stem argument to disable it.",
+            exc_info=True,
         )
-else:
-    vocal_target = args.audio
+    torch.cuda.empty_cache()
 
 
 # Transcribe the audio file
@@ -131,7 +119,6 @@ whisper_model = faster_whisper.WhisperModel(
     args.model_name, device=args.device, compute_type=mtypes[args.device]
 )
 whisper_pipeline = faster_whisper.BatchedInferencePipeline(whisper_model)
-audio_waveform = faster_whisper.decode_audio(vocal_target)
 suppress_tokens = (
     find_numeral_symbol_tokens(whisper_model.hf_tokenizer)
     if args.suppress_numerals
@@ -243,5 +230,3 @@ with open(f"{os.path.splitext(args.audio)[0]}.txt", "w", encoding="utf-8-sig") a
 
 with open(f"{os.path.splitext(args.audio)[0]}.srt", "w", encoding="utf-8-sig") as srt:
     write_srt(ssm, srt)
-
-cleanup(temp_path)
@@ -4,9 +4,11 @@ Returns Deepgram-compatible response format.
 """
 import io
 import logging
-import os
 import re
-from typing import Callable
+import threading
+from concurrent.futures import Future, TimeoutError
+from dataclasses import dataclass, field
+from typing import Any, Callable
 from uuid import uuid4
 
 import faster_whisper
@@ -21,8 +23,16 @@ from ctc_forced_aligner import (
 )
 from deepmultilingualpunctuation import PunctuationModel
 
+from alignment import (
+    WINDOW_SECONDS,
+    TranscriptSegment,
+    build_windows,
+    iter_windowed_alignment,
+)
+from artifact_cache import ArtifactCache, artifact_key, file_sha256
+from audio_buffer import SAMPLING_RATE, AudioBuffer
+from batch_planner import is_out_of_memory, plan_batch_size, run_with_backoff
 from helpers import (
-    cleanup,
     find_numeral_symbol_tokens,
     get_realigned_ws_mapping_with_punctuation,
     get_sentences_speaker_mapping,
@@ -32,128 +42,443 @@ from helpers import (
     punct_model_langs,
     format_timestamp,
 )
+from instrumentation import TimingCallback, measure_stage
+from model_pool import ModelKey, ModelPool, estimate_whisper_size_mb
+from whisper_batching import CrossJobPipeline, WhisperBatcher
 
 MTYPES = {"cpu": "int8", "cuda": "float16"}
+PUNCT_MODEL_NAME = "kredor/punctuate-all"
+# Recordings at least this long are kept in a memory-mapped file
+AUDIO_MMAP_MIN_SECONDS = 3600
+ALIGNMENT_MODES = ("auto", "segments", "windowed", "full")
+# How often a job waiting for the diarization process checks for cancellation
+CANCEL_POLL_SECONDS = 1.0
 
 
-def run_diarization(
-    audio_path: str,
-    model_name: str = "medium.en",
-    language: str | None = None,
-    stemming: bool = True,
-    suppress_numerals: bool = False,
-    device: str | None = None,
-    batch_size: int = 8,
-    progress_callback: Callable[[str], None] | None = None,
-) -> dict:
-    """
-    Run full diarization pipeline on an audio file.
+class JobCancelled(Exception):
+    """Raised inside a job whose cancel event was set."""
 
-    Args:
-        audio_path: Path to audio file
-        model_name: Whisper model name (default: medium.en)
-        language: Language code or None for auto-detect
-        stemming: Whether to separate vocals from music
-        suppress_numerals: Convert digits to written text
-        device: "cuda" or "cpu" (auto-detect if None)
-        batch_size: Batch size for inference
-        progress_callback: Optional callback for progress updates
 
-    Returns:
-        dict with keys: transcript, srt, segments
-    """
-    if device is None:
-        device = "cuda" if torch.cuda.is_available() else "cpu"
+def pipeline_model_keys(model_name: str, device: str) -> dict[str, ModelKey]:
+    """Model pool keys of the models loaded by each pipeline stage."""
+    # PunctuationModel picks the GPU by itself whenever one is available
+    punct_device = "cuda" if torch.cuda.is_available() else "cpu"
+    return {
+        "separating_vocals": ("separator", "htdemucs", device, "float32"),
+        "transcribing": ("whisper", model_name, device, MTYPES[device]),
+        "aligning": (
+            "alignment",
+            "default",
+            device,
+            "float16" if device == "cuda" else "float32",
+        ),
+        "diarizing": ("diarizer", "msdd", device, "float32"),
+        "post_processing": ("punctuation", PUNCT_MODEL_NAME, punct_device, "float32"),
+    }
 
-    def update_progress(stage: str):
-        if progress_callback:
-            progress_callback(stage)
 
-    pid = os.getpid()
-    temp_outputs_dir = f"temp_outputs_{pid}"
+def _load_model(
+    model_pool: ModelPool | None,
+    key: ModelKey,
+    loader: Callable,
+    size_mb: float | None = None,
+):
+    """Load a model directly, or through the pool when one is given."""
+    if model_pool is None:
+        return loader()
+    return model_pool.get(*key, loader, size_mb)
 
-    # Process language argument
-    language = process_language_arg(language, model_name)
 
-    # Step 1: Audio preprocessing (optional stem separation)
-    update_progress("separating_vocals")
+@dataclass
+class DiarizationJob:
+    """
+    State of one audio file moving through the pipeline stages.
+    Each stage reads the outputs of the previous ones and fills in its own.
+    """
+
+    audio_path: str
+    model_name: str = "medium.en"
+    language: str | None = None
+    stemming: bool = True
+    suppress_numerals: bool = False
+    device: str | None = None
+    batch_size: int | None = None
+    progress_callback: Callable[[str], None] | None = None
+    event_callback: Callable[[str, dict], None] | None = None
+    model_pool: ModelPool | None = None
+    parallel_diarization: bool = False
+    alignment_mode: str = "auto"
+    artifact_cache: ArtifactCache | None = None
+    audio_sha256: str | None = None
+    whisper_batcher: WhisperBatcher | None = None
+    cancel_event: threading.Event | None = None
+    timing_callback: TimingCallback | None = None
+
+    # Stage outputs
+    audio: AudioBuffer | None = None
+    info: Any = None
+    transcript_segments: list[TranscriptSegment] | None = None
+    full_transcript: str | None = None
+    word_timestamps: list[dict] | None = None
+    speaker_ts: list[tuple[int, int, int]] | None = None
+    speaker_ts_future: Future | None = None
+    wsm: list[dict] | None = None
+    ssm: list[dict] | None = None
+    result: dict | None = None
+    model_keys: dict[str, ModelKey] = field(init=False)
+    artifact_keys: dict[str, str] = field(init=False, default_factory=dict)
+
+    def __post_init__(self):
+        if self.device is None:
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+
+        # Process language argument
+        self.language = process_language_arg(self.language, self.model_name)
+        if self.alignment_mode not in ALIGNMENT_MODES:
+            raise ValueError(
+                f"alignment_mode must be one of {', '.join(ALIGNMENT_MODES)}"
+            )
+        self.model_keys = pipeline_model_keys(self.model_name, self.device)
+        if self.artifact_cache is not None:
+            if self.audio_sha256 is None:
+                self.audio_sha256 = file_sha256(self.audio_path)
+            self.artifact_keys = self._build_artifact_keys()
+
+    def _build_artifact_keys(self, stemmed: bool | None = None) -> dict[str, str]:
+        """
+        Each artifact is keyed by the keys of its inputs and its own parameters.
+
+        Args:
+            stemmed: Whether the audio the stages use is separated vocals,
+                defaults to the job's stemming option
+        """
+        if stemmed is None:
+            stemmed = self.stemming
+        audio = artifact_key(self.audio_sha256, stemmed)
+        transcript = artifact_key(
+            audio,
+            self.model_name,
+            self.language,
+            self.suppress_numerals,
+            # sequential decoding with VAD when batch_size is 0
+            self.batch_size != 0,
+        )
+        alignment = artifact_key(transcript, self.alignment_mode)
+        speakers = artifact_key(audio, "msdd")
+        return {
+            "vocals": audio,
+            "transcript": transcript,
+            "alignment": alignment,
+            "speakers": speakers,
+            "punctuated": artifact_key(alignment, speakers, PUNCT_MODEL_NAME),
+        }
+
+    def load_artifact(self, artifact: str) -> Any | None:
+        if self.artifact_cache is None:
+            return None
+        return self.artifact_cache.get(artifact, self.artifact_keys[artifact])
+
+    def store_artifact(self, artifact: str, value: Any):
+        if self.artifact_cache is None:
+            return
+        try:
+            self.artifact_cache.put(artifact, self.artifact_keys[artifact], value)
+        except Exception:
+            logging.warning("Could not cache the %s artifact", artifact, exc_info=True)
+
+    def check_cancelled(self):
+        """Stop the job with JobCancelled once its cancel event is set."""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise JobCancelled("Job cancelled")
+
+    def update_progress(self, stage: str):
+        self.check_cancelled()
+        self.report_progress(stage)
+
+    def report_progress(self, stage: str):
+        """Report progress without a cancellation check, for the final state."""
+        if self.progress_callback:
+            self.progress_callback(stage)
+
+    def run_stage(self, stage: str, run: Callable[["DiarizationJob"], None]):
+        """Run a pipeline stage, reporting its progress and resource use."""
+        self.update_progress(stage)
+        with measure_stage(stage, self.timing_callback, self.device):
+            run(self)
+
+    def publish(self, event: str, data: dict):
+        """Hand a partial result to the event callback."""
+        if self.event_callback:
+            self.event_callback(event, data)
+
+    def publish_segment(self, segment: TranscriptSegment):
+        self.publish(
+            "segment",
+            {"start": segment.start, "end": segment.end, "text": segment.text.strip()},
+        )
 
-    if stemming:
-        return_code = os.system(
-            f'python -m demucs.separate -n htdemucs --two-stems=vocals "{audio_path}" -o "{temp_outputs_dir}" --device "{device}"'
+    def release(self):
+        """
+        Free the audio buffer, also when a stage failed half way, and
+        withdraw a diarization request the job no longer waits for.
+        """
+        if self.audio is not None:
+            self.audio.release()
+            self.audio = None
+        if self.speaker_ts_future is not None and not self.speaker_ts_future.done():
+            from diarization_worker import get_diarization_worker
+
+            get_diarization_worker(self.device).cancel(self.speaker_ts_future)
+
+
+def separate_vocals(job: DiarizationJob):
+    """Step 1: Audio decoding and optional stem separation."""
+    if job.artifact_cache is not None:
+        # the audio isn't needed when the stages reading it are all cached
+        job.speaker_ts = job.load_artifact("speakers")
+        cached_transcript = job.load_artifact("transcript")
+        if cached_transcript is not None:
+            job.transcript_segments, job.info = cached_transcript
+            job.full_transcript = "".join(s.text for s in job.transcript_segments)
+            job.word_timestamps = job.load_artifact("alignment")
+        if job.speaker_ts is not None and job.word_timestamps is not None:
+            return
+
+    vocals = job.load_artifact("vocals") if job.stemming else None
+    if vocals is not None:
+        job.audio = (
+            AudioBuffer.memory_mapped(vocals)
+            if len(vocals) >= AUDIO_MMAP_MIN_SECONDS * SAMPLING_RATE
+            else AudioBuffer(vocals)
+        )
+    else:
+        # decoded once, every later stage works on views of this buffer
+        job.audio = AudioBuffer.from_file(
+            job.audio_path, mmap_min_seconds=AUDIO_MMAP_MIN_SECONDS
         )
 
-        if return_code != 0:
-            logging.warning("Source splitting failed, using original audio file.")
-            vocal_target = audio_path
-        else:
-            vocal_target = os.path.join(
-                temp_outputs_dir,
-                "htdemucs",
-                os.path.splitext(os.path.basename(audio_path))[0],
-                "vocals.wav",
+    if job.stemming and vocals is None:
+        from vocal_separation import VocalSeparator
+
+        try:
+            separator = _load_model(
+                job.model_pool,
+                job.model_keys["separating_vocals"],
+                lambda: VocalSeparator(device=job.device),
             )
-    else:
-        vocal_target = audio_path
+            vocals = AudioBuffer.from_tensor(separator.separate(job.audio.tensor()))
+            del separator
+
+            if vocals.duration >= AUDIO_MMAP_MIN_SECONDS:
+                vocals = AudioBuffer.memory_mapped(vocals.numpy())
+            job.audio.release()
+            job.audio = vocals
+            job.store_artifact("vocals", vocals.numpy())
+        except Exception:
+            logging.warning(
+                "Source splitting failed, using original audio file.", exc_info=True
+            )
+            # what is computed from here on is what a job without stemming gets
+            if job.artifact_cache is not None:
+                job.artifact_keys = job._build_artifact_keys(stemmed=False)
 
-    # Step 2: Transcription
-    update_progress("transcribing")
+        if job.model_pool is None:
+            torch.cuda.empty_cache()
 
-    whisper_model = faster_whisper.WhisperModel(
-        model_name, device=device, compute_type=MTYPES[device]
+    if job.parallel_diarization and job.speaker_ts is None:
+        from diarization_worker import get_diarization_worker
+
+        # diarized by the worker process while this job transcribes and aligns
+        job.speaker_ts_future = get_diarization_worker(job.device).submit(
+            job.audio.numpy()
+        )
+
+
+def transcribe(job: DiarizationJob):
+    """Step 2: Transcription."""
+    if job.transcript_segments is not None:
+        for segment in job.transcript_segments:
+            job.publish_segment(segment)
+        return
+
+    whisper_model = _load_model(
+        job.model_pool,
+        job.model_keys["transcribing"],
+        lambda: faster_whisper.WhisperModel(
+            job.model_name, device=job.device, compute_type=MTYPES[job.device]
+        ),
+        size_mb=estimate_whisper_size_mb(job.model_name, MTYPES[job.device]),
     )
-    whisper_pipeline = faster_whisper.BatchedInferencePipeline(whisper_model)
-    audio_waveform = faster_whisper.decode_audio(vocal_target)
+    if job.whisper_batcher is not None:
+        # chunks are decoded together with those of other jobs
+        whisper_pipeline = CrossJobPipeline(whisper_model, job.whisper_batcher)
+    else:
+        whisper_pipeline = faster_whisper.BatchedInferencePipeline(whisper_model)
 
     suppress_tokens = (
         find_numeral_symbol_tokens(whisper_model.hf_tokenizer)
-        if suppress_numerals
+        if job.suppress_numerals
         else [-1]
     )
 
-    if batch_size > 0:
-        transcript_segments, info = whisper_pipeline.transcribe(
-            audio_waveform,
-            language,
-            suppress_tokens=suppress_tokens,
-            batch_size=batch_size,
-        )
-    else:
-        transcript_segments, info = whisper_model.transcribe(
-            audio_waveform,
-            language,
-            suppress_tokens=suppress_tokens,
-            vad_filter=True,
-        )
+    batch_size = job.batch_size
+    if batch_size is None:
+        batch_size = plan_batch_size("transcribing", job.device, job.audio.duration)
+    published = 0
+
+    def decode(batch_size: int):
+        nonlocal published
+        if batch_size > 0:
+            transcript_segments, info = whisper_pipeline.transcribe(
+                job.audio.numpy(),
+                job.language,
+                suppress_tokens=suppress_tokens,
+                batch_size=batch_size,
+            )
+        else:
+            transcript_segments, info = whisper_model.transcribe(
+                job.audio.numpy(),
+                job.language,
+                suppress_tokens=suppress_tokens,
+                vad_filter=True,
+            )
 
-    full_transcript = "".join(segment.text for segment in transcript_segments)
+        # segment timing is kept to constrain alignment, segments are
+        # published as the generator decodes them
+        segments = []
+        for segment in TranscriptSegment.iter_whisper(transcript_segments):
+            # stops decoding, the generator only decodes the next chunks on demand
+            job.check_cancelled()
+            segments.append(segment)
+            # a retry decodes the segments of the failed attempt again
+            if len(segments) > published:
+                job.publish_segment(segment)
+                published += 1
+        return segments, info
+
+    job.transcript_segments, job.info = run_with_backoff(
+        decode, batch_size, "Transcription"
+    )
+    job.full_transcript = "".join(segment.text for segment in job.transcript_segments)
+    job.store_artifact("transcript", (job.transcript_segments, job.info))
 
     del whisper_model, whisper_pipeline
-    torch.cuda.empty_cache()
+    if job.model_pool is None:
+        torch.cuda.empty_cache()
+
+
+def align(job: DiarizationJob):
+    """Step 3: Forced alignment."""
+    if job.word_timestamps is None:
+        job.word_timestamps = job.load_artifact("alignment")
+    if job.word_timestamps is None:
+        _align(job)
+        job.store_artifact("alignment", job.word_timestamps)
+
+    job.publish(
+        "words",
+        {
+            "words": [
+                {"word": w["text"], "start": w["start"], "end": w["end"]}
+                for w in job.word_timestamps
+            ]
+        },
+    )
 
-    # Step 3: Forced alignment
-    update_progress("aligning")
 
-    alignment_model, alignment_tokenizer = load_alignment_model(
-        device,
-        dtype=torch.float16 if device == "cuda" else torch.float32,
+def _align(job: DiarizationJob):
+    alignment_model, alignment_tokenizer = _load_model(
+        job.model_pool,
+        job.model_keys["aligning"],
+        lambda: load_alignment_model(
+            job.device,
+            dtype=torch.float16 if job.device == "cuda" else torch.float32,
+        ),
     )
 
+    try:
+        # 0 only selects sequential decoding for Whisper
+        batch_size = job.batch_size or plan_batch_size(
+            "aligning", job.device, job.audio.duration
+        )
+        job.word_timestamps = run_with_backoff(
+            lambda batch_size: _align_words(
+                job, alignment_model, alignment_tokenizer, batch_size
+            ),
+            batch_size,
+            "Alignment",
+        )
+    finally:
+        del alignment_model
+        if job.model_pool is None:
+            torch.cuda.empty_cache()
+
+
+def _align_words(
+    job: DiarizationJob, alignment_model, alignment_tokenizer, batch_size: int
+) -> list[dict]:
+    if job.alignment_mode == "full":
+        return _align_full(job, alignment_model, alignment_tokenizer, batch_size)
+    try:
+        return _align_windows(
+            job,
+            alignment_model,
+            alignment_tokenizer,
+            batch_size,
+            # 0 gives every Whisper segment its own window
+            max_window_seconds=WINDOW_SECONDS if job.alignment_mode == "windowed" else 0,
+        )
+    except Exception as e:
+        # out of memory is retried with a smaller batch instead
+        if job.alignment_mode != "auto" or is_out_of_memory(e):
+            raise
+        logging.exception("Segment alignment failed, aligning the full transcript instead")
+    return _align_full(job, alignment_model, alignment_tokenizer, batch_size)
+
+
+def _align_windows(
+    job: DiarizationJob,
+    alignment_model,
+    alignment_tokenizer,
+    batch_size: int,
+    max_window_seconds: float,
+) -> list[dict]:
+    """Align Whisper segments against their own spans of audio."""
+    words = []
+    for word in iter_windowed_alignment(
+        alignment_model,
+        alignment_tokenizer,
+        job.audio,
+        build_windows(
+            job.transcript_segments,
+            job.audio.duration,
+            max_window_seconds=max_window_seconds,
+        ),
+        language=langs_to_iso[job.info.language],
+        batch_size=batch_size,
+    ):
+        # emissions of the next batch are only computed on demand
+        job.check_cancelled()
+        words.append(word)
+    return words
+
+
+def _align_full(
+    job: DiarizationJob, alignment_model, alignment_tokenizer, batch_size: int
+) -> list[dict]:
+    """Align the whole transcript against the whole audio, ignoring segment timing."""
     emissions, stride = generate_emissions(
         alignment_model,
-        torch.from_numpy(audio_waveform)
-        .to(alignment_model.dtype)
-        .to(alignment_model.device),
+        job.audio.tensor(alignment_model.dtype, alignment_model.device),
         batch_size=batch_size,
     )
-
-    del alignment_model
-    torch.cuda.empty_cache()
+    job.audio.release_conversion(alignment_model.dtype, alignment_model.device)
+    job.check_cancelled()
 
     tokens_starred, text_starred = preprocess_text(
-        full_transcript,
+        job.full_transcript,
         romanize=True,
-        language=langs_to_iso[info.language],
+        language=langs_to_iso[job.info.language],
     )
 
     segments, scores, blank_token = get_alignments(
@@ -163,27 +488,84 @@ def run_diarization(
     )
 
     spans = get_spans(tokens_starred, segments, blank_token)
-    word_timestamps = postprocess_results(text_starred, spans, stride, scores)
+    return postprocess_results(text_starred, spans, stride, scores)
+
+
+def diarize(job: DiarizationJob):
+    """Step 4: Diarization."""
+    if job.speaker_ts is None:
+        job.speaker_ts = job.load_artifact("speakers")
+    if job.speaker_ts is None:
+        _diarize(job)
+        job.store_artifact("speakers", job.speaker_ts)
+
+    # later stages only need the text and timestamps
+    job.release()
+
+    job.publish(
+        "speakers",
+        {
+            "turns": [
+                {"start": start / 1000.0, "end": end / 1000.0, "speaker": speaker}
+                for start, end, speaker in job.speaker_ts
+            ]
+        },
+    )
 
-    # Step 4: Diarization
-    update_progress("diarizing")
+
+def _diarize(job: DiarizationJob):
+    if job.speaker_ts_future is not None:
+        while job.speaker_ts is None:
+            try:
+                job.speaker_ts = job.speaker_ts_future.result(CANCEL_POLL_SECONDS)
+            except TimeoutError:
+                job.check_cancelled()
+        return
 
     from diarization import MSDDDiarizer
-    diarizer_model = MSDDDiarizer(device=device)
-    speaker_ts = diarizer_model.diarize(torch.from_numpy(audio_waveform).unsqueeze(0))
+
+    diarizer_model = _load_model(
+        job.model_pool,
+        job.model_keys["diarizing"],
+        lambda: MSDDDiarizer(device=job.device),
+    )
+    job.speaker_ts = diarizer_model.diarize(
+        job.audio.tensor().unsqueeze(0),
+        measure_step=lambda step: measure_stage(
+            step, job.timing_callback, job.device, parent="diarizing"
+        ),
+    )
 
     del diarizer_model
-    torch.cuda.empty_cache()
+    if job.model_pool is None:
+        torch.cuda.empty_cache()
+
+
+def post_process(job: DiarizationJob):
+    """Step 5: Post-processing."""
+    wsm = job.load_artifact("punctuated")
+    if wsm is None:
+        wsm = _punctuate(job)
+        job.store_artifact("punctuated", wsm)
+
+    job.wsm = get_realigned_ws_mapping_with_punctuation(wsm)
+    job.ssm = get_sentences_speaker_mapping(job.wsm, job.speaker_ts)
 
-    # Step 5: Post-processing
-    update_progress("post_processing")
 
-    wsm = get_words_speaker_mapping(word_timestamps, speaker_ts, "start")
+def _punctuate(job: DiarizationJob) -> list[dict]:
+    """Map words to speakers and restore punctuation."""
+    wsm = get_words_speaker_mapping(job.word_timestamps, job.speaker_ts, "start")
 
-    if info.language in punct_model_langs:
-        punct_model = PunctuationModel(model="kredor/punctuate-all")
+    if job.info.language in punct_model_langs:
+        punct_model = _load_model(
+            job.model_pool,
+            job.model_keys["post_processing"],
+            lambda: PunctuationModel(model=PUNCT_MODEL_NAME),
+        )
         words_list = list(map(lambda x: x["word"], wsm))
-        labeled_words = punct_model.predict(words_list, chunk_size=230)
+        labeled_words = _predict_punctuation(
+            punct_model, words_list, job.check_cancelled
+        )
 
         ending_puncts = ".?!"
         model_puncts = ".,;:!?"
@@ -202,19 +584,66 @@ def run_diarization(
                 word_dict["word"] = word
     else:
         logging.warning(
-            f"Punctuation restoration not available for {info.language}. "
+            f"Punctuation restoration not available for {job.info.language}. "
             "Using original punctuation."
         )
+    return wsm
 
-    wsm = get_realigned_ws_mapping_with_punctuation(wsm)
-    ssm = get_sentences_speaker_mapping(wsm, speaker_ts)
 
-    # Step 6: Generate outputs in Deepgram-compatible format
-    update_progress("generating_output")
+def _predict_punctuation(
+    punct_model: PunctuationModel,
+    words: list[str],
+    check_cancelled: Callable[[], None],
+    chunk_size: int = 230,
+    overlap: int = 5,
+) -> list[tuple[str, str]]:
+    """
+    Label every word with the punctuation that follows it, like
+    PunctuationModel.predict() but checking for cancellation between chunks.
 
+    Args:
+        punct_model: Loaded punctuation model, possibly shared between jobs
+        words: Words of the transcript
+        check_cancelled: Raises JobCancelled once the job was cancelled
+        chunk_size: Words sent through the pipeline at once
+        overlap: Words repeated at the start of the next chunk, whose labels
+            are taken from that chunk where they have context on both sides
+
+    Returns:
+        (word, label) per word, the label being "0" for no punctuation
+    """
+    if len(words) <= chunk_size:
+        overlap = 0
+    starts = range(0, len(words), chunk_size - overlap)
+    chunks = [words[start : start + chunk_size] for start in starts]
+    # a last chunk within the previous one's overlap adds nothing
+    if len(chunks) > 1 and len(chunks[-1]) <= overlap:
+        chunks.pop()
+
+    labeled = []
+    for index, chunk in enumerate(chunks):
+        check_cancelled()
+        text = " ".join(chunk)
+        tokens = punct_model.pipe(text)
+        kept = chunk if index == len(chunks) - 1 else chunk[: len(chunk) - overlap]
+        char_index = 0
+        token_index = 0
+        for word in kept:
+            char_index += len(word) + 1
+            # a word gets the label of its last sub-token
+            label = "0"
+            while token_index < len(tokens) and char_index > tokens[token_index]["end"]:
+                label = tokens[token_index]["entity"]
+                token_index += 1
+            labeled.append((word, label))
+    return labeled
+
+
+def generate_output(job: DiarizationJob):
+    """Step 6: Generate outputs in Deepgram-compatible format."""
     # Build words array (Deepgram format)
     words = []
-    for word_dict in wsm:
+    for word_dict in job.wsm:
         speaker_num = word_dict["speaker"]
         words.append({
             "word": word_dict["word"].strip(),
@@ -228,15 +657,13 @@ def run_diarization(
 
     # Build utterances array (Deepgram format) from sentence mappings
     utterances = []
-    for sentence_dict in ssm:
+    for sentence_dict in job.ssm:
         speaker_str = sentence_dict["speaker"]  # "Speaker 0", "Speaker 1", etc.
         speaker_num = int(speaker_str.split()[-1]) if speaker_str.startswith("Speaker") else 0
 
-        # Get words for this utterance
-        utterance_words = [
-            w for w in words
-            if w["start"] >= sentence_dict["start_time"] / 1000.0
-            and w["end"] <= sentence_dict["end_time"] / 1000.0 + 0.1
+        # Each sentence covers a contiguous range of words
+        utterance_words = words[
+            sentence_dict["word_start_idx"] : sentence_dict["word_end_idx"]
         ]
 
         utterances.append({
@@ -253,18 +680,12 @@ def run_diarization(
     # Build full transcript
     full_transcript = " ".join(w["word"] for w in words)
 
-    # Cleanup temp files
-    if os.path.exists(temp_outputs_dir):
-        cleanup(temp_outputs_dir)
-
-    update_progress("completed")
-
-    # Return Deepgram-compatible response
-    return {
+    # Deepgram-compatible response
+    job.result = {
         "metadata": {
             "request_id": str(uuid4()),
             "model_info": {
-                "name": model_name,
+                "name": job.model_name,
             },
             "duration": words[-1]["end"] if words else 0,
         },
@@ -283,3 +704,106 @@ def run_diarization(
             "utterances": utterances,
         },
     }
+
+
+# (progress stage name, stage function) in execution order
+PIPELINE_STAGES: list[tuple[str, Callable[[DiarizationJob], None]]] = [
+    ("separating_vocals", separate_vocals),
+    ("transcribing", transcribe),
+    ("aligning", align),
+    ("diarizing", diarize),
+    ("post_processing", post_process),
+    ("generating_output", generate_output),
+]
+
+
+def run_diarization(
+    audio_path: str,
+    model_name: str = "medium.en",
+    language: str | None = None,
+    stemming: bool = True,
+    suppress_numerals: bool = False,
+    device: str | None = None,
+    batch_size: int | None = None,
+    progress_callback: Callable[[str], None] | None = None,
+    event_callback: Callable[[str, dict], None] | None = None,
+    model_pool: ModelPool | None = None,
+    parallel_diarization: bool = False,
+    alignment_mode: str = "auto",
+    artifact_cache: ArtifactCache | None = None,
+    audio_sha256: str | None = None,
+    whisper_batcher: WhisperBatcher | None = None,
+    cancel_event: threading.Event | None = None,
+    timing_callback: TimingCallback | None = None,
+) -> dict:
+    """
+    Run full diarization pipeline on an audio file.
+
+    Args:
+        audio_path: Path to audio file
+        model_name: Whisper model name (default: medium.en)
+        language: Language code or None for auto-detect
+        stemming: Whether to separate vocals from music
+        suppress_numerals: Convert digits to written text
+        device: "cuda" or "cpu" (auto-detect if None)
+        batch_size: Batch size for inference, None picks one per stage from
+            the free memory and the audio length. 0 decodes sequentially
+            with Whisper's own VAD
+        progress_callback: Optional callback for progress updates
+        event_callback: Optional callback for partial results, called with
+            ("segment", ...) per Whisper segment, then ("words", ...) after
+            alignment and ("speakers", ...) after diarization
+        model_pool: Optional pool that keeps models resident between calls.
+            Models are loaded and released per call if None.
+        parallel_diarization: Diarize in a persistent worker process while
+            transcribing and aligning, instead of after them
+        alignment_mode: "segments" aligns every Whisper segment against its
+            own span of audio, "windowed" aligns groups of segments in windows
+            of up to 30 s, "full" aligns the whole transcript against the
+            whole audio, "auto" aligns per segment and falls back to "full"
+            if that fails
+        artifact_cache: Optional cache of stage outputs, stages whose inputs
+            and parameters match an earlier run are skipped
+        audio_sha256: Hash of the audio file, computed when caching if None
+        whisper_batcher: Optional batcher that decodes the Whisper chunks of
+            this call together with those of concurrent calls sharing the
+            same model from the pool
+        cancel_event: Optional event that stops the job with JobCancelled
+            between stages and between Whisper segments, alignment batches
+            and punctuation chunks
+        timing_callback: Optional callback receiving a StageTiming with the
+            wall time, CPU time and peak memory of every stage and of the
+            steps of NeMo diarization
+
+    Returns:
+        dict with keys: transcript, srt, segments
+    """
+    job = DiarizationJob(
+        audio_path=audio_path,
+        model_name=model_name,
+        language=language,
+        stemming=stemming,
+        suppress_numerals=suppress_numerals,
+        device=device,
+        batch_size=batch_size,
+        progress_callback=progress_callback,
+        event_callback=event_callback,
+        model_pool=model_pool,
+        parallel_diarization=parallel_diarization,
+        alignment_mode=alignment_mode,
+        artifact_cache=artifact_cache,
+        audio_sha256=audio_sha256,
+        whisper_batcher=whisper_batcher,
+        cancel_event=cancel_event,
+        timing_callback=timing_callback,
+    )
+
+    try:
+        for stage, run_stage in PIPELINE_STAGES:
+            job.run_stage(stage, run_stage)
+    finally:
+        job.release()
+
+    # the result is complete, a cancellation arriving now changes nothing
+    job.report_progress("completed")
+    return job.result
@@ -19,7 +19,6 @@ from deepmultilingualpunctuation import PunctuationModel
 
 from diarization import MSDDDiarizer
 from helpers import (
-    cleanup,
     find_numeral_symbol_tokens,
     get_realigned_ws_mapping_with_punctuation,
     get_sentences_speaker_mapping,
@@ -31,6 +30,7 @@ from helpers import (
     whisper_langs,
     write_srt,
 )
+from vocal_separation import VocalSeparator
 
 
 def diarize_parallel(audio: torch.Tensor, device, queue: mp.Queue):
@@ -43,10 +43,6 @@ mp.set_start_method("spawn", force=True)
 
 if __name__ == "__main__":
     mtypes = {"cpu": "int8", "cuda": "float16"}
-    pid = os.getpid()
-    temp_outputs_dir = f"temp_outputs_{pid}"
-    temp_path = os.path.join(os.getcwd(), temp_outputs_dir)
-    os.makedirs(temp_path, exist_ok=True)
 
     # Initialize parser
     parser = argparse.ArgumentParser()
@@ -112,32 +108,23 @@ if __name__ == "__main__":
     args = parser.parse_args()
     language = process_language_arg(args.language, args.model_name)
 
+    audio_waveform = faster_whisper.decode_audio(args.audio)
+
     if args.stemming:
         # Isolate vocals from the rest of the audio
-
-        return_code = os.system(
-            f'python -m demucs.separate -n htdemucs --two-stems=vocals "{args.audio}" -o "{temp_outputs_dir}" --device "{args.device}"'
-        )
-
-        if return_code != 0:
+        try:
+            separator = VocalSeparator(device=args.device)
+            audio_waveform = separator.separate(audio_waveform).numpy()
+            del separator
+        except Exception:
             logging.warning(
                 "Source splitting failed, using original audio file. "
-                "Use --no-stem argument to disable it."
+                "Use --no-stem argument to disable it.",
+                exc_info=True,
             )
-            vocal_target = args.audio
-        else:
-            vocal_target = os.path.join(
-                temp_outputs_dir,
-                "htdemucs",
-                os.path.splitext(os.path.basename(args.audio))[0],
-                "vocals.wav",
-            )
-    else:
-        vocal_target = args.audio
+        torch.cuda.empty_cache()
 
-    audio_waveform = faster_whisper.decode_audio(vocal_target)
-
-    logging.info("Starting Nemo process with vocal_target: ", vocal_target)
+    logging.info("Starting Nemo process")
     results_queue = mp.Queue()
     nemo_process = mp.Process(
         target=diarize_parallel,
@@ -265,5 +252,3 @@ if __name__ == "__main__":
         f"{os.path.splitext(args.audio)[0]}.srt", "w", encoding="utf-8-sig"
     ) as srt:
         write_srt(ssm, srt)
-
-    cleanup(temp_path)
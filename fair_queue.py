@@ -0,0 +1,255 @@
+"""
+Dispatch order of queued jobs.
+Jobs are served by priority class first. Within a class, clients take turns
+in weighted round robin, so one client submitting hundreds of files doesn't
+starve the others. Start times are estimated from the measured real-time
+factor of finished jobs.
+"""
+import heapq
+import threading
+import time
+from bisect import insort
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import count
+from typing import Sequence
+
+# Classes are served strictly in this order
+PRIORITIES = ("high", "normal", "low")
+# Weight of the real-time factor of the newest finished job in the average
+RTF_SMOOTHING = 0.2
+
+
+@dataclass(order=True)
+class _Entry:
+    sort_key: tuple
+    job_id: str = field(compare=False)
+    duration_s: float | None = field(compare=False)
+
+
+@dataclass
+class _PriorityClass:
+    """Pending jobs of one priority class, per client in dispatch order."""
+
+    pending: dict[str, list[_Entry]] = field(default_factory=dict)
+    rotation: deque = field(default_factory=deque)  # clients with pending jobs
+    credit: int = 0  # jobs the client at the head may still take this turn
+
+    def copy(self) -> "_PriorityClass":
+        return _PriorityClass(
+            {client: list(entries) for client, entries in self.pending.items()},
+            deque(self.rotation),
+            self.credit,
+        )
+
+
+@dataclass(frozen=True)
+class DispatchOrder:
+    """Snapshot of the order in which the queued jobs will be dispatched."""
+
+    version: int  # changes whenever the queue does
+    positions: dict[str, int]  # job id -> position, 0 = next
+    durations: tuple[float | None, ...]  # audio durations in dispatch order
+
+
+class FairQueue:
+    """
+    Blocking queue of job ids with priority classes and per-client fairness.
+
+    A client with weight w gets up to w jobs per round before the next client
+    with queued jobs of the same class. A client's own jobs are served in
+    submission order, or shortest audio first with `shortest_first` (jobs of
+    unknown duration go last).
+
+    Args:
+        weights: Round robin weight per client key, missing clients get 1
+        shortest_first: Serve each client's shortest queued job first
+    """
+
+    def __init__(self, weights: dict[str, int] | None = None, shortest_first: bool = False):
+        self.weights = weights or {}
+        self.shortest_first = shortest_first
+        self._classes = {priority: _PriorityClass() for priority in PRIORITIES}
+        self._clients: dict[str, tuple[str, str]] = {}  # job id -> (priority, client)
+        self._seq = count()
+        self._cond = threading.Condition()
+        self._version = 0
+        self._order: DispatchOrder | None = None  # of the current version
+
+    def weight(self, client: str) -> int:
+        return max(self.weights.get(client, 1), 1)
+
+    def put(
+        self,
+        job_id: str,
+        client: str = "",
+        priority: str = "normal",
+        duration_s: float | None = None,
+    ):
+        if priority not in self._classes:
+            raise ValueError(f"Unknown priority: {priority}")
+        if self.shortest_first:
+            sort_key = (duration_s is None, duration_s or 0.0, next(self._seq))
+        else:
+            sort_key = (next(self._seq),)
+
+        with self._cond:
+            if job_id in self._clients:
+                return
+            queue = self._classes[priority]
+            if client not in queue.pending:
+                queue.pending[client] = []
+                queue.rotation.append(client)
+                if len(queue.rotation) == 1:
+                    queue.credit = self.weight(client)
+            insort(queue.pending[client], _Entry(sort_key, job_id, duration_s))
+            self._clients[job_id] = (priority, client)
+            self._version += 1
+            self._cond.notify()
+
+    def _pop(self, queue: _PriorityClass) -> _Entry:
+        """Next entry of a non-empty class, advancing the round robin."""
+        client = queue.rotation[0]
+        entries = queue.pending[client]
+        entry = entries.pop(0)
+        queue.credit -= 1
+        if not entries:
+            del queue.pending[client]
+            queue.rotation.popleft()
+        elif queue.credit <= 0:
+            queue.rotation.rotate(-1)
+        else:
+            return entry
+        if queue.rotation:
+            queue.credit = self.weight(queue.rotation[0])
+        return entry
+
+    def get(self, timeout: float | None = None) -> str | None:
+        """Remove and return the next job id, None after `timeout` seconds."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._clients, timeout):
+                return None
+            queue = next(q for q in self._classes.values() if q.rotation)
+            entry = self._pop(queue)
+            del self._clients[entry.job_id]
+            self._version += 1
+            return entry.job_id
+
+    def remove(self, job_id: str) -> bool:
+        """Drop a queued job, False if it isn't queued."""
+        with self._cond:
+            location = self._clients.pop(job_id, None)
+            if location is None:
+                return False
+            priority, client = location
+            self._version += 1
+            queue = self._classes[priority]
+            entries = queue.pending[client]
+            entries[:] = [entry for entry in entries if entry.job_id != job_id]
+            if not entries:
+                del queue.pending[client]
+                was_head = queue.rotation[0] == client
+                queue.rotation.remove(client)
+                if was_head and queue.rotation:
+                    queue.credit = self.weight(queue.rotation[0])
+            return True
+
+    def dispatch_order(self) -> DispatchOrder:
+        """
+        Order the queued jobs will be dispatched in. It is computed by
+        replaying the round robin once per change of the queue, so status
+        polls between changes are answered from the snapshot.
+        """
+        with self._cond:
+            if self._order is not None and self._order.version == self._version:
+                return self._order
+            positions, durations = {}, []
+            for queue in self._classes.values():
+                queue = queue.copy()
+                while queue.rotation:
+                    entry = self._pop(queue)
+                    positions[entry.job_id] = len(durations)
+                    durations.append(entry.duration_s)
+            self._order = DispatchOrder(self._version, positions, tuple(durations))
+            return self._order
+
+    def position(self, job_id: str) -> int:
+        """Position in dispatch order (0 = next to process), -1 if not queued."""
+        return self.dispatch_order().positions.get(job_id, -1)
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._clients)
+
+    def stats(self) -> dict:
+        """Queued jobs per priority class and client for health reporting."""
+        with self._cond:
+            return {
+                priority: {client: len(entries) for client, entries in queue.pending.items()}
+                for priority, queue in self._classes.items()
+                if queue.pending
+            }
+
+
+class ThroughputEstimate:
+    """
+    Running estimate of how long jobs take, from the real-time factor
+    (processing seconds per second of audio) of finished jobs.
+
+    Args:
+        workers: Jobs processed at the same time
+        default_duration_s: Assumed length of audio of unknown duration
+    """
+
+    def __init__(self, workers: int, default_duration_s: float):
+        self.workers = max(workers, 1)
+        self.default_duration_s = default_duration_s
+        self.rtf: float | None = None
+        self._running: dict[str, tuple[float, float | None]] = {}  # id -> (start, duration)
+        self._lock = threading.Lock()
+
+    def started(self, job_id: str, duration_s: float | None):
+        with self._lock:
+            self._running[job_id] = (time.monotonic(), duration_s)
+
+    def finished(self, job_id: str, status: str = "completed"):
+        """Record a finished job, only completed jobs of known length are measured."""
+        with self._lock:
+            started = self._running.pop(job_id, None)
+            if started is None or status != "completed":
+                return
+            started_at, duration_s = started
+            if not duration_s:
+                return
+            rtf = (time.monotonic() - started_at) / duration_s
+            if self.rtf is None:
+                self.rtf = rtf
+            else:
+                self.rtf += RTF_SMOOTHING * (rtf - self.rtf)
+
+    def runtime_s(self, duration_s: float | None) -> float:
+        return self.rtf * (duration_s or self.default_duration_s)
+
+    def start_times(self, queued: Sequence[float | None]) -> list[float] | None:
+        """
+        Seconds until each queued job starts given the durations of all
+        queued jobs in dispatch order, None before any job has been measured.
+        """
+        with self._lock:
+            if self.rtf is None:
+                return None
+            now = time.monotonic()
+            # remaining work of running jobs, then the queued jobs in order,
+            # each on the worker that becomes free first
+            free_at = sorted(
+                max(started_at + self.runtime_s(duration_s) - now, 0.0)
+                for started_at, duration_s in self._running.values()
+            )[-self.workers :]
+            free_at = [0.0] * (self.workers - len(free_at)) + free_at
+            heapq.heapify(free_at)
+            starts = []
+            for duration_s in queued:
+                start = heapq.heappop(free_at)
+                starts.append(round(start, 1))
+                heapq.heappush(free_at, start + self.runtime_s(duration_s))
+            return starts
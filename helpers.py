@@ -1,7 +1,9 @@
 import os
 import shutil
+from operator import itemgetter
 
 import nltk
+import numpy as np
 
 punct_model_langs = [
     "en",
@@ -253,27 +255,56 @@ def get_word_ts_anchor(s, e, option="start"):
     return s
 
 
+def assign_word_speakers(
+    word_starts, word_ends, turn_ends, word_anchor_option="start"
+) -> np.ndarray:
+    """
+    Index of the speaker turn of every word, times in milliseconds.
+
+    Same assignment as walking the turns in order and moving on whenever a
+    word's anchor is past the end of the current turn: a word never goes
+    back to an earlier turn, and words after the last turn stay in it. Only
+    running maxima of the anchors and turn ends decide where the walk stops,
+    so it reduces to one binary search per word.
+    """
+    anchors = get_word_ts_anchor(
+        np.asarray(word_starts), np.asarray(word_ends), word_anchor_option
+    )
+    if len(anchors) == 0:
+        return np.zeros(0, dtype=np.int64)
+    turn_idx = np.searchsorted(
+        np.maximum.accumulate(np.asarray(turn_ends, dtype=np.float64)),
+        np.maximum.accumulate(anchors),
+        side="left",
+    )
+    return np.minimum(turn_idx, len(turn_ends) - 1)
+
+
 def get_words_speaker_mapping(wrd_ts, spk_ts, word_anchor_option="start"):
-    s, e, sp = spk_ts[0]
-    wrd_pos, turn_idx = 0, 0
-    wrd_spk_mapping = []
-    for wrd_dict in wrd_ts:
-        ws, we, wrd = (
-            int(wrd_dict["start"] * 1000),
-            int(wrd_dict["end"] * 1000),
-            wrd_dict["text"],
-        )
-        wrd_pos = get_word_ts_anchor(ws, we, word_anchor_option)
-        while wrd_pos > float(e):
-            turn_idx += 1
-            turn_idx = min(turn_idx, len(spk_ts) - 1)
-            s, e, sp = spk_ts[turn_idx]
-            if turn_idx == len(spk_ts) - 1:
-                e = get_word_ts_anchor(ws, we, option="end")
-        wrd_spk_mapping.append(
-            {"word": wrd, "start_time": ws, "end_time": we, "speaker": sp}
+    turn_ends = [e for _, e, _ in spk_ts]
+    speakers = np.empty(len(spk_ts), dtype=object)
+    speakers[:] = [sp for _, _, sp in spk_ts]
+    if len(speakers) == 0:
+        raise IndexError("no speaker turns")
+    if not wrd_ts:
+        return []
+
+    count = len(wrd_ts)
+    # truncated to whole milliseconds like int()
+    starts = np.fromiter(map(itemgetter("start"), wrd_ts), np.float64, count)
+    starts = (starts * 1000).astype(np.int64)
+    ends = np.fromiter(map(itemgetter("end"), wrd_ts), np.float64, count)
+    ends = (ends * 1000).astype(np.int64)
+    turn_idx = assign_word_speakers(starts, ends, turn_ends, word_anchor_option)
+    return [
+        {"word": wrd, "start_time": ws, "end_time": we, "speaker": sp}
+        for wrd, ws, we, sp in zip(
+            map(itemgetter("text"), wrd_ts),
+            starts.tolist(),
+            ends.tolist(),
+            speakers[turn_idx].tolist(),
         )
-    return wrd_spk_mapping
+    ]
 
 
 sentence_ending_punctuations = ".?!"
@@ -379,10 +410,18 @@ def get_sentences_speaker_mapping(word_speaker_mapping, spk_ts):
     s, e, spk = spk_ts[0]
     prev_spk = spk
 
+    # every sentence covers the words word_speaker_mapping[word_start_idx:word_end_idx]
     snts = []
-    snt = {"speaker": f"Speaker {spk}", "start_time": s, "end_time": e, "text": ""}
-
-    for wrd_dict in word_speaker_mapping:
+    snt = {
+        "speaker": f"Speaker {spk}",
+        "start_time": s,
+        "end_time": e,
+        "text": "",
+        "word_start_idx": 0,
+        "word_end_idx": 0,
+    }
+
+    for wrd_idx, wrd_dict in enumerate(word_speaker_mapping):
         wrd, spk = wrd_dict["word"], wrd_dict["speaker"]
         s, e = wrd_dict["start_time"], wrd_dict["end_time"]
         if spk != prev_spk or sentence_checker(snt["text"] + " " + wrd):
@@ -392,10 +431,13 @@ def get_sentences_speaker_mapping(word_speaker_mapping, spk_ts):
                 "start_time": s,
                 "end_time": e,
                 "text": "",
+                "word_start_idx": wrd_idx,
+                "word_end_idx": wrd_idx,
             }
         else:
             snt["end_time"] = e
         snt["text"] += wrd + " "
+        snt["word_end_idx"] = wrd_idx + 1
         prev_spk = spk
 
     snts.append(snt)
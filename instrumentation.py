@@ -0,0 +1,293 @@
+"""
+Timing and memory instrumentation of the pipeline stages.
+Every stage reports its wall time, CPU time and the peak resident and device
+memory sampled while it ran. The API aggregates the reports of all jobs into
+Prometheus metrics.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterator
+
+from scheduler import SystemMemoryProbe
+
+# Interval of the memory samples taken while a stage runs
+SAMPLE_SECONDS = 0.1
+STAGE_SECONDS_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+REAL_TIME_FACTOR_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+
+TimingCallback = Callable[["StageTiming"], None]
+
+
+@dataclass
+class StageTiming:
+    """
+    Resources one stage of one job used.
+
+    CPU time and memory are measured for the whole process, so they include
+    other jobs running at the same time. Device memory is what is in use on
+    the GPU, also by CTranslate2 and other processes.
+    """
+
+    stage: str
+    wall_s: float
+    cpu_s: float
+    peak_rss_mb: float | None = None
+    peak_device_mb: float | None = None
+    parent: str | None = None  # stage a sub-step belongs to
+
+    def to_dict(self) -> dict:
+        timing = asdict(self)
+        for name in ("wall_s", "cpu_s", "peak_rss_mb", "peak_device_mb"):
+            if timing[name] is not None:
+                timing[name] = round(timing[name], 3)
+        return timing
+
+
+class _MemorySampler:
+    """Samples resident and device memory on a thread until stopped."""
+
+    def __init__(self, device: str | None):
+        self.device = device
+        self.peak_rss_mb: float | None = None
+        self.peak_device_mb: float | None = None
+        self._probe = SystemMemoryProbe()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        rss = self._probe.rss_mb()
+        if rss is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb or 0.0, rss)
+        if self.device == "cuda":
+            import torch
+
+            free, total = torch.cuda.mem_get_info()
+            used = (total - free) / 2**20
+            self.peak_device_mb = max(self.peak_device_mb or 0.0, used)
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_SECONDS):
+            self._sample()
+
+    def start(self):
+        self._sample()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+@contextmanager
+def measure_stage(
+    stage: str,
+    callback: TimingCallback | None,
+    device: str | None = None,
+    parent: str | None = None,
+) -> Iterator[None]:
+    """
+    Report the resources the body used to `callback`, also when it raises.
+    Nothing is measured without a callback.
+
+    Args:
+        stage: Name of the stage or step
+        callback: Receives the StageTiming
+        device: "cuda" to sample device memory as well
+        parent: Stage the step belongs to
+    """
+    if callback is None:
+        yield
+        return
+
+    sampler = _MemorySampler(device)
+    sampler.start()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        sampler.stop()
+        callback(
+            StageTiming(
+                stage=stage,
+                wall_s=wall,
+                cpu_s=cpu,
+                peak_rss_mb=sampler.peak_rss_mb,
+                peak_device_mb=sampler.peak_device_mb,
+                parent=parent,
+            )
+        )
+
+
+def job_timing_record(
+    timings: list[StageTiming], audio_duration_s: float | None
+) -> dict:
+    """
+    Timing record of a job. The processing time is the sum of its stages,
+    so time spent queued between pipelined stages is left out.
+    """
+    processing_s = sum(t.wall_s for t in timings if t.parent is None)
+    return {
+        "stages": [t.to_dict() for t in timings],
+        "processing_s": round(processing_s, 3),
+        "audio_duration_s": audio_duration_s,
+        "real_time_factor": (
+            round(processing_s / audio_duration_s, 4) if audio_duration_s else None
+        ),
+    }
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class PipelineMetrics:
+    """
+    Aggregates stage timings and finished jobs, rendered in the Prometheus
+    text exposition format. Thread-safe.
+    """
+
+    def __init__(self, prefix: str = "diarization"):
+        self.prefix = prefix
+        self._stage_seconds: dict[tuple, _Histogram] = {}
+        self._stage_cpu_seconds: dict[tuple, float] = {}
+        self._stage_peak_rss: dict[tuple, float] = {}
+        self._stage_peak_device: dict[tuple, float] = {}
+        self._jobs: dict[tuple, int] = {}
+        self._real_time_factor = _Histogram(REAL_TIME_FACTOR_BUCKETS)
+        self._audio_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def observe_stage(self, timing: StageTiming):
+        # sub-steps are labelled with their stage, so stage totals aren't counted twice
+        if timing.parent is None:
+            labels = (timing.stage, "")
+        else:
+            labels = (timing.parent, timing.stage)
+        with self._lock:
+            if labels not in self._stage_seconds:
+                self._stage_seconds[labels] = _Histogram(STAGE_SECONDS_BUCKETS)
+            self._stage_seconds[labels].observe(timing.wall_s)
+            self._stage_cpu_seconds[labels] = (
+                self._stage_cpu_seconds.get(labels, 0.0) + timing.cpu_s
+            )
+            # peaks of the last run, the maximum would never come down again
+            if timing.peak_rss_mb is not None:
+                self._stage_peak_rss[labels] = timing.peak_rss_mb * 2**20
+            if timing.peak_device_mb is not None:
+                self._stage_peak_device[labels] = timing.peak_device_mb * 2**20
+
+    def observe_job(self, status: str, record: dict | None = None):
+        with self._lock:
+            self._jobs[(status,)] = self._jobs.get((status,), 0) + 1
+            if record is None or status != "completed":
+                return
+            if record.get("audio_duration_s"):
+                self._audio_seconds += record["audio_duration_s"]
+            if record.get("real_time_factor") is not None:
+                self._real_time_factor.observe(record["real_time_factor"])
+
+    def render(
+        self,
+        gauges: dict[str, tuple[str, float | None]] | None = None,
+        counters: dict[str, tuple[str, float]] | None = None,
+    ) -> str:
+        """
+        Metrics in the Prometheus text format.
+
+        Args:
+            gauges: Extra unlabelled gauges, {name: (help, value)}
+            counters: Extra unlabelled counters kept by the caller,
+                {name: (help, value)}, names end in _total
+        """
+        lines = []
+        stage_labels = ("stage", "step")
+
+        def family(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {self.prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+        def histogram(name: str, labels: tuple, names: tuple, hist: _Histogram):
+            metric = f"{self.prefix}_{name}"
+            for bound, count in zip(hist.buckets, hist.counts):
+                lines.append(
+                    f"{metric}_bucket{_labels((*names, 'le'), (*labels, bound))} {count}"
+                )
+            lines.append(
+                f"{metric}_bucket{_labels((*names, 'le'), (*labels, '+Inf'))} {hist.count}"
+            )
+            lines.append(f"{metric}_sum{_labels(names, labels)} {hist.sum:.6g}")
+            lines.append(f"{metric}_count{_labels(names, labels)} {hist.count}")
+
+        def samples(name: str, values: dict[tuple, float], names: tuple):
+            for labels, value in sorted(values.items()):
+                lines.append(f"{self.prefix}_{name}{_labels(names, labels)} {value:.6g}")
+
+        with self._lock:
+            family("stage_seconds", "histogram", "Wall time of pipeline stages")
+            for labels, hist in sorted(self._stage_seconds.items()):
+                histogram("stage_seconds", labels, stage_labels, hist)
+            family(
+                "stage_cpu_seconds_total",
+                "counter",
+                "Process CPU time spent while pipeline stages ran",
+            )
+            samples("stage_cpu_seconds_total", self._stage_cpu_seconds, stage_labels)
+            family(
+                "stage_peak_rss_bytes",
+                "gauge",
+                "Peak resident memory of the process during the last run of a stage",
+            )
+            samples("stage_peak_rss_bytes", self._stage_peak_rss, stage_labels)
+            family(
+                "stage_peak_device_memory_bytes",
+                "gauge",
+                "Peak GPU memory in use during the last run of a stage",
+            )
+            samples("stage_peak_device_memory_bytes", self._stage_peak_device, stage_labels)
+            family("jobs_total", "counter", "Finished jobs by status")
+            samples("jobs_total", self._jobs, ("status",))
+            family(
+                "job_real_time_factor",
+                "histogram",
+                "Processing seconds per second of audio of completed jobs",
+            )
+            histogram("job_real_time_factor", (), (), self._real_time_factor)
+            family("audio_seconds_total", "counter", "Audio processed by completed jobs")
+            lines.append(f"{self.prefix}_audio_seconds_total {self._audio_seconds:.6g}")
+
+        for name, (help_text, value) in (counters or {}).items():
+            family(name, "counter", help_text)
+            # byte counts outgrow six significant digits
+            lines.append(f"{self.prefix}_{name} {value}")
+        for name, (help_text, value) in (gauges or {}).items():
+            if value is None:
+                continue
+            family(name, "gauge", help_text)
+            lines.append(f"{self.prefix}_{name} {value:.6g}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,76 @@
+"""
+Partial results of running jobs.
+Pipeline stages publish events from worker threads, clients follow them
+from the event loop as Server-Sent Events.
+"""
+import asyncio
+import json
+import threading
+from typing import AsyncIterator
+
+
+class JobEventLog:
+    """
+    Append-only list of (event, data) pairs of one job.
+
+    Followers replay the events from any index and then wait for new ones,
+    so a client that reconnects with the last id it saw doesn't miss any.
+    """
+
+    def __init__(self):
+        self._events: list[tuple[str, dict]] = []
+        self._closed = False
+        self._lock = threading.Lock()
+        self._waiters: set[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    def _wake(self):
+        for loop, waiter in self._waiters:
+            loop.call_soon_threadsafe(waiter.set)
+
+    def publish(self, event: str, data: dict):
+        with self._lock:
+            if self._closed:
+                return
+            self._events.append((event, data))
+            self._wake()
+
+    def close(self):
+        """Mark the log finished, followers stop after the last event."""
+        with self._lock:
+            self._closed = True
+            self._wake()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    async def follow(self, start: int = 0) -> AsyncIterator[tuple[int, str, dict]]:
+        """Yield (index, event, data) from `start` until the log is closed."""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            index = start
+            while True:
+                waiter[1].clear()
+                with self._lock:
+                    events = self._events[index:]
+                    closed = self._closed
+                for event, data in events:
+                    yield index, event, data
+                    index += 1
+                if closed:
+                    return
+                if not events:
+                    await waiter[1].wait()
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+def format_sse(index: int, event: str, data: dict) -> str:
+    """Encode an event in the Server-Sent Events wire format."""
+    return f"id: {index}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
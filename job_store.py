@@ -0,0 +1,467 @@
+"""
+Storage for API jobs.
+The stores index jobs by status and creation time and keep running counts
+per status, so status polls, health checks and expiry don't scan every job.
+Queue positions aren't kept here: they come from the dispatch order of the
+FairQueue, which is rebuilt in O(queued jobs) once per change of the queue
+and read in O(1) by the polls in between.
+"""
+import heapq
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from enum import Enum
+from typing import Iterable
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+FINISHED_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED)
+
+
+@dataclass
+class Job:
+    id: str
+    status: JobStatus
+    audio_path: str
+    options: dict
+    audio_sha256: str | None = None
+    priority: str = "normal"
+    client_id: str = ""
+    duration_s: float | None = None
+    created_at: datetime = field(default_factory=datetime.now)
+    progress: str | None = None
+    result: dict | None = None
+    error: str | None = None
+    timings: dict | None = None
+
+
+class JobStore(ABC):
+    """
+    Interface of a job store. All methods are thread-safe.
+
+    Jobs are handed out as snapshots, changes go through `update` so every
+    store can keep its indexes consistent.
+    """
+
+    @abstractmethod
+    def add(self, job: Job):
+        """Store a new job, queued jobs are ordered by the time they were added."""
+
+    @abstractmethod
+    def get(self, job_id: str, include_result: bool = True) -> Job | None:
+        """
+        A snapshot of the job. Status polls pass include_result=False, the
+        snapshot's result is then None and a stored result isn't decoded.
+        """
+
+    @abstractmethod
+    def update(
+        self, job_id: str, expected: Iterable[JobStatus] | None = None, **changes
+    ) -> bool:
+        """
+        Change fields of a job.
+        Returns False if the job doesn't exist or its status isn't in `expected`.
+        """
+
+    @abstractmethod
+    def delete(
+        self, job_id: str, expected: Iterable[JobStatus] | None = None
+    ) -> Job | None:
+        """Remove a job unless its status isn't in `expected`, returns the removed job."""
+
+    @abstractmethod
+    def count_by_status(self) -> dict[JobStatus, int]:
+        """Number of jobs in every status."""
+
+    @abstractmethod
+    def pop_expired(self, created_before: datetime) -> list[Job]:
+        """Remove and return finished jobs created before the cutoff."""
+
+    def recover(self) -> list[str]:
+        """
+        Prepare jobs left over from a previous run.
+        Jobs that were processing are queued again. Returns the queued job ids
+        in queue order.
+        """
+        return []
+
+    def close(self):
+        pass
+
+
+class InMemoryJobStore(JobStore):
+    """
+    Keeps jobs in a dict, with finished jobs indexed by creation time in a
+    heap. Queue positions come from the dispatch queue, not the store.
+    """
+
+    def __init__(self):
+        self._jobs: dict[str, Job] = {}
+        self._seq: dict[str, int] = {}
+        self._next_seq = 0
+        self._finished: list[tuple[datetime, int, str]] = []  # heap, may hold stale ids
+        self._counts = {status: 0 for status in JobStatus}
+        self._lock = threading.Lock()
+
+    def _index(self, job_id: str, job: Job):
+        self._counts[job.status] += 1
+        if job.status in FINISHED_STATUSES:
+            heapq.heappush(self._finished, (job.created_at, self._seq[job_id], job_id))
+
+    def _unindex(self, job_id: str, job: Job):
+        self._counts[job.status] -= 1
+        # finished entries are dropped lazily in pop_expired
+
+    def add(self, job: Job):
+        with self._lock:
+            self._seq[job.id] = self._next_seq
+            self._next_seq += 1
+            self._jobs[job.id] = replace(job)
+            self._index(job.id, job)
+
+    def get(self, job_id: str, include_result: bool = True) -> Job | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return replace(job) if include_result else replace(job, result=None)
+
+    def update(
+        self, job_id: str, expected: Iterable[JobStatus] | None = None, **changes
+    ) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or (expected is not None and job.status not in expected):
+                return False
+            if "status" in changes and changes["status"] != job.status:
+                self._unindex(job_id, job)
+                job.status = changes.pop("status")
+                self._index(job_id, job)
+            for name, value in changes.items():
+                setattr(job, name, value)
+            return True
+
+    def delete(
+        self, job_id: str, expected: Iterable[JobStatus] | None = None
+    ) -> Job | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or (expected is not None and job.status not in expected):
+                return None
+            self._unindex(job_id, job)
+            del self._jobs[job_id]
+            del self._seq[job_id]
+            return job
+
+    def count_by_status(self) -> dict[JobStatus, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def pop_expired(self, created_before: datetime) -> list[Job]:
+        expired = []
+        with self._lock:
+            while self._finished and self._finished[0][0] < created_before:
+                _, seq, job_id = heapq.heappop(self._finished)
+                job = self._jobs.get(job_id)
+                # skip entries of deleted, re-added or re-queued jobs
+                if (
+                    job is None
+                    or self._seq[job_id] != seq
+                    or job.status not in FINISHED_STATUSES
+                ):
+                    continue
+                self._unindex(job_id, job)
+                del self._jobs[job_id]
+                del self._seq[job_id]
+                expired.append(job)
+        return expired
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Keeps jobs in a SQLite database in WAL mode so they survive restarts.
+
+    Every thread gets its own connection, readers don't block each other or
+    the writer. Triggers keep the job count of every status in job_counts,
+    recovery in queue order is answered from the (status, seq) index and
+    expiry from the (status, created_at) index.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL,
+            audio_path TEXT NOT NULL,
+            audio_sha256 TEXT,
+            priority TEXT NOT NULL DEFAULT 'normal',
+            client_id TEXT NOT NULL DEFAULT '',
+            duration_s REAL,
+            options TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            progress TEXT,
+            result TEXT,
+            error TEXT,
+            timings TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status_seq ON jobs (status, seq);
+        CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+        CREATE TABLE IF NOT EXISTS job_counts (
+            status TEXT PRIMARY KEY,
+            count INTEGER NOT NULL
+        );
+        CREATE TRIGGER IF NOT EXISTS jobs_count_insert AFTER INSERT ON jobs
+        BEGIN
+            INSERT INTO job_counts (status, count) VALUES (NEW.status, 1)
+            ON CONFLICT (status) DO UPDATE SET count = count + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS jobs_count_delete AFTER DELETE ON jobs
+        BEGIN
+            UPDATE job_counts SET count = count - 1 WHERE status = OLD.status;
+        END;
+        CREATE TRIGGER IF NOT EXISTS jobs_count_update AFTER UPDATE OF status ON jobs
+        WHEN OLD.status != NEW.status
+        BEGIN
+            UPDATE job_counts SET count = count - 1 WHERE status = OLD.status;
+            INSERT INTO job_counts (status, count) VALUES (NEW.status, 1)
+            ON CONFLICT (status) DO UPDATE SET count = count + 1;
+        END;
+    """
+    _COLUMNS = (
+        "id, status, audio_path, audio_sha256, priority, client_id, duration_s, "
+        "options, created_at, progress, result, error, timings"
+    )
+    # the result can be megabytes of JSON, status polls don't read it
+    _COLUMNS_WITHOUT_RESULT = (
+        "id, status, audio_path, audio_sha256, priority, client_id, duration_s, "
+        "options, created_at, progress, NULL, error, timings"
+    )
+    # columns added after the first schema, created on older databases
+    _ADDED_COLUMNS = {
+        "priority": "TEXT NOT NULL DEFAULT 'normal'",
+        "client_id": "TEXT NOT NULL DEFAULT ''",
+        "duration_s": "REAL",
+        "timings": "TEXT",
+    }
+    _JSON_FIELDS = ("options", "result", "timings")
+
+    def __init__(self, path: str, busy_timeout: float = 30.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if columns:
+            for name, definition in self._ADDED_COLUMNS.items():
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+        has_counts = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'job_counts'"
+        ).fetchone()
+        # databases created before the counts were kept start from a full count
+        backfill = (
+            ""
+            if has_counts
+            else "INSERT INTO job_counts (status, count) "
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status;"
+        )
+        try:
+            conn.executescript(f"BEGIN IMMEDIATE; {self._SCHEMA} {backfill} COMMIT;")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit, transactions are opened explicitly
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @classmethod
+    def _to_row(cls, **fields) -> dict:
+        row = dict(fields)
+        for name in cls._JSON_FIELDS:
+            if name in row and row[name] is not None:
+                row[name] = json.dumps(row[name])
+        if isinstance(row.get("status"), JobStatus):
+            row["status"] = row["status"].value
+        if isinstance(row.get("created_at"), datetime):
+            row["created_at"] = row["created_at"].timestamp()
+        return row
+
+    @staticmethod
+    def _to_job(row: tuple) -> Job:
+        (
+            job_id,
+            status,
+            audio_path,
+            audio_sha256,
+            priority,
+            client_id,
+            duration_s,
+            options,
+            created_at,
+            progress,
+            result,
+            error,
+            timings,
+        ) = row
+        return Job(
+            id=job_id,
+            status=JobStatus(status),
+            audio_path=audio_path,
+            audio_sha256=audio_sha256,
+            priority=priority,
+            client_id=client_id,
+            duration_s=duration_s,
+            options=json.loads(options),
+            created_at=datetime.fromtimestamp(created_at),
+            progress=progress,
+            result=json.loads(result) if result is not None else None,
+            error=error,
+            timings=json.loads(timings) if timings is not None else None,
+        )
+
+    @staticmethod
+    def _status_filter(expected: Iterable[JobStatus] | None) -> tuple[str, list]:
+        if expected is None:
+            return "", []
+        statuses = [JobStatus(s).value for s in expected]
+        return f" AND status IN ({', '.join('?' * len(statuses))})", statuses
+
+    def add(self, job: Job):
+        row = self._to_row(
+            id=job.id,
+            status=job.status,
+            audio_path=job.audio_path,
+            audio_sha256=job.audio_sha256,
+            priority=job.priority,
+            client_id=job.client_id,
+            duration_s=job.duration_s,
+            options=job.options,
+            created_at=job.created_at,
+            progress=job.progress,
+            result=job.result,
+            error=job.error,
+            timings=job.timings,
+        )
+        self._connection().execute(
+            f"INSERT INTO jobs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+            list(row.values()),
+        )
+
+    def get(self, job_id: str, include_result: bool = True) -> Job | None:
+        columns = self._COLUMNS if include_result else self._COLUMNS_WITHOUT_RESULT
+        row = (
+            self._connection()
+            .execute(f"SELECT {columns} FROM jobs WHERE id = ?", (job_id,))
+            .fetchone()
+        )
+        return self._to_job(row) if row is not None else None
+
+    def update(
+        self, job_id: str, expected: Iterable[JobStatus] | None = None, **changes
+    ) -> bool:
+        row = self._to_row(**changes)
+        status_sql, statuses = self._status_filter(expected)
+        assignments = ", ".join(f"{name} = ?" for name in row) or "id = id"
+        cursor = self._connection().execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ?{status_sql}",
+            [*row.values(), job_id, *statuses],
+        )
+        return cursor.rowcount > 0
+
+    def delete(
+        self, job_id: str, expected: Iterable[JobStatus] | None = None
+    ) -> Job | None:
+        status_sql, statuses = self._status_filter(expected)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?{status_sql}",
+                [job_id, *statuses],
+            ).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self._to_job(row) if row is not None else None
+
+    def count_by_status(self) -> dict[JobStatus, int]:
+        counts = {status: 0 for status in JobStatus}
+        rows = self._connection().execute("SELECT status, count FROM job_counts")
+        for status, count in rows:
+            counts[JobStatus(status)] = count
+        return counts
+
+    def pop_expired(self, created_before: datetime) -> list[Job]:
+        status_sql, statuses = self._status_filter(FINISHED_STATUSES)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                f"SELECT {self._COLUMNS} FROM jobs WHERE created_at < ?{status_sql}",
+                [created_before.timestamp(), *statuses],
+            ).fetchall()
+            conn.executemany(
+                "DELETE FROM jobs WHERE id = ?", [(row[0],) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [self._to_job(row) for row in rows]
+
+    def recover(self) -> list[str]:
+        conn = self._connection()
+        conn.execute(
+            "UPDATE jobs SET status = ?, progress = NULL WHERE status = ?",
+            (JobStatus.QUEUED.value, JobStatus.PROCESSING.value),
+        )
+        rows = conn.execute(
+            "SELECT id FROM jobs WHERE status = ? ORDER BY seq",
+            (JobStatus.QUEUED.value,),
+        )
+        return [job_id for (job_id,) in rows]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def create_job_store(backend: str, path: str | None = None) -> JobStore:
+    """Create the job store named by `backend` ("memory" or "sqlite")."""
+    if backend == "memory":
+        return InMemoryJobStore()
+    if backend == "sqlite":
+        if not path:
+            raise ValueError("The sqlite job store needs a database path")
+        return SQLiteJobStore(path)
+    raise ValueError(f"Unknown job store: {backend}")
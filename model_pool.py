@@ -0,0 +1,236 @@
+"""
+Process-wide registry of loaded models.
+Keeps models resident between jobs so short requests don't pay the load cost.
+"""
+import gc
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+import torch
+
+# (kind, model_name, device, compute_type)
+ModelKey = tuple[str, str, str, str]
+
+# Approximate float16 weight size in MB of the faster-whisper checkpoints.
+# CTranslate2 models don't expose their parameters, so the pool uses this
+# table to account for them.
+WHISPER_MODEL_SIZES_MB = {
+    "tiny": 80,
+    "base": 150,
+    "small": 490,
+    "medium": 1540,
+    "large": 3100,
+    "turbo": 1620,
+    "distil-large": 1520,
+    "distil-medium": 790,
+    "distil-small": 340,
+}
+
+COMPUTE_TYPE_SCALE = {
+    "int8": 0.5,
+    "int8_float16": 0.5,
+    "int8_float32": 0.5,
+    "float16": 1.0,
+    "bfloat16": 1.0,
+    "float32": 2.0,
+}
+
+
+def estimate_whisper_size_mb(model_name: str, compute_type: str) -> float:
+    """Estimate the resident size of a faster-whisper model."""
+    name = model_name.split("/")[-1].lower().removeprefix("faster-whisper-")
+    if "turbo" in name:
+        name = "turbo"
+    # longest matching prefix wins, e.g. "distil-large-v3" over "large"
+    matches = [prefix for prefix in WHISPER_MODEL_SIZES_MB if name.startswith(prefix)]
+    if not matches:
+        return 0.0
+    base_size = WHISPER_MODEL_SIZES_MB[max(matches, key=len)]
+    return base_size * COMPUTE_TYPE_SCALE.get(compute_type, 1.0)
+
+
+def estimate_model_size_mb(model: Any) -> float:
+    """
+    Estimate the memory held by a model's weights.
+    Understands torch modules, tuples of them and the wrappers used in this
+    repo (MSDDDiarizer.model, PunctuationModel.pipe.model).
+    """
+    if isinstance(model, torch.nn.Module):
+        size = sum(p.numel() * p.element_size() for p in model.parameters())
+        size += sum(b.numel() * b.element_size() for b in model.buffers())
+        return size / 2**20
+    if isinstance(model, (tuple, list)):
+        return sum(estimate_model_size_mb(m) for m in model)
+    for attr in ("model", "pipe"):
+        inner = getattr(model, attr, None)
+        if inner is not None and inner is not model:
+            return estimate_model_size_mb(inner)
+    return 0.0
+
+
+@dataclass
+class _PoolEntry:
+    model: Any
+    size_mb: float
+    loaded_at: float = field(default_factory=time.monotonic)
+    hits: int = 0
+
+
+class ModelPool:
+    """
+    LRU cache of loaded models keyed by (kind, model name, device, compute type).
+
+    Args:
+        max_models: Maximum number of resident models (None for unlimited)
+        memory_budget_mb: Maximum total estimated size of resident models
+            (None for unlimited). The most recently loaded model is always
+            kept, even if it alone exceeds the budget.
+    """
+
+    def __init__(
+        self,
+        max_models: int | None = None,
+        memory_budget_mb: float | None = None,
+    ):
+        self.max_models = max_models
+        self.memory_budget_mb = memory_budget_mb
+        self._entries: OrderedDict[ModelKey, _PoolEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: dict[ModelKey, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(
+        self,
+        kind: str,
+        model_name: str,
+        device: str,
+        compute_type: str,
+        loader: Callable[[], Any],
+        size_mb: float | None = None,
+    ) -> Any:
+        """
+        Return the resident model for the key, loading it with `loader` on a miss.
+
+        Args:
+            kind: Model family ("whisper", "alignment", "diarizer", ...)
+            model_name: Model name or path
+            device: Device the model lives on
+            compute_type: Precision the model was loaded with
+            loader: Zero-argument callable that loads the model
+            size_mb: Size estimate; measured from the model if None
+        """
+        key = (kind, model_name, device, compute_type)
+
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                return entry.model
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Load outside the pool lock so other keys stay available, but only
+        # once per key when several jobs miss at the same time.
+        with load_lock:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry is not None:
+                    return entry.model
+                self.misses += 1
+                if size_mb is not None:
+                    self._evict_until_fits(size_mb, count_new=True)
+
+            logging.info(f"Loading {kind} model {model_name} on {device}")
+            model = loader()
+            if size_mb is None:
+                size_mb = estimate_model_size_mb(model)
+
+            with self._lock:
+                self._entries[key] = _PoolEntry(model=model, size_mb=size_mb)
+                self._evict_until_fits(0, count_new=False)
+
+        return model
+
+    def _lookup(self, key: ModelKey) -> _PoolEntry | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            self.hits += 1
+        return entry
+
+    def _evict_until_fits(self, extra_mb: float, count_new: bool):
+        """Evict least recently used models until the limits are respected."""
+        evicted = False
+        # the newest entry is never evicted by its own insertion
+        min_entries = 0 if count_new else 1
+        while len(self._entries) > min_entries:
+            over_count = (
+                self.max_models is not None
+                and len(self._entries) + int(count_new) > self.max_models
+            )
+            over_budget = (
+                self.memory_budget_mb is not None
+                and self.total_size_mb + extra_mb > self.memory_budget_mb
+            )
+            if not (over_count or over_budget):
+                break
+            key, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            evicted = True
+            logging.info(f"Evicting {key[0]} model {key[1]} from model pool")
+
+        if evicted:
+            gc.collect()
+            torch.cuda.empty_cache()
+
+    def is_resident(
+        self, kind: str, model_name: str, device: str, compute_type: str
+    ) -> bool:
+        with self._lock:
+            return (kind, model_name, device, compute_type) in self._entries
+
+    @property
+    def total_size_mb(self) -> float:
+        return sum(entry.size_mb for entry in self._entries.values())
+
+    def evict(self, kind: str, model_name: str, device: str, compute_type: str):
+        """Drop a single model from the pool."""
+        with self._lock:
+            self._entries.pop((kind, model_name, device, compute_type), None)
+        gc.collect()
+        torch.cuda.empty_cache()
+
+    def clear(self):
+        """Drop every resident model."""
+        with self._lock:
+            self._entries.clear()
+        gc.collect()
+        torch.cuda.empty_cache()
+
+    def stats(self) -> dict:
+        """Summary of the pool contents for health reporting."""
+        with self._lock:
+            return {
+                "models": [
+                    {
+                        "kind": key[0],
+                        "name": key[1],
+                        "device": key[2],
+                        "compute_type": key[3],
+                        "size_mb": round(entry.size_mb, 1),
+                        "hits": entry.hits,
+                    }
+                    for key, entry in self._entries.items()
+                ],
+                "total_size_mb": round(self.total_size_mb, 1),
+                "memory_budget_mb": self.memory_budget_mb,
+                "max_models": self.max_models,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,128 @@
+"""
+On-disk cache of finished diarization results.
+Results are keyed by the audio content and the options that change the
+output, so resubmitting a recording returns the stored result.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+# Job options that change the result, parallel_diarization only changes how
+# the work is scheduled
+RESULT_OPTIONS = (
+    "model_name",
+    "language",
+    "stemming",
+    "suppress_numerals",
+    "batch_size",
+    "alignment_mode",
+)
+
+
+def result_cache_key(audio_sha256: str, options: dict) -> str:
+    """Key of a result, the hash of the audio hash and the result options."""
+    payload = json.dumps(
+        {
+            "audio_sha256": audio_sha256,
+            "options": {name: options.get(name) for name in RESULT_OPTIONS},
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Stores results as JSON files and evicts the least recently used ones
+    once the directory grows past `max_bytes`.
+
+    Recency survives restarts through the file modification times, which
+    are bumped on every hit.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, int] = OrderedDict()  # key -> size, LRU first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            if not name.endswith(".json"):
+                continue
+            stat = os.stat(os.path.join(directory, name))
+            files.append((stat.st_mtime, name.removesuffix(".json"), stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+        with self._lock:
+            self._evict()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _remove(self, key: str):
+        self._total_bytes -= self._entries.pop(key)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key)) as f:
+                    result = json.load(f)
+                os.utime(self._path(key))
+            except (OSError, ValueError):
+                logging.warning("Dropping unreadable cached result %s", key)
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: str, result: dict):
+        data = json.dumps(result).encode()
+        with self._lock:
+            if len(data) > self.max_bytes:
+                return
+            if key in self._entries:
+                self._remove(key)
+            # write to a temp file first so readers never see a partial result
+            tmp_path = self._path(key) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def stats(self) -> dict:
+        """Cache state for health reporting."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_mb": round(self._total_bytes / 2**20, 1),
+                "max_size_mb": round(self.max_bytes / 2**20, 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
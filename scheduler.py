@@ -0,0 +1,333 @@
+"""
+Memory-aware admission control for running several jobs at once.
+Jobs are admitted when the estimated footprint of their remaining pipeline
+stages fits both the configured budget and the measured free memory.
+"""
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+# Assumed audio length when the duration of an upload is unknown
+DEFAULT_DURATION_SECONDS = 600
+# Assumed batch size of jobs whose batch sizes are planned when they run
+AUTO_BATCH_SIZE = 8
+
+
+@dataclass(frozen=True)
+class StageFootprint:
+    """Rough memory profile of a pipeline stage in MB."""
+
+    model_mb: float  # weights, not counted when already resident in the model pool
+    working_mb: float  # fixed activations and buffers
+    per_batch_mb: float = 0.0
+    per_minute_mb: float = 0.0
+
+
+# Ordered like the stages of diarize_core.run_diarization. The whisper
+# weights depend on the model name and are estimated separately.
+STAGE_FOOTPRINTS = {
+    "separating_vocals": StageFootprint(
+        model_mb=320, working_mb=1000, per_minute_mb=60
+    ),
+    "transcribing": StageFootprint(model_mb=0, working_mb=300, per_batch_mb=150),
+    "aligning": StageFootprint(
+        model_mb=1200, working_mb=200, per_batch_mb=250, per_minute_mb=10
+    ),
+    "diarizing": StageFootprint(model_mb=400, working_mb=1000, per_minute_mb=20),
+    "post_processing": StageFootprint(model_mb=1100, working_mb=200),
+}
+
+# 16 kHz float32 waveform kept on the host for the whole job
+AUDIO_MB_PER_MINUTE = 16000 * 4 * 60 / 2**20
+
+
+def estimate_stage_memory(
+    options: dict,
+    device: str,
+    duration_s: float | None = None,
+    whisper_model_mb: float = 0.0,
+    resident_stages: set[str] | None = None,
+) -> dict[str, dict[str, float]]:
+    """
+    Estimate the memory each pipeline stage of a job needs.
+
+    Args:
+        options: Job options as passed to run_diarization
+        device: Device the models run on ("cuda" or "cpu")
+        duration_s: Audio duration, DEFAULT_DURATION_SECONDS if unknown
+        whisper_model_mb: Size of the whisper weights
+        resident_stages: Stages whose model is already loaded
+
+    Returns:
+        {stage: {device: megabytes}}
+    """
+    minutes = (duration_s or DEFAULT_DURATION_SECONDS) / 60
+    batch_size = options.get("batch_size")
+    batch_size = AUTO_BATCH_SIZE if batch_size is None else max(batch_size, 1)
+    resident_stages = resident_stages or set()
+    audio_mb = AUDIO_MB_PER_MINUTE * minutes
+
+    estimates = {}
+    for stage, footprint in STAGE_FOOTPRINTS.items():
+        if stage == "separating_vocals" and not options.get("stemming", True):
+            continue
+
+        model_mb = whisper_model_mb if stage == "transcribing" else footprint.model_mb
+        if device == "cuda" and stage == "aligning":
+            # the alignment model is loaded in float16 on GPU
+            model_mb /= 2
+        if stage in resident_stages:
+            model_mb = 0.0
+
+        stage_mb = (
+            model_mb
+            + footprint.working_mb
+            + footprint.per_batch_mb * batch_size
+            + footprint.per_minute_mb * minutes
+        )
+        if device == "cpu":
+            estimates[stage] = {"cpu": stage_mb + audio_mb}
+        else:
+            estimates[stage] = {"cpu": audio_mb, device: stage_mb}
+
+    if options.get("parallel_diarization"):
+        # the diarization worker runs alongside transcription and alignment
+        # and holds its own copy of the audio in shared memory
+        diarizing = estimates["diarizing"]
+        for stage in ("transcribing", "aligning"):
+            estimates[stage] = {
+                d: estimates[stage].get(d, 0.0) + diarizing.get(d, 0.0)
+                for d in estimates[stage].keys() | diarizing.keys()
+            }
+    return estimates
+
+
+def peak_memory(
+    stage_estimates: dict[str, dict[str, float]], from_stage: str | None = None
+) -> dict[str, float]:
+    """Peak memory per device over the stages from `from_stage` onwards."""
+    stages = list(stage_estimates)
+    if from_stage in stage_estimates:
+        stages = stages[stages.index(from_stage) :]
+    elif from_stage is not None and from_stage not in STAGE_FOOTPRINTS:
+        # past the last estimated stage (e.g. "generating_output")
+        stages = []
+
+    peak: dict[str, float] = {}
+    for stage in stages:
+        for device, mb in stage_estimates[stage].items():
+            peak[device] = max(peak.get(device, 0.0), mb)
+    return peak
+
+
+class MemoryProbe(ABC):
+    """Measures free memory. Subclass it to fake memory conditions in tests."""
+
+    @abstractmethod
+    def available_mb(self, device: str) -> float | None:
+        """Free memory on the device, None if it can't be measured."""
+
+    @abstractmethod
+    def total_mb(self, device: str) -> float | None:
+        """Total memory on the device, None if it can't be measured."""
+
+    def rss_mb(self) -> float | None:
+        """Resident set size of this process."""
+        return None
+
+
+class SystemMemoryProbe(MemoryProbe):
+    """Reads host memory from /proc and device memory from torch.cuda."""
+
+    def available_mb(self, device: str) -> float | None:
+        if device == "cpu":
+            return self._meminfo_mb("MemAvailable")
+        import torch
+
+        if not torch.cuda.is_available():
+            return None
+        free, _ = torch.cuda.mem_get_info()
+        # memory cached by torch's allocator is reusable by new jobs
+        reclaimable = torch.cuda.memory_reserved() - torch.cuda.memory_allocated()
+        return (free + reclaimable) / 2**20
+
+    def total_mb(self, device: str) -> float | None:
+        if device == "cpu":
+            return self._meminfo_mb("MemTotal")
+        import torch
+
+        if not torch.cuda.is_available():
+            return None
+        return torch.cuda.get_device_properties(0).total_memory / 2**20
+
+    def rss_mb(self) -> float | None:
+        try:
+            with open("/proc/self/statm") as f:
+                resident_pages = int(f.read().split()[1])
+        except (OSError, ValueError, IndexError):
+            return None
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+    @staticmethod
+    def _meminfo_mb(field_name: str) -> float | None:
+        try:
+            with open("/proc/meminfo") as f:
+                for line in f:
+                    if line.startswith(field_name + ":"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+
+@dataclass
+class _AdmittedJob:
+    stage_estimates: dict[str, dict[str, float]]
+    reserved: dict[str, float]
+
+
+class JobScheduler:
+    """
+    Admits jobs while their estimated memory fits under the budget.
+
+    A job reserves the peak footprint of its remaining stages. The
+    reservation shrinks as the job advances through the pipeline, which
+    lets the next job start once the heavy stages are behind it. One job
+    is always admitted when nothing is running so oversized jobs still run.
+
+    Args:
+        max_concurrent: Upper bound on simultaneously running jobs
+        budgets_mb: Memory budget per device; defaults to
+            `budget_fraction` of the device's total memory
+        budget_fraction: Fraction of total memory used as default budget
+        headroom_mb: Free memory that must remain after admitting a job
+        probe: Memory probe, SystemMemoryProbe if None
+        poll_interval: Seconds between re-checks while a job waits,
+            measured memory can change without a release
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 1,
+        budgets_mb: dict[str, float] | None = None,
+        budget_fraction: float = 0.9,
+        headroom_mb: float = 512,
+        probe: MemoryProbe | None = None,
+        poll_interval: float = 1.0,
+    ):
+        self.max_concurrent = max(max_concurrent, 1)
+        self.budgets_mb = dict(budgets_mb or {})
+        self.budget_fraction = budget_fraction
+        self.headroom_mb = headroom_mb
+        self.probe = probe or SystemMemoryProbe()
+        self.poll_interval = poll_interval
+        self._running: dict[str, _AdmittedJob] = {}
+        self._cond = threading.Condition()
+
+    def _budget(self, device: str) -> float | None:
+        if device not in self.budgets_mb:
+            total = self.probe.total_mb(device)
+            self.budgets_mb[device] = (
+                total * self.budget_fraction if total is not None else None
+            )
+        return self.budgets_mb[device]
+
+    def _reserved(self, device: str) -> float:
+        return sum(job.reserved.get(device, 0.0) for job in self._running.values())
+
+    def _fits(self, need: dict[str, float]) -> bool:
+        if not self._running:
+            return True
+        if len(self._running) >= self.max_concurrent:
+            return False
+
+        for device, mb in need.items():
+            budget = self._budget(device)
+            if budget is not None and self._reserved(device) + mb > budget:
+                return False
+            available = self.probe.available_mb(device)
+            if available is not None and available - self.headroom_mb < mb:
+                return False
+        return True
+
+    def try_admit(
+        self, job_id: str, stage_estimates: dict[str, dict[str, float]]
+    ) -> bool:
+        """Admit the job if it fits right now, without waiting."""
+        need = peak_memory(stage_estimates)
+        with self._cond:
+            if not self._fits(need):
+                return False
+            self._running[job_id] = _AdmittedJob(stage_estimates, need)
+            return True
+
+    def admit(
+        self,
+        job_id: str,
+        stage_estimates: dict[str, dict[str, float]],
+        timeout: float | None = None,
+    ) -> bool:
+        """
+        Block until the job fits, then reserve its memory.
+        Returns False if the timeout expired first.
+        """
+        need = peak_memory(stage_estimates)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._fits(need):
+                # wake up periodically, measured free memory can change
+                # without any job being released
+                wait = self.poll_interval
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        return False
+                self._cond.wait(wait)
+            self._running[job_id] = _AdmittedJob(stage_estimates, need)
+            return True
+
+    def advance(self, job_id: str, stage: str):
+        """Shrink a job's reservation to the stages it still has to run."""
+        with self._cond:
+            job = self._running.get(job_id)
+            if job is None:
+                return
+            job.reserved = peak_memory(job.stage_estimates, from_stage=stage)
+            self._cond.notify_all()
+
+    def release(self, job_id: str):
+        """Return a finished job's reservation."""
+        with self._cond:
+            self._running.pop(job_id, None)
+            self._cond.notify_all()
+
+    @property
+    def running(self) -> int:
+        with self._cond:
+            return len(self._running)
+
+    def stats(self) -> dict:
+        """Scheduler state for health reporting."""
+        with self._cond:
+            devices = sorted(
+                {d for job in self._running.values() for d in job.reserved}
+                | set(self.budgets_mb)
+            )
+            budgets = {d: self._budget(d) for d in devices}
+            available = {d: self.probe.available_mb(d) for d in devices}
+            return {
+                "running_jobs": len(self._running),
+                "max_concurrent_jobs": self.max_concurrent,
+                "reserved_mb": {d: round(self._reserved(d), 1) for d in devices},
+                "budget_mb": {
+                    d: round(mb, 1) if mb is not None else None
+                    for d, mb in budgets.items()
+                },
+                "available_mb": {
+                    d: round(mb, 1) if mb is not None else None
+                    for d, mb in available.items()
+                },
+                "rss_mb": self.probe.rss_mb(),
+            }
@@ -0,0 +1,157 @@
+"""
+Assembly-line execution of the diarization pipeline across jobs.
+Every stage has its own worker threads and a bounded input queue, so one job
+can be transcribed while the previous one is diarized and the one before
+that is punctuated.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from queue import Queue
+from typing import Any, Callable
+
+from model_pool import ModelPool
+
+# Called once per job with the job state and the exception that stopped it
+DoneCallback = Callable[[Any, BaseException | None], None]
+
+_STOP = object()
+
+
+@dataclass
+class Stage:
+    """
+    One step of the assembly line.
+
+    Args:
+        name: Stage name, reported through the job's run_stage
+        fn: Function run on the job state
+        workers: Number of threads running this stage
+        queue_size: Jobs that may wait in front of the stage
+        model_pool: Pool holding this stage's resident model, assigned to
+            the job state's `model_pool` while the stage runs
+    """
+
+    name: str
+    fn: Callable[[Any], None]
+    workers: int = 1
+    queue_size: int = 2
+    model_pool: ModelPool | None = None
+    queue: Queue = field(init=False)
+    busy: int = field(default=0, init=False)
+    busy_seconds: float = field(default=0.0, init=False)
+    processed: int = field(default=0, init=False)
+    failed: int = field(default=0, init=False)
+
+    def __post_init__(self):
+        self.queue = Queue(maxsize=max(self.queue_size, 1))
+
+
+class StagedExecutor:
+    """
+    Runs jobs through a fixed sequence of stages connected by bounded queues.
+
+    A full queue blocks the stage in front of it, so the number of jobs in
+    flight (and the memory they hold) is bounded by the queue sizes and
+    worker counts.
+    """
+
+    def __init__(self, stages: list[Stage]):
+        self.stages = stages
+        self._threads: list[threading.Thread] = []
+        self._stats_lock = threading.Lock()
+        self._started_at: float | None = None
+
+    def start(self):
+        self._started_at = time.monotonic()
+        for index, stage in enumerate(self.stages):
+            for worker_idx in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._stage_worker,
+                    args=(index,),
+                    name=f"stage-{stage.name}-{worker_idx}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, state: Any, on_done: DoneCallback):
+        """Queue a job at the first stage, blocking while that queue is full."""
+        self.stages[0].queue.put((state, on_done))
+
+    def shutdown(self):
+        """Stop the workers once the queued jobs have been processed."""
+        for stage in self.stages:
+            for _ in range(stage.workers):
+                stage.queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    def _stage_worker(self, index: int):
+        stage = self.stages[index]
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                break
+            state, on_done = item
+
+            if stage.model_pool is not None:
+                state.model_pool = stage.model_pool
+
+            with self._stats_lock:
+                stage.busy += 1
+            started = time.monotonic()
+            error = None
+            try:
+                # may stop a job that was cancelled while it waited for the stage
+                if hasattr(state, "run_stage"):
+                    state.run_stage(stage.name, stage.fn)
+                else:
+                    stage.fn(state)
+            except Exception as e:
+                logging.exception(f"Stage {stage.name} failed")
+                error = e
+            finally:
+                with self._stats_lock:
+                    stage.busy -= 1
+                    stage.busy_seconds += time.monotonic() - started
+                    if error is None:
+                        stage.processed += 1
+                    else:
+                        stage.failed += 1
+
+            if error is None and index + 1 < len(self.stages):
+                # blocks while the next stage is backed up
+                self.stages[index + 1].queue.put((state, on_done))
+            else:
+                self._finish(state, on_done, error)
+
+    @staticmethod
+    def _finish(state: Any, on_done: DoneCallback, error: BaseException | None):
+        try:
+            on_done(state, error)
+        except Exception:
+            logging.exception("Job completion callback failed")
+
+    def stats(self) -> dict:
+        """Per-stage queue depth and utilisation for health reporting."""
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        with self._stats_lock:
+            return {
+                stage.name: {
+                    "workers": stage.workers,
+                    "busy_workers": stage.busy,
+                    "queue_depth": stage.queue.qsize(),
+                    "queue_size": stage.queue.maxsize,
+                    "processed": stage.processed,
+                    "failed": stage.failed,
+                    "utilisation": (
+                        round(stage.busy_seconds / (elapsed * stage.workers), 3)
+                        if elapsed > 0
+                        else 0.0
+                    ),
+                }
+                for stage in self.stages
+            }
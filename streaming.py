@@ -0,0 +1,253 @@
+"""
+Real-time transcription and diarization of a live audio stream.
+Whisper re-decodes a sliding window of the audio that hasn't been committed
+yet. Segments far enough behind the live edge are committed and labelled
+by clustering their TitaNet embeddings online, so speaker ids stay stable
+for the whole stream.
+"""
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import torch
+
+SAMPLING_RATE = 16000
+# New audio needed before the window is decoded again
+STEP_SECONDS = 1.0
+# Segments ending closer than this to the live edge may still change
+HOLDBACK_SECONDS = 2.0
+# Longest uncommitted window, beyond it everything but the last segment is
+# committed so every decoding pass stays short
+MAX_WINDOW_SECONDS = 20.0
+# Shorter segments keep the previous speaker, their embeddings are unreliable
+MIN_EMBEDDING_SECONDS = 0.5
+# Cosine similarity to a speaker centroid needed to join that speaker
+SPEAKER_SIMILARITY = 0.55
+MAX_SPEAKERS = 8
+# Greedy decoding keeps each pass short
+BEAM_SIZE = 1
+
+
+@dataclass
+class StreamSegment:
+    """A transcribed span of the stream, times in seconds from its start."""
+
+    start: float
+    end: float
+    text: str
+    speaker: int | None = None
+
+    def to_dict(self) -> dict:
+        segment = {
+            "start": round(self.start, 3),
+            "end": round(self.end, 3),
+            "text": self.text.strip(),
+        }
+        if self.speaker is not None:
+            segment["speaker"] = self.speaker
+        return segment
+
+
+class OnlineSpeakerClustering:
+    """
+    Assigns speaker ids to embeddings one at a time.
+
+    Each speaker is the running mean of its embeddings. An embedding joins
+    the most similar speaker if it is similar enough, otherwise it starts a
+    new one. Ids are never reassigned, so labels already sent stay valid.
+    """
+
+    def __init__(
+        self, threshold: float = SPEAKER_SIMILARITY, max_speakers: int = MAX_SPEAKERS
+    ):
+        self.threshold = threshold
+        self.max_speakers = max_speakers
+        self._sums: list[torch.Tensor] = []
+
+    @property
+    def num_speakers(self) -> int:
+        return len(self._sums)
+
+    def assign(self, embedding: torch.Tensor) -> int:
+        embedding = torch.nn.functional.normalize(embedding.reshape(-1).float(), dim=0)
+        if self._sums:
+            centroids = torch.nn.functional.normalize(torch.stack(self._sums), dim=1)
+            similarities = centroids @ embedding
+            best = int(similarities.argmax())
+            if (
+                similarities[best] >= self.threshold
+                or len(self._sums) >= self.max_speakers
+            ):
+                self._sums[best] = self._sums[best] + embedding
+                return best
+        self._sums.append(embedding)
+        return len(self._sums) - 1
+
+
+class StreamingSession:
+    """
+    State of one live stream.
+
+    `feed` may be called from another thread while `step` runs, `step`
+    itself must not run concurrently.
+
+    Args:
+        whisper_model: faster_whisper.WhisperModel
+        diarizer: MSDDDiarizer whose speaker model embeds the segments,
+            segments are not labelled if None
+        language: Language code, detected on the first pass if None
+        step_seconds: New audio needed before the window is decoded again
+        holdback_seconds: Segments ending closer to the live edge stay tentative
+        max_window_seconds: Longest uncommitted window
+    """
+
+    def __init__(
+        self,
+        whisper_model,
+        diarizer=None,
+        language: str | None = None,
+        step_seconds: float = STEP_SECONDS,
+        holdback_seconds: float = HOLDBACK_SECONDS,
+        max_window_seconds: float = MAX_WINDOW_SECONDS,
+        clustering: OnlineSpeakerClustering | None = None,
+    ):
+        self.whisper_model = whisper_model
+        self.diarizer = diarizer
+        self.language = language
+        self.step_seconds = step_seconds
+        self.holdback_seconds = holdback_seconds
+        self.max_window_seconds = max_window_seconds
+        self.clustering = clustering or OnlineSpeakerClustering()
+
+        self._window = np.zeros(0, dtype=np.float32)  # uncommitted audio
+        self._window_start = 0.0  # stream time of the first window sample
+        self._chunks: list[np.ndarray] = []
+        self._received = 0
+        self._decoded = 0
+        self._last_fed_at: float | None = None
+        self._last_speaker: int | None = None
+        self._lock = threading.Lock()
+        self.latencies: list[float] = []
+
+    def feed(self, samples: np.ndarray):
+        """Append 16 kHz mono float32 samples."""
+        with self._lock:
+            self._chunks.append(np.asarray(samples, dtype=np.float32).reshape(-1))
+            self._received += len(self._chunks[-1])
+            self._last_fed_at = time.monotonic()
+
+    @property
+    def pending_seconds(self) -> float:
+        """Audio received since the last decoding pass."""
+        with self._lock:
+            return (self._received - self._decoded) / SAMPLING_RATE
+
+    def ready(self) -> bool:
+        return self.pending_seconds >= self.step_seconds
+
+    def step(self, final: bool = False) -> tuple[list[StreamSegment], list[StreamSegment]]:
+        """
+        Decode the uncommitted window.
+
+        Args:
+            final: Commit every segment, the stream has ended
+
+        Returns:
+            (segments committed by this pass, tentative segments after them)
+        """
+        with self._lock:
+            if self._chunks:
+                self._window = np.concatenate([self._window, *self._chunks])
+                self._chunks = []
+            self._decoded = self._received
+            fed_at = self._last_fed_at
+        window = self._window
+        duration = len(window) / SAMPLING_RATE
+        if duration == 0:
+            return [], []
+
+        segments, info = self.whisper_model.transcribe(
+            window,
+            self.language,
+            beam_size=BEAM_SIZE,
+            vad_filter=True,
+            condition_on_previous_text=False,
+        )
+        segments = [
+            StreamSegment(segment.start, min(segment.end, duration), segment.text)
+            for segment in segments
+            if segment.text.strip()
+        ]
+        if self.language is None:
+            # keep the language of the first pass, re-detecting it on short
+            # windows makes it flip
+            self.language = info.language
+
+        if final:
+            num_committed = len(segments)
+        else:
+            num_committed = sum(
+                segment.end <= duration - self.holdback_seconds for segment in segments
+            )
+            if duration > self.max_window_seconds:
+                num_committed = max(num_committed, len(segments) - 1, 1)
+        num_committed = min(num_committed, len(segments))
+        committed, tentative = segments[:num_committed], segments[num_committed:]
+
+        for segment in committed:
+            segment.speaker = self._label(window, segment)
+
+        # drop the committed audio, or old silence when nothing was said
+        if committed:
+            cut = committed[-1].end
+        elif not segments and duration > self.max_window_seconds:
+            cut = duration - self.holdback_seconds
+        else:
+            cut = 0.0
+        if final:
+            cut = duration
+        cut_samples = int(cut * SAMPLING_RATE)
+        self._window = self._window[cut_samples:]
+
+        for segment in committed + tentative:
+            segment.start += self._window_start
+            segment.end += self._window_start
+        self._window_start += cut_samples / SAMPLING_RATE
+
+        if fed_at is not None:
+            self.latencies.append(time.monotonic() - fed_at)
+        return committed, tentative
+
+    def _label(self, window: np.ndarray, segment: StreamSegment) -> int | None:
+        """Speaker of a committed segment, times relative to the window."""
+        if self.diarizer is None:
+            return None
+        if segment.end - segment.start < MIN_EMBEDDING_SECONDS:
+            return self._last_speaker if self._last_speaker is not None else 0
+
+        embedding = self.diarizer.embed(
+            torch.from_numpy(window), [[segment.start, segment.end]]
+        )
+        self._last_speaker = self.clustering.assign(embedding[0])
+        return self._last_speaker
+
+    def latency_stats(self) -> dict:
+        """Seconds from receiving the newest audio of a pass to its results."""
+        if not self.latencies:
+            return {}
+        latencies = np.array(self.latencies)
+        return {
+            "p50": round(float(np.percentile(latencies, 50)), 3),
+            "p95": round(float(np.percentile(latencies, 95)), 3),
+            "max": round(float(latencies.max()), 3),
+        }
+
+
+def decode_pcm(data: bytes, encoding: str) -> np.ndarray:
+    """Samples of a PCM frame, "pcm_s16le" or "pcm_f32le"."""
+    if encoding == "pcm_s16le":
+        return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+    if encoding == "pcm_f32le":
+        return np.frombuffer(data, dtype="<f4").astype(np.float32)
+    raise ValueError(f"Unsupported encoding: {encoding}")
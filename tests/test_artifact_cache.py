@@ -0,0 +1,80 @@
+import io
+import os
+
+import numpy as np
+
+from artifact_cache import ArtifactCache, artifact_key, file_sha256
+
+
+def test_artifact_key_depends_on_every_part():
+    assert artifact_key("audio", "tiny.en", 8) == artifact_key("audio", "tiny.en", 8)
+    assert artifact_key("audio", "tiny.en", 8) != artifact_key("audio", "tiny.en", 16)
+    assert artifact_key("a", "b") != artifact_key("b", "a")
+    assert artifact_key({"x": 1, "y": 2}) == artifact_key({"y": 2, "x": 1})
+
+
+def test_file_sha256(tmp_path):
+    path = tmp_path / "audio.wav"
+    path.write_bytes(b"abc")
+    assert file_sha256(str(path)) == (
+        "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
+    )
+
+
+def test_stores_arrays_and_objects(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=2**20)
+    cache.put("vocals", "k", np.arange(10, dtype=np.float32))
+    cache.put("transcript", "k", [{"text": "hello"}])
+    np.testing.assert_array_equal(cache.get("vocals", "k"), np.arange(10))
+    assert cache.get("transcript", "k") == [{"text": "hello"}]
+    assert cache.get("transcript", "other") is None
+    assert cache.counters() == {"hits": 2, "misses": 1, "evictions": 0}
+
+
+def test_evicts_least_recently_used(tmp_path):
+    buffer = io.BytesIO()
+    np.save(buffer, np.zeros(1000))
+    entry_bytes = buffer.tell()
+
+    cache = ArtifactCache(str(tmp_path), max_bytes=int(entry_bytes * 2.5))
+    cache.put("a", "k", np.zeros(1000))
+    cache.put("b", "k", np.zeros(1000))
+    assert cache.get("a", "k") is not None
+    cache.put("c", "k", np.zeros(1000))
+    assert cache.get("b", "k") is None
+    assert cache.get("a", "k") is not None
+    assert cache.get("c", "k") is not None
+    assert cache.counters()["evictions"] == 1
+
+
+def test_skips_artifacts_over_the_limit(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=100)
+    cache.put("vocals", "k", np.zeros(1000))
+    assert cache.get("vocals", "k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_index_survives_restarts(tmp_path):
+    ArtifactCache(str(tmp_path), 2**20).put("speakers", "k", [(0, 100, 1)])
+    cache = ArtifactCache(str(tmp_path), 2**20)
+    assert cache.stats()["entries"] == 1
+    assert cache.get("speakers", "k") == [(0, 100, 1)]
+
+
+def test_shared_directory(tmp_path):
+    first = ArtifactCache(str(tmp_path), max_bytes=50_000, shared=True)
+    second = ArtifactCache(str(tmp_path), max_bytes=50_000, shared=True)
+    first.put("vocals", "k", np.zeros(100))
+    assert second.get("vocals", "k") is not None
+    assert first.counters()["hits"] == 0
+    assert second.counters()["hits"] == 1
+
+    for i in range(20):
+        (first, second)[i % 2].put("transcript", str(i), np.zeros(1000))
+    files = [name for name in os.listdir(tmp_path) if name.endswith((".npy", ".pkl"))]
+    total_bytes = sum(os.path.getsize(tmp_path / name) for name in files)
+    assert total_bytes <= 50_000
+    for cache in (first, second):
+        stats = cache.stats()
+        assert stats["entries"] == len(files)
+        assert stats["size_mb"] == round(total_bytes / 2**20, 1)
@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+import pytest
+
+diarize_core = pytest.importorskip("diarize_core")
+
+
+def job_keys(stemmed=None, **options):
+    job = SimpleNamespace(
+        audio_sha256="0" * 64,
+        stemming=True,
+        model_name="tiny.en",
+        language="en",
+        suppress_numerals=False,
+        batch_size=8,
+        alignment_mode="auto",
+    )
+    vars(job).update(options)
+    return diarize_core.DiarizationJob._build_artifact_keys(job, stemmed=stemmed)
+
+
+def test_keys_only_change_downstream_of_an_option():
+    keys = job_keys()
+    realigned = job_keys(alignment_mode="full")
+    for artifact in ("vocals", "transcript", "speakers"):
+        assert realigned[artifact] == keys[artifact]
+    for artifact in ("alignment", "punctuated"):
+        assert realigned[artifact] != keys[artifact]
+
+    retranscribed = job_keys(model_name="medium.en")
+    assert retranscribed["speakers"] == keys["speakers"]
+    assert retranscribed["transcript"] != keys["transcript"]
+    assert retranscribed["punctuated"] != keys["punctuated"]
+
+
+def test_keys_of_unstemmed_audio():
+    keys = job_keys()
+    fallback = job_keys(stemmed=False)
+    assert fallback == job_keys(stemming=False)
+    assert set(fallback.values()).isdisjoint(keys.values())
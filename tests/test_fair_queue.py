@@ -0,0 +1,122 @@
+import pytest
+
+from fair_queue import FairQueue, ThroughputEstimate
+
+
+def drain(queue):
+    job_ids = []
+    while (job_id := queue.get(timeout=0)) is not None:
+        job_ids.append(job_id)
+    return job_ids
+
+
+def test_clients_take_turns():
+    queue = FairQueue()
+    for i in range(3):
+        queue.put(f"a{i}", client="a")
+    queue.put("b0", client="b")
+    queue.put("b1", client="b")
+    assert drain(queue) == ["a0", "b0", "a1", "b1", "a2"]
+
+
+def test_weights_give_more_jobs_per_turn():
+    queue = FairQueue(weights={"a": 2})
+    for i in range(4):
+        queue.put(f"a{i}", client="a")
+    for i in range(2):
+        queue.put(f"b{i}", client="b")
+    assert drain(queue) == ["a0", "a1", "b0", "a2", "a3", "b1"]
+
+
+def test_priority_classes_go_first():
+    queue = FairQueue()
+    queue.put("low", priority="low")
+    queue.put("normal")
+    queue.put("high", priority="high")
+    assert drain(queue) == ["high", "normal", "low"]
+
+
+def test_unknown_priority():
+    with pytest.raises(ValueError):
+        FairQueue().put("a", priority="urgent")
+
+
+def test_shortest_first_puts_unknown_durations_last():
+    queue = FairQueue(shortest_first=True)
+    queue.put("long", duration_s=600)
+    queue.put("unknown")
+    queue.put("short", duration_s=30)
+    assert drain(queue) == ["short", "long", "unknown"]
+
+
+def test_duplicate_put_is_ignored():
+    queue = FairQueue()
+    queue.put("a")
+    queue.put("a")
+    assert len(queue) == 1
+
+
+def test_remove():
+    queue = FairQueue()
+    queue.put("a0", client="a")
+    queue.put("b0", client="b")
+    queue.put("b1", client="b")
+    assert queue.remove("a0")
+    assert not queue.remove("a0")
+    assert drain(queue) == ["b0", "b1"]
+
+
+def test_remove_head_client_resets_turn():
+    queue = FairQueue(weights={"a": 2, "b": 2})
+    queue.put("a0", client="a")
+    queue.put("a1", client="a")
+    queue.put("b0", client="b")
+    queue.put("b1", client="b")
+    queue.put("c0", client="c")
+    assert queue.get(timeout=0) == "a0"
+    queue.remove("a1")
+    assert drain(queue) == ["b0", "b1", "c0"]
+
+
+def test_dispatch_order_matches_get():
+    queue = FairQueue(weights={"a": 3})
+    for i in range(5):
+        queue.put(f"a{i}", client="a", duration_s=i)
+    for i in range(3):
+        queue.put(f"b{i}", client="b", priority="high")
+    queue.put("c0", client="c")
+    order = queue.dispatch_order()
+    expected = sorted(order.positions, key=order.positions.get)
+    assert queue.position("b0") == 0
+    assert queue.position("missing") == -1
+    assert drain(queue) == expected
+    assert order.durations[expected.index("a1")] == 1
+
+
+def test_dispatch_order_is_cached_until_the_queue_changes():
+    queue = FairQueue()
+    queue.put("a")
+    order = queue.dispatch_order()
+    assert queue.dispatch_order() is order
+    queue.put("b")
+    assert queue.dispatch_order() is not order
+
+
+def test_get_times_out():
+    assert FairQueue().get(timeout=0.01) is None
+
+
+def test_throughput_measures_completed_jobs_only(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("fair_queue.time.monotonic", lambda: now[0])
+    throughput = ThroughputEstimate(workers=1, default_duration_s=600)
+    throughput.started("failed", 100)
+    throughput.started("cancelled", 100)
+    throughput.started("completed", 100)
+    now[0] = 50.0
+    throughput.finished("failed", "failed")
+    throughput.finished("cancelled", "cancelled")
+    assert throughput.rtf is None
+    throughput.finished("completed")
+    assert throughput.rtf == pytest.approx(0.5)
+    assert throughput.runtime_s(None) == pytest.approx(300)
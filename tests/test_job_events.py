@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+from job_events import JobEventLog, format_sse
+
+
+async def collect(log, start=0):
+    return [item async for item in log.follow(start)]
+
+
+def test_replays_events_from_an_index():
+    log = JobEventLog()
+    log.publish("progress", {"stage": "transcribing"})
+    log.publish("segment", {"text": "hello"})
+    log.close()
+    assert asyncio.run(collect(log)) == [
+        (0, "progress", {"stage": "transcribing"}),
+        (1, "segment", {"text": "hello"}),
+    ]
+    assert asyncio.run(collect(log, start=1)) == [(1, "segment", {"text": "hello"})]
+
+
+def test_events_after_close_are_dropped():
+    log = JobEventLog()
+    log.close()
+    log.publish("segment", {"text": "late"})
+    assert log.closed
+    assert len(log) == 0
+    assert asyncio.run(collect(log)) == []
+
+
+def test_followers_get_events_published_from_other_threads():
+    log = JobEventLog()
+
+    def publish():
+        for i in range(3):
+            log.publish("segment", {"index": i})
+        log.close()
+
+    async def follow():
+        follower = asyncio.ensure_future(collect(log))
+        # let the follower reach its wait before anything is published
+        await asyncio.sleep(0.01)
+        threading.Thread(target=publish).start()
+        return await asyncio.wait_for(follower, timeout=5)
+
+    events = asyncio.run(follow())
+    assert [index for index, _, _ in events] == [0, 1, 2]
+    assert [data for _, _, data in events] == [{"index": i} for i in range(3)]
+
+
+def test_several_followers_see_every_event():
+    log = JobEventLog()
+
+    async def follow():
+        followers = [asyncio.ensure_future(collect(log)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        log.publish("progress", {"stage": "aligning"})
+        log.close()
+        return await asyncio.wait_for(asyncio.gather(*followers), timeout=5)
+
+    for events in asyncio.run(follow()):
+        assert events == [(0, "progress", {"stage": "aligning"})]
+
+
+def test_format_sse():
+    assert format_sse(3, "segment", {"text": "hi"}) == (
+        'id: 3\nevent: segment\ndata: {"text": "hi"}\n\n'
+    )
@@ -0,0 +1,143 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from job_store import InMemoryJobStore, Job, JobStatus, SQLiteJobStore, create_job_store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = create_job_store(request.param, str(tmp_path / "jobs.db"))
+    yield store
+    store.close()
+
+
+def make_job(job_id, status=JobStatus.QUEUED, **fields):
+    fields.setdefault("options", {})
+    return Job(id=job_id, status=status, audio_path=f"{job_id}.wav", **fields)
+
+
+def test_add_and_get(store):
+    store.add(make_job("a", options={"language": "en"}, priority="high", duration_s=12.5))
+    job = store.get("a")
+    assert job.status == JobStatus.QUEUED
+    assert job.options == {"language": "en"}
+    assert job.priority == "high"
+    assert job.duration_s == 12.5
+    assert store.get("missing") is None
+
+
+def test_get_returns_snapshots(store):
+    store.add(make_job("a"))
+    store.get("a").progress = "transcribing"
+    assert store.get("a").progress is None
+
+
+def test_result_is_left_out_on_request(store):
+    store.add(make_job("a"))
+    store.update("a", status=JobStatus.COMPLETED, result={"text": "hello"})
+    assert store.get("a").result == {"text": "hello"}
+    job = store.get("a", include_result=False)
+    assert job.result is None
+    assert job.status == JobStatus.COMPLETED
+
+
+def test_update_checks_expected_status(store):
+    store.add(make_job("a"))
+    assert not store.update("a", expected=[JobStatus.PROCESSING], progress="aligning")
+    assert store.update("a", expected=[JobStatus.QUEUED], status=JobStatus.PROCESSING)
+    assert store.update("a", progress="aligning")
+    assert store.get("a").progress == "aligning"
+    assert not store.update("missing", progress="aligning")
+
+
+def test_delete(store):
+    store.add(make_job("a", status=JobStatus.PROCESSING))
+    assert store.delete("a", expected=[JobStatus.QUEUED]) is None
+    assert store.delete("a").id == "a"
+    assert store.get("a") is None
+    assert store.delete("a") is None
+
+
+def test_count_by_status(store):
+    for i in range(3):
+        store.add(make_job(f"q{i}"))
+    store.add(make_job("p", status=JobStatus.PROCESSING))
+    store.update("q0", status=JobStatus.COMPLETED)
+    store.update("q1", status=JobStatus.FAILED)
+    store.update("q1", status=JobStatus.FAILED)
+    store.delete("q2")
+    assert store.count_by_status() == {
+        JobStatus.QUEUED: 0,
+        JobStatus.PROCESSING: 1,
+        JobStatus.COMPLETED: 1,
+        JobStatus.FAILED: 1,
+    }
+
+
+def test_pop_expired_only_takes_old_finished_jobs(store):
+    old = datetime.now() - timedelta(hours=2)
+    store.add(make_job("done", status=JobStatus.COMPLETED, created_at=old))
+    store.add(make_job("failed", status=JobStatus.FAILED, created_at=old))
+    store.add(make_job("running", status=JobStatus.PROCESSING, created_at=old))
+    store.add(make_job("recent", status=JobStatus.COMPLETED))
+    store.add(make_job("requeued", status=JobStatus.COMPLETED, created_at=old))
+    store.update("requeued", status=JobStatus.QUEUED)
+
+    expired = store.pop_expired(datetime.now() - timedelta(hours=1))
+    assert sorted(job.id for job in expired) == ["done", "failed"]
+    assert store.get("done") is None
+    assert store.get("running") is not None
+    assert store.get("recent") is not None
+    assert store.get("requeued") is not None
+    assert store.count_by_status()[JobStatus.COMPLETED] == 1
+
+
+def test_create_job_store_rejects_unknown_backends():
+    assert isinstance(create_job_store("memory"), InMemoryJobStore)
+    with pytest.raises(ValueError):
+        create_job_store("sqlite")
+    with pytest.raises(ValueError):
+        create_job_store("redis")
+
+
+def test_sqlite_recover_queues_processing_jobs_in_order(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    store = SQLiteJobStore(path)
+    store.add(make_job("a", status=JobStatus.PROCESSING))
+    store.update("a", progress="aligning")
+    store.add(make_job("b"))
+    store.add(make_job("c", status=JobStatus.COMPLETED))
+    store.close()
+
+    store = SQLiteJobStore(path)
+    assert store.recover() == ["a", "b"]
+    job = store.get("a")
+    assert job.status == JobStatus.QUEUED
+    assert job.progress is None
+    assert store.count_by_status()[JobStatus.QUEUED] == 2
+    store.close()
+
+
+def test_sqlite_counts_are_backfilled_for_old_databases(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    store = SQLiteJobStore(path)
+    store.add(make_job("a"))
+    store.add(make_job("b", status=JobStatus.FAILED))
+    store.close()
+    # a database written before the counts were kept
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        "DROP TRIGGER jobs_count_insert; DROP TRIGGER jobs_count_delete;"
+        "DROP TRIGGER jobs_count_update; DROP TABLE job_counts;"
+    )
+    conn.close()
+
+    store = SQLiteJobStore(path)
+    counts = store.count_by_status()
+    assert counts[JobStatus.QUEUED] == 1
+    assert counts[JobStatus.FAILED] == 1
+    store.add(make_job("c"))
+    assert store.count_by_status()[JobStatus.QUEUED] == 2
+    store.close()
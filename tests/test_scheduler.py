@@ -0,0 +1,117 @@
+import threading
+
+from scheduler import JobScheduler, MemoryProbe, estimate_stage_memory, peak_memory
+
+
+class FakeMemoryProbe(MemoryProbe):
+    """Reports whatever free and total memory the test sets."""
+
+    def __init__(self, available_mb=None, total_mb=None):
+        self.available = dict(available_mb or {})
+        self.total = dict(total_mb or {})
+
+    def available_mb(self, device):
+        return self.available.get(device)
+
+    def total_mb(self, device):
+        return self.total.get(device)
+
+
+def stages(**peaks):
+    """Stage estimates on the cpu, in pipeline order."""
+    return {stage: {"cpu": mb} for stage, mb in peaks.items()}
+
+
+def make_scheduler(probe, **kwargs):
+    kwargs.setdefault("max_concurrent", 4)
+    kwargs.setdefault("headroom_mb", 0)
+    return JobScheduler(probe=probe, poll_interval=0.01, **kwargs)
+
+
+def test_first_job_runs_even_over_budget():
+    scheduler = make_scheduler(FakeMemoryProbe(), budgets_mb={"cpu": 100})
+    assert scheduler.try_admit("a", stages(transcribing=500))
+    assert not scheduler.try_admit("b", stages(transcribing=10))
+
+
+def test_budget_defaults_to_fraction_of_total():
+    probe = FakeMemoryProbe(total_mb={"cpu": 1000})
+    scheduler = make_scheduler(probe, budget_fraction=0.5)
+    assert scheduler.try_admit("a", stages(transcribing=300))
+    assert not scheduler.try_admit("b", stages(transcribing=300))
+    assert scheduler.try_admit("c", stages(transcribing=200))
+    assert scheduler.stats()["budget_mb"] == {"cpu": 500.0}
+
+
+def test_free_memory_and_headroom_limit_admission():
+    probe = FakeMemoryProbe(available_mb={"cpu": 1000})
+    scheduler = make_scheduler(probe, headroom_mb=200)
+    assert scheduler.try_admit("a", stages(transcribing=100))
+    assert not scheduler.try_admit("b", stages(transcribing=900))
+    probe.available["cpu"] = 2000
+    assert scheduler.try_admit("b", stages(transcribing=900))
+
+
+def test_max_concurrent():
+    scheduler = make_scheduler(FakeMemoryProbe(), max_concurrent=2)
+    assert scheduler.try_admit("a", stages(transcribing=1))
+    assert scheduler.try_admit("b", stages(transcribing=1))
+    assert not scheduler.try_admit("c", stages(transcribing=1))
+    scheduler.release("a")
+    assert scheduler.try_admit("c", stages(transcribing=1))
+    assert scheduler.running == 2
+
+
+def test_advance_shrinks_reservation():
+    scheduler = make_scheduler(FakeMemoryProbe(), budgets_mb={"cpu": 1000})
+    assert scheduler.try_admit("a", stages(transcribing=800, aligning=300))
+    assert not scheduler.try_admit("b", stages(transcribing=600))
+    scheduler.advance("a", "aligning")
+    assert scheduler.stats()["reserved_mb"] == {"cpu": 300.0}
+    assert scheduler.try_admit("b", stages(transcribing=600))
+
+
+def test_admit_waits_for_release():
+    scheduler = make_scheduler(FakeMemoryProbe(), budgets_mb={"cpu": 1000})
+    scheduler.try_admit("a", stages(transcribing=800))
+    admitted = threading.Event()
+
+    def admit():
+        scheduler.admit("b", stages(transcribing=800))
+        admitted.set()
+
+    threading.Thread(target=admit, daemon=True).start()
+    assert not admitted.wait(0.1)
+    scheduler.release("a")
+    assert admitted.wait(5)
+
+
+def test_admit_times_out():
+    scheduler = make_scheduler(FakeMemoryProbe(), budgets_mb={"cpu": 1000})
+    scheduler.try_admit("a", stages(transcribing=800))
+    assert not scheduler.admit("b", stages(transcribing=800), timeout=0.05)
+    assert scheduler.running == 1
+
+
+def test_estimates_skip_separation_without_stemming():
+    estimates = estimate_stage_memory({"stemming": False}, "cpu", duration_s=60)
+    assert "separating_vocals" not in estimates
+    with_stemming = estimate_stage_memory({}, "cpu", duration_s=60)
+    assert "separating_vocals" in with_stemming
+
+
+def test_resident_models_are_not_counted():
+    cold = estimate_stage_memory({}, "cpu", duration_s=60)
+    warm = estimate_stage_memory({}, "cpu", duration_s=60, resident_stages={"aligning"})
+    assert warm["aligning"]["cpu"] < cold["aligning"]["cpu"]
+    assert warm["diarizing"] == cold["diarizing"]
+
+
+def test_peak_memory_from_stage():
+    estimates = {
+        "transcribing": {"cuda": 500, "cpu": 10},
+        "aligning": {"cuda": 300, "cpu": 20},
+    }
+    assert peak_memory(estimates) == {"cuda": 500, "cpu": 20}
+    assert peak_memory(estimates, from_stage="aligning") == {"cuda": 300, "cpu": 20}
+    assert peak_memory(estimates, from_stage="generating_output") == {}
@@ -0,0 +1,174 @@
+"""
+Streaming multipart uploads.
+Starlette parses a multipart body into a spooled temporary file before the
+handler runs, so every upload was written to disk twice and a size cap only
+applied once the whole body had arrived. Here the body is parsed as it
+arrives: the file goes straight to its destination, hashed on the way, and
+the cap is checked on every chunk.
+"""
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    import multipart
+    from multipart.multipart import parse_options_header
+
+# Largest form field other than the file
+MAX_FIELD_BYTES = 64 * 1024
+# Bytes of the file collected before each write to disk
+WRITE_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class MalformedUpload(ValueError):
+    pass
+
+
+@dataclass
+class StreamedUpload:
+    """Form fields of an upload and the file written to disk."""
+
+    fields: dict[str, str]
+    filename: str | None
+    size: int
+    sha256: str
+
+
+class _FormParser:
+    """Collects the form fields and the file data of a multipart body."""
+
+    def __init__(self, boundary: bytes, file_field: str):
+        self.file_field = file_field
+        self.fields: dict[str, str] = {}
+        self.filename: str | None = None
+        self.has_file = False
+        self.file_data: list[bytes] = []  # file bytes not written yet
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._name = ""
+        self._in_file = False
+        self._value = bytearray()
+        self.parser = multipart.MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._part_begin,
+                "on_header_field": self._header_field_data,
+                "on_header_value": self._header_value_data,
+                "on_header_end": self._header_end,
+                "on_headers_finished": self._headers_finished,
+                "on_part_data": self._part_data,
+                "on_part_end": self._part_end,
+            },
+        )
+
+    def _part_begin(self):
+        self._headers.clear()
+        self._value.clear()
+
+    def _header_field_data(self, data: bytes, start: int, end: int):
+        self._header_field.extend(data[start:end])
+
+    def _header_value_data(self, data: bytes, start: int, end: int):
+        self._header_value.extend(data[start:end])
+
+    def _header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("latin-1")
+        filename = options.get(b"filename")
+        self._in_file = self._name == self.file_field and filename is not None
+        if self._in_file:
+            if self.has_file:
+                raise MalformedUpload(f"More than one {self.file_field} field")
+            self.has_file = True
+            self.filename = filename.decode("utf-8", errors="replace")
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self.file_data.append(data[start:end])
+            return
+        self._value.extend(data[start:end])
+        if len(self._value) > MAX_FIELD_BYTES:
+            raise MalformedUpload(f"Form field {self._name} is too large")
+
+    def _part_end(self):
+        if not self._in_file:
+            self.fields[self._name] = self._value.decode("utf-8", errors="replace")
+
+
+async def receive_upload(
+    stream: AsyncIterator[bytes],
+    content_type: str,
+    path: str,
+    file_field: str = "file",
+    max_bytes: int | None = None,
+) -> StreamedUpload:
+    """
+    Write the file of a multipart/form-data body to `path` as it arrives,
+    without blocking the event loop.
+
+    Args:
+        stream: Chunks of the request body, e.g. Request.stream()
+        content_type: Content-Type header of the request
+        path: Where the file is written, removed again on any error
+        file_field: Name of the form field holding the file
+        max_bytes: Largest accepted file, None for no limit
+
+    Raises:
+        UploadTooLarge: The file grew past `max_bytes`
+        MalformedUpload: The body isn't a form with the file field
+    """
+    mime_type, params = parse_options_header(content_type)
+    if mime_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise MalformedUpload("Expected a multipart/form-data body")
+    form = _FormParser(params[b"boundary"], file_field)
+
+    digest = hashlib.sha256()
+    size = 0
+    buffered: list[bytes] = []
+    buffered_size = 0
+    out = await run_in_threadpool(open, path, "wb")
+    try:
+        async for chunk in stream:
+            try:
+                form.parser.write(chunk)
+            except multipart.exceptions.MultipartParseError as e:
+                raise MalformedUpload(f"Malformed multipart body: {e}") from None
+            for data in form.file_data:
+                size += len(data)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLarge
+                digest.update(data)
+                buffered.append(data)
+                buffered_size += len(data)
+            form.file_data.clear()
+            if buffered_size >= WRITE_CHUNK_SIZE:
+                await run_in_threadpool(out.write, b"".join(buffered))
+                buffered, buffered_size = [], 0
+        form.parser.finalize()
+        if not form.has_file:
+            raise MalformedUpload(f"Missing the {file_field} field")
+        if buffered:
+            await run_in_threadpool(out.write, b"".join(buffered))
+    except BaseException:
+        await run_in_threadpool(out.close)
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    await run_in_threadpool(out.close)
+    return StreamedUpload(form.fields, form.filename, size, digest.hexdigest())
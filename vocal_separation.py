@@ -0,0 +1,71 @@
+"""
+In-process vocal separation with Demucs.
+Keeps the htdemucs model loaded and separates the already decoded waveform,
+instead of spawning `python -m demucs.separate` and reading the stem back
+from disk.
+"""
+from typing import Union
+
+import numpy as np
+import torch
+
+from demucs.apply import apply_model
+from demucs.audio import convert_audio
+from demucs.pretrained import get_model
+
+SAMPLING_RATE = 16000
+DEMUCS_MODEL_NAME = "htdemucs"
+
+
+class VocalSeparator:
+    def __init__(
+        self, device: Union[str, torch.device], model_name: str = DEMUCS_MODEL_NAME
+    ):
+        self.device = device
+        self.model = get_model(model_name)
+        self.model.to(device)
+        self.model.eval()
+
+    @torch.inference_mode()
+    def separate(
+        self,
+        audio: Union[np.ndarray, torch.Tensor],
+        sample_rate: int = SAMPLING_RATE,
+    ) -> torch.Tensor:
+        """
+        Extract the vocals from a waveform.
+
+        Args:
+            audio: Mono waveform (samples,) or multi-channel (channels, samples)
+            sample_rate: Sample rate of `audio`, the vocals are returned at
+                the same rate
+
+        Returns:
+            Mono float32 vocals tensor on the CPU
+        """
+        wav = torch.as_tensor(audio, dtype=torch.float32)
+        if wav.dim() == 1:
+            wav = wav.unsqueeze(0)
+        wav = convert_audio(
+            wav, sample_rate, self.model.samplerate, self.model.audio_channels
+        )
+
+        # same normalisation as demucs.separate
+        ref = wav.mean(0)
+        mean = ref.mean()
+        std = ref.std() + 1e-8
+        sources = apply_model(
+            self.model,
+            ((wav - mean) / std)[None],
+            shifts=1,
+            split=True,
+            overlap=0.25,
+            device=self.device,
+        )[0]
+        sources = sources * std + mean
+
+        vocals = sources[self.model.sources.index("vocals")].cpu()
+        vocals = convert_audio(vocals, self.model.samplerate, sample_rate, 1)[0]
+
+        # rescale like demucs' default clip mode instead of clipping
+        return vocals / max(1.01 * vocals.abs().max().item(), 1.0)
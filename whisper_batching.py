@@ -0,0 +1,215 @@
+"""
+Batching of Whisper chunks across jobs.
+BatchedInferencePipeline batches the VAD chunks of one file, so short clips
+never fill a batch. Here the forward passes of concurrently transcribed
+jobs that use the same model, language and decoding options are merged
+into one encoder and decoder call, and the segments are routed back.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any
+
+import faster_whisper
+import numpy as np
+
+from batch_planner import is_out_of_memory
+
+# Chunks decoded together at most
+MAX_BATCH_SIZE = 16
+# Longest a forward pass waits for chunks of other jobs
+MAX_WAIT_SECONDS = 0.05
+# A job that is the only one seen for this long doesn't wait for others
+ACTIVE_SECONDS = 1.0
+
+
+@dataclass
+class _ForwardRequest:
+    features: np.ndarray
+    chunks_metadata: list[dict]
+    max_batch: int  # batch size the job asked for
+    future: Future = field(default_factory=Future)
+
+
+class WhisperBatcher:
+    """
+    Merges forward passes of BatchedInferencePipelines that share a model.
+
+    The first request of a batch waits up to `max_wait` for others with the
+    same model, language and options, then runs them all in one call while
+    the rest wait for their share of the results. A job transcribing alone
+    doesn't wait. A merged batch is never larger than the batch size of any
+    job in it, so a job that backed off after running out of memory isn't
+    merged back up, and a merged batch that runs out of memory is retried
+    one job at a time.
+
+    Args:
+        max_batch_size: Chunks decoded together at most, a single larger
+            request still runs alone
+        max_wait: Seconds a request waits for others before running
+    """
+
+    def __init__(
+        self, max_batch_size: int = MAX_BATCH_SIZE, max_wait: float = MAX_WAIT_SECONDS
+    ):
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_wait = max_wait
+        self._pending: dict[tuple, deque[_ForwardRequest]] = {}
+        self._running: set[tuple] = set()
+        self._last_seen: dict[tuple, dict[int, float]] = {}  # key -> pipeline -> time
+        self._cond = threading.Condition()
+        self.batches = 0
+        self.requests = 0
+        self.chunks = 0
+
+    @staticmethod
+    def _key(pipeline, tokenizer, options) -> tuple:
+        # options hold lists and aren't hashable, their repr covers every field
+        return (
+            id(pipeline.model),
+            tokenizer.language_code,
+            tokenizer.task,
+            repr(options),
+        )
+
+    def _pending_chunks(self, key: tuple) -> int:
+        return sum(len(r.chunks_metadata) for r in self._pending.get(key, ()))
+
+    def _batch_limit(self, key: tuple) -> int:
+        """Largest batch the pending requests of the key may be merged into."""
+        return min(
+            [self.max_batch_size, *(r.max_batch for r in self._pending.get(key, ()))]
+        )
+
+    def _take_batch(self, key: tuple) -> list[_ForwardRequest]:
+        """Oldest requests of the key that fit in one batch, at least one."""
+        queue = self._pending[key]
+        batch = [queue.popleft()]
+        size = len(batch[0].chunks_metadata)
+        limit = min(self.max_batch_size, batch[0].max_batch)
+        while queue:
+            # every job's own batch size caps the merged batch
+            next_limit = min(limit, queue[0].max_batch)
+            if size + len(queue[0].chunks_metadata) > next_limit:
+                break
+            limit = next_limit
+            size += len(queue[0].chunks_metadata)
+            batch.append(queue.popleft())
+        if not queue:
+            del self._pending[key]
+        return batch
+
+    def forward(self, pipeline, features, tokenizer, chunks_metadata, options) -> list:
+        """Drop-in for BatchedInferencePipeline.forward."""
+        chunks_metadata = list(chunks_metadata)
+        request = _ForwardRequest(
+            np.asarray(features),
+            chunks_metadata,
+            getattr(pipeline, "batch_size", None) or len(chunks_metadata),
+        )
+        key = self._key(pipeline, tokenizer, options)
+        now = time.monotonic()
+
+        with self._cond:
+            last_seen = self._last_seen.setdefault(key, {})
+            last_seen[id(pipeline)] = now
+            for other, seen_at in list(last_seen.items()):
+                if now - seen_at > ACTIVE_SECONDS:
+                    del last_seen[other]
+            # only wait when other jobs are transcribing with the same key
+            deadline = now + self.max_wait if len(last_seen) > 1 else now
+            self._pending.setdefault(key, deque()).append(request)
+            self._cond.notify_all()
+
+        while True:
+            with self._cond:
+                batch = None
+                while not request.future.done():
+                    remaining = deadline - time.monotonic()
+                    if key not in self._running and key in self._pending and (
+                        remaining <= 0
+                        or self._pending_chunks(key) >= self._batch_limit(key)
+                    ):
+                        batch = self._take_batch(key)
+                        self._running.add(key)
+                        break
+                    self._cond.wait(remaining if remaining > 0 else None)
+            if batch is None:
+                return request.future.result()
+            self._run(pipeline, key, batch, tokenizer, options)
+
+    @staticmethod
+    def _forward(pipeline, batch, tokenizer, options) -> list:
+        return faster_whisper.BatchedInferencePipeline.forward(
+            pipeline,
+            np.concatenate([r.features for r in batch]),
+            tokenizer,
+            [m for r in batch for m in r.chunks_metadata],
+            options,
+        )
+
+    def _run(self, pipeline, key, batch, tokenizer, options):
+        try:
+            try:
+                outputs = self._forward(pipeline, batch, tokenizer, options)
+            except BaseException as e:
+                if len(batch) == 1 or not is_out_of_memory(e):
+                    for r in batch:
+                        r.future.set_exception(e)
+                    return
+                # one job at a time, so each job's own backoff handles its
+                # out of memory error instead of failing the whole batch
+                for r in batch:
+                    try:
+                        r.future.set_result(
+                            self._forward(pipeline, [r], tokenizer, options)
+                        )
+                    except BaseException as e:
+                        r.future.set_exception(e)
+                return
+
+            offset = 0
+            for r in batch:
+                count = len(r.chunks_metadata)
+                r.future.set_result(outputs[offset : offset + count])
+                offset += count
+        finally:
+            with self._cond:
+                self._running.discard(key)
+                self.batches += 1
+                self.requests += len(batch)
+                self.chunks += sum(len(r.chunks_metadata) for r in batch)
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """Batching statistics for health reporting."""
+        with self._cond:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000),
+                "batches": self.batches,
+                "requests": self.requests,
+                "mean_batch_chunks": (
+                    round(self.chunks / self.batches, 2) if self.batches else None
+                ),
+            }
+
+
+class CrossJobPipeline(faster_whisper.BatchedInferencePipeline):
+    """BatchedInferencePipeline whose forward passes go through a WhisperBatcher."""
+
+    def __init__(self, model: Any, batcher: WhisperBatcher):
+        super().__init__(model)
+        self.batcher = batcher
+        self.batch_size: int | None = None
+
+    def transcribe(self, *args, batch_size: int = 8, **kwargs):
+        # forward passes run while the returned generator is consumed, the
+        # batcher caps merged batches at the size this job asked for
+        self.batch_size = batch_size
+        return super().transcribe(*args, batch_size=batch_size, **kwargs)
+
+    def forward(self, features, tokenizer, chunks_metadata, options):
+        return self.batcher.forward(self, features, tokenizer, chunks_metadata, options)
@@ -0,0 +1,448 @@
+"""
+Crash-isolated execution of jobs in long-lived child processes.
+Each child keeps its own model pool warm between jobs. A native crash or a
+leak in NeMo, CTranslate2 or torch only takes down the child, which is
+replaced, while progress, partial results and results stream back to the
+API process over a queue.
+"""
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from instrumentation import StageTiming, TimingCallback
+
+# Called with the result, or the exception that stopped the job
+DoneCallback = Callable[[dict | None, BaseException | None], None]
+
+
+class WorkerCrashed(RuntimeError):
+    """The child process running a job exited before finishing it."""
+
+
+class _CancelListener:
+    """
+    Reads a child's request queue on a thread, so cancellations reach the
+    job that is running while new jobs are handed to the main thread.
+    """
+
+    def __init__(self, requests: mp.Queue):
+        self.jobs: queue.Queue = queue.Queue()
+        self._cancelled: set[str] = set()
+        self._current: tuple[str, threading.Event] | None = None
+        self._lock = threading.Lock()
+        threading.Thread(target=self._listen, args=(requests,), daemon=True).start()
+
+    def _listen(self, requests: mp.Queue):
+        while True:
+            request = requests.get()
+            if request is None or request[0] == "run":
+                self.jobs.put(request)
+                if request is None:
+                    return
+                continue
+            _, job_id = request
+            with self._lock:
+                if self._current is not None and self._current[0] == job_id:
+                    self._current[1].set()
+                else:
+                    self._cancelled.add(job_id)
+
+    def start(self, job_id: str) -> threading.Event:
+        """Cancel event of the job about to run."""
+        event = threading.Event()
+        with self._lock:
+            if job_id in self._cancelled:
+                self._cancelled.discard(job_id)
+                event.set()
+            self._current = (job_id, event)
+        return event
+
+    def finish(self):
+        with self._lock:
+            self._current = None
+            self._cancelled.clear()
+
+
+@dataclass(frozen=True)
+class WorkerSettings:
+    """
+    Resources a child process creates for itself.
+
+    Args:
+        model_pool_max_models: Models kept loaded per child, None for no limit
+        model_pool_memory_budget_mb: Model pool budget per child, None for no limit
+        artifact_cache_dir: Stage output cache shared by all children, None disables it
+        artifact_cache_max_bytes: Size limit of the stage output cache
+    """
+
+    model_pool_max_models: int | None = None
+    model_pool_memory_budget_mb: float | None = None
+    artifact_cache_dir: str | None = None
+    artifact_cache_max_bytes: int = 0
+
+
+def _worker_main(settings: WorkerSettings, requests: mp.Queue, events: mp.Queue):
+    """Entry point of a child process, runs one job at a time."""
+    from artifact_cache import ArtifactCache
+    from diarize_core import JobCancelled, run_diarization
+    from model_pool import ModelPool
+    from scheduler import SystemMemoryProbe
+
+    model_pool = ModelPool(
+        max_models=settings.model_pool_max_models,
+        memory_budget_mb=settings.model_pool_memory_budget_mb,
+    )
+    artifact_cache = (
+        ArtifactCache(
+            settings.artifact_cache_dir, settings.artifact_cache_max_bytes, shared=True
+        )
+        if settings.artifact_cache_dir
+        else None
+    )
+    probe = SystemMemoryProbe()
+    parent_pid = os.getppid()
+    listener = _CancelListener(requests)
+    reported: dict[str, int] = {}
+
+    def new_cache_counters() -> dict[str, int]:
+        """Artifact cache counters since the previous job."""
+        if artifact_cache is None:
+            return {}
+        counters = artifact_cache.counters()
+        new = {name: value - reported.get(name, 0) for name, value in counters.items()}
+        reported.update(counters)
+        return new
+
+    while True:
+        try:
+            request = listener.jobs.get(timeout=1.0)
+        except queue.Empty:
+            # don't outlive an API process that was killed
+            if os.getppid() != parent_pid:
+                break
+            continue
+        if request is None:
+            break
+        _, job_id, kwargs = request
+
+        error = None
+        try:
+            result = run_diarization(
+                progress_callback=lambda stage: events.put(("progress", stage)),
+                event_callback=lambda event, data: events.put(("event", event, data)),
+                timing_callback=lambda timing: events.put(("timing", timing.to_dict())),
+                model_pool=model_pool,
+                artifact_cache=artifact_cache,
+                cancel_event=listener.start(job_id),
+                **kwargs,
+            )
+        except JobCancelled as e:
+            result, error = None, str(e)
+        except Exception as e:
+            logging.exception("Job failed in worker process")
+            result, error = None, f"{type(e).__name__}: {e}"
+        events.put(("done", result, error, probe.rss_mb(), new_cache_counters()))
+        listener.finish()
+
+
+@dataclass
+class _Task:
+    job_id: str
+    kwargs: dict
+    progress_callback: Callable[[str], None]
+    event_callback: Callable[[str, dict], None]
+    done_callback: DoneCallback
+    timing_callback: TimingCallback | None = None
+
+
+class _Slot:
+    """One child process and the job it is running."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: mp.Process | None = None
+        self.requests: mp.Queue | None = None
+        self.task: _Task | None = None
+        self.cancelled = False  # the running task was cancelled
+        self.retiring = False
+        self.jobs = 0  # finished by the current process
+        self.started_at = 0.0
+        self.rss_mb: float | None = None
+
+    @property
+    def idle(self) -> bool:
+        return (
+            self.process is not None
+            and self.process.is_alive()
+            and self.task is None
+            and not self.retiring
+        )
+
+
+class WorkerPool:
+    """
+    Runs jobs in a fixed number of child processes, one job per child.
+
+    A child is replaced after `max_jobs` jobs or once its resident memory
+    after a job exceeds `max_rss_mb`, which bounds slow leaks. If a child
+    dies while running a job, the job's done callback gets a WorkerCrashed
+    error and a new child takes the slot.
+
+    Args:
+        num_workers: Number of child processes
+        settings: Resources each child creates
+        max_jobs: Jobs a child runs before it is replaced, 0 for no limit
+        max_rss_mb: Resident memory after which a child is replaced, 0 for no limit
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        settings: WorkerSettings,
+        max_jobs: int = 0,
+        max_rss_mb: float = 0,
+    ):
+        self.settings = settings
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self._ctx = mp.get_context("spawn")
+        self._slots = [_Slot(index) for index in range(max(num_workers, 1))]
+        self._cond = threading.Condition()
+        self._closed = False
+        self.completed = 0
+        self.failed = 0
+        self.crashes = 0
+        self.recycled = 0
+        self._artifact_cache_counters: dict[str, int] = {}
+
+    def start(self):
+        with self._cond:
+            for slot in self._slots:
+                self._spawn(slot)
+
+    def _spawn(self, slot: _Slot):
+        """Start a new child for the slot, called with the lock held."""
+        slot.requests = self._ctx.Queue()
+        events = self._ctx.Queue()
+        # not a daemon, so the child can start its own diarization process
+        slot.process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.settings, slot.requests, events),
+            name=f"job-worker-{slot.index}",
+        )
+        slot.process.start()
+        slot.task = None
+        slot.cancelled = False
+        slot.retiring = False
+        slot.jobs = 0
+        slot.rss_mb = None
+        slot.started_at = time.monotonic()
+        threading.Thread(
+            target=self._collect_events,
+            args=(slot, slot.process, events),
+            name=f"job-worker-{slot.index}-events",
+            daemon=True,
+        ).start()
+        self._cond.notify_all()
+
+    def submit(
+        self,
+        job_id: str,
+        kwargs: dict,
+        progress_callback: Callable[[str], None],
+        event_callback: Callable[[str, dict], None],
+        done_callback: DoneCallback,
+        timing_callback: TimingCallback | None = None,
+    ):
+        """
+        Run `run_diarization(**kwargs)` in the first idle child, blocking
+        until one is free. The callbacks are called from a pool thread.
+        """
+        task = _Task(
+            job_id, kwargs, progress_callback, event_callback, done_callback, timing_callback
+        )
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Worker pool closed")
+                slot = next((slot for slot in self._slots if slot.idle), None)
+                if slot is not None:
+                    break
+                self._cond.wait(1.0)
+            slot.task = task
+            slot.cancelled = False
+            slot.requests.put(("run", job_id, kwargs))
+
+    def cancel(self, job_id: str, grace_s: float | None = None) -> bool:
+        """
+        Ask the child running a job to stop it. A child that hasn't stopped
+        the job after `grace_s` seconds is terminated and replaced.
+        Returns False if no child is running the job.
+        """
+        with self._cond:
+            slot = next(
+                (s for s in self._slots if s.task and s.task.job_id == job_id), None
+            )
+            if slot is None:
+                return False
+            slot.cancelled = True
+            slot.requests.put(("cancel", job_id))
+            task, process = slot.task, slot.process
+
+        if grace_s is not None:
+
+            def terminate():
+                with self._cond:
+                    if slot.task is not task or slot.process is not process:
+                        return
+                logging.warning(
+                    "Terminating worker process %d, job %s didn't stop in time",
+                    slot.index,
+                    job_id,
+                )
+                process.terminate()
+
+            timer = threading.Timer(grace_s, terminate)
+            timer.daemon = True
+            timer.start()
+        return True
+
+    def _collect_events(self, slot: _Slot, process: mp.Process, events: mp.Queue):
+        while True:
+            try:
+                message = events.get(timeout=1.0)
+            except Exception:
+                # queue.Empty, or the queue broke because the child died
+                if not process.is_alive():
+                    self._on_exit(slot, process)
+                    return
+                continue
+
+            task = slot.task
+            if task is None:
+                continue
+            kind, *payload = message
+            try:
+                if kind == "progress":
+                    task.progress_callback(*payload)
+                elif kind == "event":
+                    task.event_callback(*payload)
+                elif kind == "timing" and task.timing_callback is not None:
+                    task.timing_callback(StageTiming(**payload[0]))
+            except Exception:
+                logging.exception("Worker callback failed for job %s", task.job_id)
+            if kind == "done":
+                self._on_done(slot, task, *payload)
+
+    def _on_done(
+        self,
+        slot: _Slot,
+        task: _Task,
+        result: dict | None,
+        error: str | None,
+        rss_mb,
+        cache_counters: dict[str, int],
+    ):
+        with self._cond:
+            for name, value in cache_counters.items():
+                self._artifact_cache_counters[name] = (
+                    self._artifact_cache_counters.get(name, 0) + value
+                )
+            slot.jobs += 1
+            slot.rss_mb = rss_mb
+            if error is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+            if (self.max_jobs and slot.jobs >= self.max_jobs) or (
+                self.max_rss_mb and rss_mb is not None and rss_mb > self.max_rss_mb
+            ):
+                logging.info(
+                    "Replacing worker process %d after %d jobs at %.0f MB",
+                    slot.index,
+                    slot.jobs,
+                    rss_mb or 0,
+                )
+                slot.retiring = True
+                self.recycled += 1
+                slot.requests.put(None)
+            slot.task = None
+            self._cond.notify_all()
+        self._finish(task, result, RuntimeError(error) if error is not None else None)
+
+    def _on_exit(self, slot: _Slot, process: mp.Process):
+        with self._cond:
+            if slot.process is not process:
+                return
+            task, slot.task = slot.task, None
+            cancelled = slot.cancelled
+            if task is not None and not cancelled:
+                self.crashes += 1
+                logging.error(
+                    "Worker process %d exited with code %s while running job %s",
+                    slot.index,
+                    process.exitcode,
+                    task.job_id,
+                )
+            if not self._closed:
+                self._spawn(slot)
+        if task is not None:
+            self._finish(
+                task,
+                None,
+                RuntimeError("Job cancelled")
+                if cancelled
+                else WorkerCrashed(f"Worker process exited with code {process.exitcode}"),
+            )
+
+    @staticmethod
+    def _finish(task: _Task, result: dict | None, error: BaseException | None):
+        try:
+            task.done_callback(result, error)
+        except Exception:
+            logging.exception("Job completion callback failed")
+
+    def stats(self) -> dict:
+        """Per-process state for health reporting."""
+        now = time.monotonic()
+        with self._cond:
+            return {
+                "workers": [
+                    {
+                        "pid": slot.process.pid if slot.process else None,
+                        "job_id": slot.task.job_id if slot.task else None,
+                        "jobs": slot.jobs,
+                        "rss_mb": round(slot.rss_mb, 1) if slot.rss_mb else None,
+                        "uptime_s": round(now - slot.started_at, 1),
+                    }
+                    for slot in self._slots
+                ],
+                "max_jobs": self.max_jobs or None,
+                "max_rss_mb": self.max_rss_mb or None,
+                "completed": self.completed,
+                "failed": self.failed,
+                "crashes": self.crashes,
+                "recycled": self.recycled,
+            }
+
+    def artifact_cache_counters(self) -> dict[str, int]:
+        """Artifact cache hits, misses and evictions of all children so far."""
+        with self._cond:
+            return dict(self._artifact_cache_counters)
+
+    def close(self):
+        """Stop the children after their current jobs."""
+        with self._cond:
+            self._closed = True
+            processes = [slot.process for slot in self._slots if slot.process]
+            for slot in self._slots:
+                if slot.requests is not None:
+                    slot.requests.put(None)
+            self._cond.notify_all()
+        for process in processes:
+            process.join()